@@ -0,0 +1,724 @@
+"""Benchmarks for PDFxTract extraction stages.
+
+Generates a synthetic control-valve datasheet corpus locally (no network, no extra
+dependencies), times each stage separately and writes the results as JSON so runs
+can be compared between versions.
+
+Run with:
+    python benchmark.py [--output benchmark_results.json] [--quick]
+"""
+import argparse
+import asyncio
+import glob
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+import pdf_extractor
+from pdf_extractor import FIELDS, extract_fields_from_text_optimized
+
+def reference_extract_fields_from_text(text: str) -> Dict[str, str]:
+    """Line x pattern scan used before the single-pass matcher (kept as a baseline)."""
+    data = {}
+    lines = text.splitlines()
+    field_patterns = {pattern: display_name for display_name, pattern in FIELDS}
+    separators = [r"\s{2,}", r"\t+", r"\s*\|\s*", r"\s*;\s*"]
+
+    def value_from_line(line, pattern, is_next_line=False):
+        for sep in separators:
+            columns = re.split(sep, line)
+            for j, col in enumerate(columns):
+                if pattern in col:
+                    if j + 1 < len(columns):
+                        value = columns[j + 1].strip()
+                        if value and value != pattern:
+                            return value
+                    if pattern != col:
+                        value = col.replace(pattern, "").strip()
+                        if value:
+                            return value
+        if is_next_line:
+            for sep in separators:
+                for col in re.split(sep, line):
+                    value = col.strip()
+                    if value and value != pattern:
+                        return value
+        return ""
+
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+        for pattern, display_name in field_patterns.items():
+            if display_name in data:
+                continue
+            if pattern in line:
+                value = value_from_line(line, pattern)
+                if not value and i + 1 < len(lines):
+                    value = value_from_line(lines[i + 1], pattern, is_next_line=True)
+                if value:
+                    data[display_name] = value
+    return data
+
+def make_datasheet_text(pages: int = 50, lines_per_page: int = 60, label_ratio: float = 0.02,
+                        seed: int = 0) -> str:
+    """Build a synthetic multi-page datasheet text layer.
+
+    Most lines are filler (notes, drawing callouts, certificate text); a small share carry
+    `FIELDS` labels, with the real datasheet block placed on the last page.
+    """
+    rng = random.Random(seed)
+    words = ["valve", "note", "see", "drawing", "rev", "certificate", "mm", "bar", "NDE",
+             "weld", "class", "item", "qty", "per", "ASME", "B16.34", "test", "hydro"]
+    separators = ["  ", "\t", " | ", "; ", " "]
+    text = ""
+    for page_num in range(1, pages + 1):
+        page_lines = []
+        for _ in range(lines_per_page):
+            if page_num == pages or rng.random() < label_ratio:
+                display_name, pattern = rng.choice(FIELDS)
+                page_lines.append(f"{rng.randint(1, 99)} {pattern}{rng.choice(separators)}{rng.randint(1, 999)}")
+            else:
+                page_lines.append(" ".join(rng.choice(words) for _ in range(rng.randint(3, 12))))
+        text += f"--- PAGE {page_num} ---\n" + "\n".join(page_lines) + "\n"
+    return text
+
+# --- Synthetic datasheet PDFs ---
+
+PDF_PAGE_SIZE = (612, 792)
+PDF_COLUMN_EDGES = [30, 60, 300, 360, 440, 520, 590]  # columns A-F: No., label, units, Max, Norm, Min
+PDF_ROW_HEIGHT = 14
+PDF_ROWS_PER_PAGE = 48
+PDF_TOP = 740
+PDF_FILLER_WORDS = ["valve", "note", "see", "drawing", "rev", "certificate", "mm", "bar", "NDE",
+                    "weld", "class", "item", "qty", "per", "ASME", "B16.34", "test", "hydro"]
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _pdf_text(x: float, y: float, text: str, size: int = 7) -> str:
+    return f"BT /F1 {size} Tf {x:.1f} {y:.1f} Td ({_pdf_escape(text)}) Tj ET"
+
+def build_pdf(page_streams: List[str]) -> bytes:
+    """Assemble a minimal PDF (Helvetica, one content stream per page) from raw page operators."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for stream in page_streams:
+        content = stream.encode("latin-1", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                        "/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+                        % (*PDF_PAGE_SIZE, len(objects))).encode("latin-1"))
+        page_ids.append(len(objects))
+    objects[1] = ("<< /Type /Pages /Kids [%s] /Count %d >>"
+                  % (" ".join(f"{page_id} 0 R" for page_id in page_ids), len(page_ids))).encode("latin-1")
+    
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for obj_id, obj in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % obj_id + obj + b"\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(pdf)
+
+def make_datasheet_rows(rng: random.Random) -> List[List[str]]:
+    """One table row per `FIELDS` label: [No., label, units, Max, Norm, Min]."""
+    rows = []
+    for number, (display_name, pattern) in enumerate(FIELDS, 1):
+        if display_name in pdf_extractor.MULTI_COLUMN_FIELDS:
+            values = [f"{rng.uniform(1, 500):.1f}" for _ in range(3)]
+            units = rng.choice(["m3/h", "bar(g)", "degC", "cP", "dBA", "%"])
+        elif display_name in ("Ambient Temperature", "Available Air Supply Pressure"):
+            values = [f"{rng.randint(-40, 0)}/{rng.randint(40, 80)}", "", ""]
+            units = rng.choice(["degC", "bar(g)"])
+        else:
+            values = [f"{rng.choice(['FV', 'PV', 'LV', 'TV'])}-{rng.randint(100, 9999)}", "", ""]
+            units = "-"
+        rows.append([str(number), pattern, units] + values)
+    return rows
+
+def make_datasheet_pdf(path: str, layout: str = "lattice", pages: int = 3, seed: int = 0) -> str:
+    """Write a synthetic control-valve datasheet PDF.
+    
+    The datasheet table (one row per `FIELDS` label, Max/Norm/Min in columns D-F)
+    comes first; `layout` 'lattice' draws ruled cell borders, 'stream' only aligns
+    the columns. Remaining pages up to `pages` are filler notes.
+    """
+    if layout not in ("lattice", "stream"):
+        raise ValueError(f"Unknown layout: {layout!r} (expected 'lattice' or 'stream')")
+    rng = random.Random(seed)
+    rows = make_datasheet_rows(rng)
+    page_streams = []
+    
+    for start in range(0, len(rows), PDF_ROWS_PER_PAGE):
+        page_rows = rows[start:start + PDF_ROWS_PER_PAGE]
+        ops = []
+        for i, row in enumerate(page_rows):
+            y = PDF_TOP - i * PDF_ROW_HEIGHT
+            for col, text in enumerate(row):
+                if text:
+                    ops.append(_pdf_text(PDF_COLUMN_EDGES[col] + 3, y - PDF_ROW_HEIGHT + 4, text))
+        if layout == "lattice":
+            bottom = PDF_TOP - len(page_rows) * PDF_ROW_HEIGHT
+            ops.append("0.5 w")
+            for i in range(len(page_rows) + 1):
+                y = PDF_TOP - i * PDF_ROW_HEIGHT
+                ops.append(f"{PDF_COLUMN_EDGES[0]} {y} m {PDF_COLUMN_EDGES[-1]} {y} l S")
+            for x in PDF_COLUMN_EDGES:
+                ops.append(f"{x} {PDF_TOP} m {x} {bottom} l S")
+        page_streams.append("\n".join(ops))
+    
+    while len(page_streams) < pages:
+        ops = [_pdf_text(30, 760, f"NOTES - SHEET {len(page_streams) + 1}", size=10)]
+        for i in range(50):
+            line = " ".join(rng.choice(PDF_FILLER_WORDS) for _ in range(rng.randint(5, 14)))
+            ops.append(_pdf_text(30, 740 - i * 13, line, size=8))
+        page_streams.append("\n".join(ops))
+    
+    with open(path, "wb") as f:
+        f.write(build_pdf(page_streams))
+    return path
+
+def make_corpus(folder: str, docs: int = 8, pages: int = 3, layouts: tuple = ("lattice", "stream"),
+                seed: int = 0) -> List[str]:
+    """Write `docs` synthetic datasheets to `folder`, alternating between `layouts`."""
+    os.makedirs(folder, exist_ok=True)
+    return [make_datasheet_pdf(os.path.join(folder, f"datasheet_{i:04d}_{layouts[i % len(layouts)]}.pdf"),
+                               layout=layouts[i % len(layouts)], pages=pages, seed=seed + i)
+            for i in range(docs)]
+
+def time_call(func: Callable, *args, repeat: int = 5) -> float:
+    """Return the best wall time of `repeat` calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmark_text_matcher(page_counts: List[int] = (1, 10, 50, 200)) -> List[Dict]:
+    """Compare the single-pass text matcher against the line x pattern baseline."""
+    rows = []
+    for pages in page_counts:
+        text = make_datasheet_text(pages=pages)
+        expected = reference_extract_fields_from_text(text)
+        actual = extract_fields_from_text_optimized(text)
+        if actual != expected:
+            raise AssertionError(f"Matcher output differs from baseline on {pages} pages")
+        baseline = time_call(reference_extract_fields_from_text, text)
+        optimized = time_call(extract_fields_from_text_optimized, text)
+        rows.append({
+            'benchmark': 'text_matcher',
+            'pages': pages,
+            'baseline_s': round(baseline, 5),
+            'optimized_s': round(optimized, 5),
+            'speedup': round(baseline / optimized, 2) if optimized else None,
+        })
+    return rows
+
+def reference_score_table(df: pd.DataFrame) -> float:
+    """Cell-by-cell table score used before score_tables (kept as a baseline)."""
+    score = len(df) * len(df.columns)
+    if len(df.columns) >= 4:
+        score *= 1.5
+    numeric_cells = 0
+    total_cells = 0
+    for i, row in df.iterrows():
+        for j, cell in enumerate(row):
+            if str(cell).strip():
+                total_cells += 1
+                try:
+                    float(str(cell).replace(',', ''))
+                    numeric_cells += 1
+                except ValueError:
+                    pass
+    if total_cells > 0:
+        score *= (1 + numeric_cells / total_cells)
+    return score
+
+def read_tables(pdf_path: str, flavor: str, **params):
+    """camelot.read_pdf(), or a one-off ParseSession for the 'vector' flavor that Camelot does not have."""
+    if flavor == "vector":
+        with pdf_extractor.ParseSession(pdf_path) as session:
+            return session.read_pdf(flavor=flavor, **params)
+    return pdf_extractor.camelot.read_pdf(pdf_path, flavor=flavor, **params)
+
+def make_candidate_tables(count: int, seed: int = 0) -> List[pd.DataFrame]:
+    """Camelot-like candidates: whole datasheet tables, fragments of them and text blocks."""
+    rng = random.Random(seed)
+    tables = []
+    for _ in range(count):
+        rows = make_datasheet_rows(rng)
+        kind = rng.random()
+        if kind < 0.3:
+            df = pd.DataFrame(rows)
+        elif kind < 0.7:
+            start = rng.randrange(len(rows))
+            df = pd.DataFrame(rows[start:start + rng.randint(1, 12)]).iloc[:, :rng.randint(1, 6)]
+        else:
+            df = pd.DataFrame([[" ".join(row)] for row in rows[:rng.randint(1, 20)]])
+        # Camelot fills missing cells with empty strings
+        tables.append(df.fillna("").astype(str))
+    return tables
+
+def benchmark_table_scoring(candidate_counts: List[int] = (5, 50, 500)) -> List[Dict]:
+    """Compare bulk candidate scoring and formula escaping against the per-cell baselines."""
+    rows = []
+    for count in candidate_counts:
+        tables = make_candidate_tables(count)
+        scores = pdf_extractor.score_tables(tables)
+        if scores != [reference_score_table(df) for df in tables]:
+            raise AssertionError(f"Table scores differ from baseline on {count} candidates")
+        baseline = time_call(lambda: [reference_score_table(df) for df in tables])
+        optimized = time_call(pdf_extractor.score_tables, tables)
+        rows.append({
+            'benchmark': 'table_scoring',
+            'candidates': count,
+            'cells': sum(df.size for df in tables),
+            'baseline_s': round(baseline, 5),
+            'optimized_s': round(optimized, 5),
+            'speedup': round(baseline / optimized, 2) if optimized else None,
+        })
+    
+    # Formula escaping of the largest (whole datasheet) table, with some formula-like cells
+    table = max(make_candidate_tables(20), key=len).copy()
+    table.iloc[::7, 3] = "=" + table.iloc[::7, 3]
+    table.iloc[::5, 4] = "-" + table.iloc[::5, 4]
+    if not table.map(pdf_extractor.escape_excel_formula).equals(pdf_extractor.escape_excel_formulas(table)):
+        raise AssertionError("Escaped table differs from baseline")
+    baseline = time_call(table.map, pdf_extractor.escape_excel_formula)
+    optimized = time_call(pdf_extractor.escape_excel_formulas, table)
+    rows.append({
+        'benchmark': 'escape_excel_formulas',
+        'cells': table.size,
+        'baseline_s': round(baseline, 5),
+        'optimized_s': round(optimized, 5),
+        'speedup': round(baseline / optimized, 2) if optimized else None,
+    })
+    return rows
+
+def reference_normalize_fields(df: pd.DataFrame) -> pd.DataFrame:
+    """normalize_fields() value by value, the way analytics code re-parsed every field."""
+    number = lambda text: float(text.replace(",", ""))
+    components = {}
+    for _, name, component in pdf_extractor.FIELD_SCHEMA.typed_columns:
+        if component != "Unit":
+            components.setdefault(name, []).append(component)
+    rows = []
+    for _, raw in df.iterrows():
+        row = {}
+        for name, parts in components.items():
+            value = "" if pd.isna(raw.get(name)) else str(raw.get(name))
+            numbers, units = {}, []
+            if parts == ["Value"]:
+                match = pdf_extractor.TYPED_VALUE_RE.match(value)
+                if match:
+                    numbers["Value"], units = number(match.group(1)), [match.group(2)]
+            elif parts == ["Min", "Max"]:
+                match = pdf_extractor.TYPED_MIN_MAX_RE.match(value)
+                if match:
+                    numbers["Min"], numbers["Max"], units = number(match.group(1)), number(match.group(2)), [match.group(3)]
+            else:
+                for role in parts:
+                    for part in value.split("|"):
+                        part_role, sep, rest = part.strip().partition(":")
+                        match = pdf_extractor.TYPED_VALUE_RE.match(rest) if sep and part_role == role else None
+                        if match:
+                            numbers[role] = number(match.group(1))
+                            units.append(match.group(2))
+                            break
+            for component in parts:
+                row[f"{name} [{component}]"] = numbers.get(component, float("nan"))
+            row[f"{name} [Unit]"] = next((unit for unit in units if unit is not None), None)
+        rows.append(row)
+    return pd.DataFrame(rows, index=df.index, columns=pdf_extractor.TYPED_COLUMNS)
+
+def benchmark_normalization(doc_counts: List[int] = (100, 1000)) -> List[Dict]:
+    """Compare normalize_fields() over a batch DataFrame against parsing each value in turn."""
+    rows = []
+    for docs in doc_counts:
+        results = make_results(docs)
+        rng = random.Random(docs)
+        for result in results:
+            # Values shaped as the multi-column and min/max extraction writes them
+            for name in pdf_extractor.MULTI_COLUMN_FIELDS:
+                result['fields'][name] = " | ".join(f"{role}:{rng.uniform(0, 500):.1f} m3/h"
+                                                    for role in ("Max", "Norm", "Min") if rng.random() < 0.8)
+            for name, _, _ in pdf_extractor.FIELD_SCHEMA.min_max_rules:
+                result['fields'][name] = f"{rng.randint(-40, 0)}/{rng.randint(40, 80)}"
+        frame = pd.DataFrame([pdf_extractor.result_record(result) for result in results])[pdf_extractor.FIELD_COLUMNS]
+        if not pdf_extractor.normalize_fields(frame).equals(reference_normalize_fields(frame)):
+            raise AssertionError(f"Typed values differ from baseline on {docs} documents")
+        baseline = time_call(reference_normalize_fields, frame, repeat=1)
+        optimized = time_call(pdf_extractor.normalize_fields, frame)
+        rows.append({
+            'benchmark': 'normalize_fields',
+            'documents': docs,
+            'values': int((frame != "").to_numpy().sum()),
+            'baseline_s': round(baseline, 5),
+            'optimized_s': round(optimized, 5),
+            'speedup': round(baseline / optimized, 2) if optimized else None,
+        })
+    return rows
+
+def make_results(docs: int = 1000, fill_ratio: float = 0.6, seed: int = 0) -> List[Dict]:
+    """Build synthetic process_single_pdf() results as the writer stage receives them."""
+    rng = random.Random(seed)
+    results = []
+    for i in range(docs):
+        fields_data = {display_name: f"{rng.randint(-50, 999)} {rng.choice(['bar', 'mm', 'degC', ''])}".strip()
+                       for display_name, _ in FIELDS if rng.random() < fill_ratio}
+        results.append({
+            'filename': f"datasheet_{i:05d}.pdf",
+            'success': True,
+            'method': rng.choice(['camelot', 'text', 'template']),
+            'extraction_time': rng.random() * 5,
+            'fields': fields_data,
+        })
+    return results
+
+def write_per_file_xlsx(results: List[Dict], folder: str):
+    """The per-document output: one {name}_fields.xlsx per result."""
+    for result in results:
+        pdf_extractor.write_per_file_outputs(result['fields'], None, folder, result['filename'])
+
+def write_sink(sink, results: List[Dict], batch_size: int = 100):
+    sink.open()
+    for start in range(0, len(results), batch_size):
+        sink.write_batch(results[start:start + batch_size])
+    sink.close()
+
+def benchmark_sinks(doc_counts: List[int] = (100, 1000)) -> List[Dict]:
+    """Compare write and read times of the output sinks against per-file xlsx output."""
+    rows = []
+    for docs in doc_counts:
+        results = make_results(docs)
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = {
+                'per_file_xlsx': (
+                    lambda: write_per_file_xlsx(results, os.path.join(tmp, 'xlsx')),
+                    lambda: pd.concat([pd.read_excel(path) for path in glob.glob(os.path.join(tmp, 'xlsx', '*.xlsx'))]),
+                ),
+                'excel_sink': (
+                    lambda: write_sink(pdf_extractor.ExcelSink(os.path.join(tmp, 'results.xlsx')), results),
+                    lambda: pd.read_excel(os.path.join(tmp, 'results.xlsx'), sheet_name='Fields'),
+                ),
+                'jsonl_sink': (
+                    lambda: write_sink(pdf_extractor.JsonlSink(os.path.join(tmp, 'jsonl'), run_id='bench'), results),
+                    lambda: pd.read_json(os.path.join(tmp, 'jsonl', 'run=bench.jsonl'), lines=True),
+                ),
+            }
+            if pdf_extractor.pyarrow_available:
+                outputs['parquet_sink'] = (
+                    lambda: write_sink(pdf_extractor.ParquetSink(os.path.join(tmp, 'parquet'), run_id='bench'), results),
+                    lambda: pd.read_parquet(os.path.join(tmp, 'parquet', 'fields')),
+                )
+            os.makedirs(os.path.join(tmp, 'xlsx'))
+            
+            for name, (write, read) in outputs.items():
+                write_s = time_call(write, repeat=1)
+                read_s = time_call(read, repeat=3)
+                rows.append({
+                    'benchmark': 'sinks',
+                    'sink': name,
+                    'docs': docs,
+                    'write_s': round(write_s, 4),
+                    'read_s': round(read_s, 4),
+                })
+    return rows
+
+def count_page_layouts(func: Callable) -> int:
+    """Run `func` and count the pdfminer page layout analyses made through Camelot."""
+    import camelot.handlers, camelot.parsers.base, camelot.utils
+    modules = (camelot.handlers, camelot.parsers.base, camelot.utils)
+    original = camelot.utils.get_page_layout
+    calls = []
+    
+    def counting_get_page_layout(*args, **kwargs):
+        calls.append(args[0])
+        return original(*args, **kwargs)
+    
+    for module in modules:
+        module.get_page_layout = counting_get_page_layout
+    try:
+        func()
+    finally:
+        for module in modules:
+            module.get_page_layout = original
+    return len(calls)
+
+def benchmark_stages(pages_list: List[int] = (3, 20), layouts: tuple = ("lattice", "stream")) -> List[Dict]:
+    """Time each extraction stage on one synthetic datasheet per layout and page count."""
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for layout in layouts:
+            for pages in pages_list:
+                pdf_path = make_datasheet_pdf(os.path.join(tmp, f"{layout}_{pages}.pdf"), layout, pages)
+                base = {'layout': layout, 'pages': pages}
+                
+                def add(stage: str, func: Callable, *args, repeat: int = 3, **extra):
+                    try:
+                        seconds = round(time_call(func, *args, repeat=repeat), 5)
+                        error = ''
+                    except Exception as e:
+                        seconds, error = None, str(e)
+                    rows.append({'benchmark': 'stage', 'stage': stage, **base, 'seconds': seconds,
+                                 'error': error, **extra})
+                
+                add('extract_text_from_pdf_chunked', pdf_extractor.extract_text_from_pdf_chunked, pdf_path)
+                
+                # Camelot, one row per configured strategy, then the planned extraction
+                if pdf_extractor.camelot_available:
+                    for name, flavor, params in pdf_extractor.CAMELOT_STRATEGIES:
+                        add(f"camelot:{name}", lambda: read_tables(pdf_path, flavor, **params),
+                            repeat=1, flavor=flavor)
+                
+                    # Every strategy through one parse session versus one camelot.read_pdf() each
+                    def all_strategies(read_pdf):
+                        for name, flavor, params in pdf_extractor.CAMELOT_STRATEGIES:
+                            try:
+                                read_pdf(flavor=flavor, **params)
+                            except Exception:
+                                pass  # e.g. lattice without Ghostscript
+                    
+                    def with_session():
+                        with pdf_extractor.ParseSession(pdf_path) as session:
+                            all_strategies(session.read_pdf)
+                    
+                    def without_session():
+                        all_strategies(lambda **kwargs: read_tables(pdf_path, **kwargs))
+                    
+                    layouts = {'camelot': count_page_layouts(without_session),
+                               'parse_session': count_page_layouts(with_session)}
+                    add('camelot:all-strategies', without_session, repeat=1, pdfminer_layouts=layouts['camelot'])
+                    add('parse_session:all-strategies', with_session, repeat=1,
+                        pdfminer_layouts=layouts['parse_session'])
+                    
+                    # The image-based lattice passes: camelot.read_pdf() renders each page once per pass
+                    lattice_passes = [params for _, flavor, params in pdf_extractor.CAMELOT_STRATEGIES
+                                      if flavor == 'lattice']
+                    session_stats = {}
+                    
+                    def lattice_with_session():
+                        with pdf_extractor.ParseSession(pdf_path) as session:
+                            for params in lattice_passes:
+                                session.read_pdf(flavor='lattice', **params)
+                            session_stats.update(session.stats)
+                    
+                    def lattice_without_session():
+                        for params in lattice_passes:
+                            read_tables(pdf_path, 'lattice', **params)
+                    
+                    add('camelot:lattice-passes', lattice_without_session, repeat=1,
+                        page_images=pages * len(lattice_passes))
+                    add('parse_session:lattice-passes', lattice_with_session, repeat=1)
+                    rows[-1]['page_images'] = session_stats.get('page_images')
+                
+                def fresh_camelot_extraction():
+                    # A fresh planner so earlier runs' winners don't shortcut the plan
+                    pdf_extractor.strategy_planner = pdf_extractor.StrategyPlanner()
+                    return pdf_extractor.try_camelot_extraction(pdf_path)
+                add('try_camelot_extraction', fresh_camelot_extraction, repeat=1)
+                
+                # Field matching on the stage outputs
+                text = pdf_extractor.extract_text_from_pdf_chunked(pdf_path)
+                add('extract_fields_from_text_optimized', pdf_extractor.extract_fields_from_text_optimized, text)
+                _, table_df, _ = fresh_camelot_extraction()
+                if table_df is not None:
+                    for func in (pdf_extractor.extract_fields_from_table_improved,
+                                 pdf_extractor.extract_fields_from_key_value_table,
+                                 pdf_extractor.extract_fields_from_multi_column_table):
+                        add(func.__name__, func, table_df)
+                
+                # Excel writing for one document
+                fields_data = pdf_extractor.extract_fields_from_text_optimized(text)
+                add('write_per_file_outputs', pdf_extractor.write_per_file_outputs, fields_data, table_df,
+                    tmp, os.path.basename(pdf_path))
+    return rows
+
+def benchmark_end_to_end(docs: int = 8, pages: int = 3, worker_counts: List[int] = (1, 2, 4),
+                         executor_type: str = "process") -> List[Dict]:
+    """Time process_pdfs_parallel over a synthetic corpus at different worker counts."""
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        input_folder = os.path.join(tmp, "Input")
+        make_corpus(input_folder, docs=docs, pages=pages)
+        for workers in worker_counts:
+            output_folder = os.path.join(tmp, f"Output_{workers}")
+            start = time.perf_counter()
+            results = pdf_extractor.process_pdfs_parallel(input_folder, output_folder, max_workers=workers,
+                                                          executor_type=executor_type)
+            seconds = time.perf_counter() - start
+            rows.append({
+                'benchmark': 'end_to_end',
+                'executor': executor_type,
+                'workers': workers,
+                'docs': docs,
+                'pages': pages,
+                'seconds': round(seconds, 3),
+                'docs_per_s': round(docs / seconds, 3),
+                'successful': len([r for r in results if r['success']]),
+                'fields_found': sum(r.get('fields_found', 0) for r in results),
+            })
+    return rows
+
+def post(port: int, path: str, body: bytes) -> tuple:
+    """POST `body` to the service on localhost; returns (status, decoded JSON)."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        connection.request("POST", path, body=body, headers={"Content-Type": "application/pdf"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def benchmark_service(docs: int = 8, workers: int = 2, executor_type: str = "process") -> List[Dict]:
+    """Post synthetic datasheets and malformed bodies to an in-process ExtractionService on localhost.
+    
+    Runs offline (the service binds a free port on 127.0.0.1) and raises if any
+    response has an unexpected status.
+    """
+    async def run(tmp: str, pdf_paths: List[str]) -> List[Dict]:
+        service = pdf_extractor.ExtractionService(port=0, max_workers=workers, executor_type=executor_type,
+                                                  output_folder=os.path.join(tmp, "Output"))
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        await service.start()
+        warm_up = time.perf_counter() - start
+        try:
+            # Bodies that must be rejected before they reach a worker
+            for query, body in [("", b"not a pdf"), ("?filename=..", b"%PDF-1.4\n"),
+                                ("?deadline=nan", b"%PDF-1.4\n"), ("?deadline=0", b"%PDF-1.4\n")]:
+                status, payload = await loop.run_in_executor(None, post, service.port, "/extract" + query, body)
+                if status != 400:
+                    raise RuntimeError(f"Expected 400 for /extract{query} {body[:16]!r}, got {status}: {payload}")
+            
+            def post_pdf(pdf_path):
+                with open(pdf_path, "rb") as f:
+                    body = f.read()
+                request_start = time.perf_counter()
+                status, payload = post(service.port, f"/extract?filename={os.path.basename(pdf_path)}", body)
+                return status, payload, time.perf_counter() - request_start
+            
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(loop.run_in_executor(None, post_pdf, path) for path in pdf_paths))
+            seconds = time.perf_counter() - start
+        finally:
+            await service.stop()
+        for status, payload, _ in responses:
+            if status != 200 or not payload.get('fields_found'):
+                raise RuntimeError(f"Expected fields for {payload.get('filename')}, got {status}: {payload}")
+        latencies = sorted(latency for _, _, latency in responses)
+        return [{
+            'benchmark': 'service',
+            'executor': executor_type,
+            'workers': workers,
+            'docs': docs,
+            'warm_up_s': round(warm_up, 3),
+            'seconds': round(seconds, 3),
+            'docs_per_s': round(docs / seconds, 3),
+            'median_latency_s': round(latencies[len(latencies) // 2], 3),
+            'fields_found': sum(payload['fields_found'] for _, payload, _ in responses),
+        }]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_paths = make_corpus(os.path.join(tmp, "Input"), docs=docs)
+        return asyncio.run(run(tmp, pdf_paths))
+
+HEAVY_MODULES = ("pandas", "camelot", "cv2", "pdfminer", "PyPDF2", "openpyxl", "pyarrow")
+
+def benchmark_startup(repeat: int = 5) -> List[Dict]:
+    """Time interpreter start + `import pdf_extractor` and `pdf_extractor.py --help` in fresh processes."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(here, "pdf_extractor.py")
+    check_modules = ("import json, sys, pdf_extractor; "
+                     f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    commands = {
+        'python': [sys.executable, "-c", "pass"],
+        'import': [sys.executable, "-c", "import pdf_extractor"],
+        'cli_help': [sys.executable, script, "--help"],
+    }
+    
+    def run(command):
+        subprocess.run(command, cwd=here, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    
+    timings = {name: time_call(run, command, repeat=repeat) for name, command in commands.items()}
+    loaded = json.loads(subprocess.run([sys.executable, "-c", check_modules], cwd=here, check=True,
+                                       capture_output=True, text=True).stdout)
+    return [{
+        'benchmark': 'startup',
+        'stage': name,
+        'seconds': round(seconds, 4),
+        'over_python_s': round(seconds - timings['python'], 4),
+        'heavy_modules_loaded': loaded if name == 'import' else None,
+    } for name, seconds in timings.items()]
+
+def environment_info() -> Dict:
+    """Versions recorded with every result file, to compare runs like for like."""
+    info = {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'pandas': pd.__version__}
+    for module in ('PyPDF2', 'camelot', 'openpyxl', 'pyarrow'):
+        try:
+            info[module] = __import__(module).__version__
+        except Exception:
+            info[module] = None
+    return info
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark PDFxTract extraction stages.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--quick", action="store_true", help="smaller corpus and fewer configurations")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts for end-to-end runs")
+    args = parser.parse_args(argv)
+    
+    pdf_extractor.logging.getLogger().setLevel("WARNING")
+    pdf_extractor.logger.setLevel("WARNING")
+    # Camelot warns about every filler page without a table
+    warnings.filterwarnings("ignore", category=UserWarning)
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    
+    suites = [
+        lambda: benchmark_startup(),
+        lambda: benchmark_text_matcher((1, 10) if args.quick else (1, 10, 50, 200)),
+        lambda: benchmark_table_scoring((5, 50) if args.quick else (5, 50, 500)),
+        lambda: benchmark_stages((3,) if args.quick else (3, 20)),
+        lambda: benchmark_sinks((100,) if args.quick else (100, 1000)),
+        lambda: benchmark_normalization((100,) if args.quick else (100, 1000)),
+        lambda: benchmark_end_to_end(docs=4 if args.quick else 16, worker_counts=worker_counts),
+        lambda: benchmark_service(docs=4 if args.quick else 16, workers=max(worker_counts)),
+    ]
+    rows = []
+    for suite in suites:
+        for row in suite():
+            print(row)
+            rows.append(row)
+    
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'argv': sys.argv[1:] if argv is None else argv,
+        'environment': environment_info(),
+        'results': rows,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,127 +1,770 @@
+from __future__ import annotations
+
 import os
+import csv
+import sys
+import argparse
+import asyncio
+import collections
+import copy
+import http
+import importlib
+import importlib.util
 import re
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from PyPDF2 import PdfReader
-import pandas as pd
-from typing import Dict, List, Tuple, Optional
+import json
+import pickle
+import random
+import cProfile
+import fnmatch
+import hashlib
+import shutil
+import signal
+import socket
+import sqlite3
+import statistics
+import tempfile
+import warnings
+import threading
+import multiprocessing
+import queue
+import operator
+import functools
+import itertools
+import math
+import contextlib
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional
 import logging
 
-# --- NEW: Import Camelot for table extraction ---
-try:
-    import camelot
-    camelot_available = True
-except ImportError:
-    camelot_available = False
+class _LazyModule:
+    """Stand-in for a module that is only imported on first attribute access.
+    
+    pandas, PyPDF2, openpyxl and especially camelot (which pulls in cv2 and
+    pdfminer) take over a second to import; deferring them keeps `--help`, the
+    CLI parsing and short runs that never reach those code paths fast.
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+PyPDF2 = _LazyModule('PyPDF2')
+pd = _LazyModule('pandas')
+np = _LazyModule('numpy')
+openpyxl = _LazyModule('openpyxl')
+
+# --- NEW: Camelot for table extraction (optional, imported when first used) ---
+camelot_available = importlib.util.find_spec('camelot') is not None
+camelot = _LazyModule('camelot')
+pdfminer_layout = _LazyModule('pdfminer.layout')
+
+# Optional: Parquet output sink
+pyarrow_available = importlib.util.find_spec('pyarrow') is not None
+pa = _LazyModule('pyarrow')
+pq = _LazyModule('pyarrow.parquet')
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# List of fields to extract: (Display Name, Search Pattern)
-FIELDS = [
-    ("Tag No.", "Tag No."),
-    ("Service", "Service"),
-    ("Line No.", "Line No."),
-    ("Area Classification", "Area Classification"),
-    ("Ambient Temperature", "Ambient Temperature"),
-    ("Allowable Sound Pressure Level", "Allowable Sound Pressure Level"),
-    ("Tightness Requirements", "Tightness Requirements"),
-    ("Available Air Supply Pressure", "Available Air Supply Pressure"),
-    ("Power Failure Position", "Power Failure Position"),
-    ("spec_udf_c13", "spec_udf_c13"),
-    ("Pipe Material", "Pipe Material"),
-    ("Line Size and Schedule", "Line Size and Schedule"),
-    ("Pipe Insulation", "Pipe Insulation"),
-    ("Process Fluid", "Process Fluid"),
-    ("Upstream Condition", "Upstream Condition"),
-    ("Differential Pressure", "Differential Pressure"),
-    ("Flow Rate", "Flow Rate"),
-    ("Inlet Pressure", "Inlet Pressure"),
-    ("Pressure Drop", "Pressure Drop"),
-    ("Inlet Temperature", "Inlet Temperature"),
-    ("Inlet Density / Specific Gravity / Molecular Mass", "Inlet Density / Specific Gravity / Molecular Mass"),
-    ("Inlet Compressibility Factor", "Inlet Compressibility Factor"),
-    ("Inlet Viscosity", "Inlet Viscosity"),
-    ("Inlet Specific Heats Ratio", "Inlet Specific Heats Ratio"),
-    ("Inlet Vapour Pressure", "Inlet Vapour Pressure"),
-    ("spec_udf_c32", "spec_udf_c32"),
-    ("Flow Coefficient Cv", "Flow Coefficient Cv"),
-    ("Travel", "Travel"),
-    ("Sound Pressure Level @ Maximum Flow", "Sound Pressure Level @ Maximum Flow"),
-    ("MFR", "MFR"),
-    ("Model", "Model"),
-    ("Body Type", "Body Type"),
-    ("Body Size Trim Size", "Body Size Trim Size"),
-    ("Rated Cv Characteristics", "Rated Cv Characteristics"),
-    ("End Connec. & Rating", "End Connec. & Rating"),
-    ("Body Material", "Body Material"),
-    ("Bonnet Type", "Bonnet Type"),
-    ("Flow Direction", "Flow Direction"),
-    ("Lubricator Isolat. Valve", "Lubricator Isolat. Valve"),
-    ("Guiding No. of Ports", "Guiding No. of Ports"),
-    ("Trim Type", "Trim Type"),
-    ("Rated Travel", "Rated Travel"),
-    ("Plug/Ball/ Disk Material", "Plug/Ball/ Disk Material"),
-    ("Seat Material", "Seat Material"),
-    ("Cage Stem Material", "Cage Stem Material"),
-    ("Gasket Material", "Gasket Material"),
-    ("spec_udf_c70", "spec_udf_c70"),
-    ("MFR (Actuator)", "MFR (Actuator)"),
-    ("Model (Actuator)", "Model (Actuator)"),
-    ("Type", "Type"),
-    ("Size", "Size"),
-    ("Air Fail Valve", "Air Fail Valve"),
-    ("Handwheel Location", "Handwheel Location"),
-    ("Bench Range", "Bench Range"),
-    ("spec_udf_c59", "spec_udf_c59"),
-    ("spec_udf_c58", "spec_udf_c58"),
-    ("spec_udf_c61", "spec_udf_c61"),
-    ("spec_udf_c62", "spec_udf_c62"),
-    ("spec_udf_c63", "spec_udf_c63"),
-    ("spec_udf_c64", "spec_udf_c64"),
-    ("spec_udf_c65", "spec_udf_c65"),
-    ("spec_udf_c66", "spec_udf_c66"),
-    ("spec_udf_c67", "spec_udf_c67"),
-    ("spec_udf_c68", "spec_udf_c68"),
-    ("spec_udf_c69", "spec_udf_c69"),
-    ("spec_udf_c71", "spec_udf_c71"),
-    ("spec_udf_c72", "spec_udf_c72"),
-    ("spec_udf_c73", "spec_udf_c73"),
-    ("spec_udf_c74", "spec_udf_c74"),
-    ("spec_udf_c75", "spec_udf_c75"),
-    ("spec_udf_c76", "spec_udf_c76"),
-    ("spec_udf_c77", "spec_udf_c77"),
-    ("spec_udf_c78", "spec_udf_c78"),
-    ("spec_udf_c79", "spec_udf_c79"),
-    ("spec_udf_c80", "spec_udf_c80"),
-    ("spec_udf_c81", "spec_udf_c81"),
-    ("spec_udf_c82", "spec_udf_c82"),
-    ("spec_udf_c83", "spec_udf_c83"),
-    ("spec_udf_c84", "spec_udf_c84"),
-    ("spec_udf_c85", "spec_udf_c85"),
-    ("spec_udf_c86", "spec_udf_c86"),
-    ("spec_udf_c87", "spec_udf_c87"),
-    ("spec_udf_c88", "spec_udf_c88"),
-    ("spec_udf_c89", "spec_udf_c89"),
-    ("spec_udf_c90", "spec_udf_c90"),
-    ("spec_udf_c91", "spec_udf_c91"),
-    ("spec_udf_c92", "spec_udf_c92"),
-    ("spec_udf_c93", "spec_udf_c93"),
-    ("spec_udf_c94", "spec_udf_c94"),
-    ("spec_udf_c95", "spec_udf_c95"),
-    ("spec_udf_c96", "spec_udf_c96"),
-    ("spec_udf_c97", "spec_udf_c97"),
-    ("spec_udf_c98", "spec_udf_c98"),
-    ("spec_udf_c99", "spec_udf_c99"),
-    ("spec_udf_c100", "spec_udf_c100"),
-    ("Serial Number", "Serial Number"),
-]
+# Stage timing: spans add their wall time to the recorder active on the current thread
+_span_state = threading.local()
+
+@contextlib.contextmanager
+def span(name: str):
+    """Time a pipeline stage; repeated spans with the same name add up."""
+    timings = getattr(_span_state, 'timings', None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+@contextlib.contextmanager
+def record_spans() -> Iterator[Dict[str, float]]:
+    """Collect the spans of the enclosed code into a {stage: seconds} dict."""
+    previous = getattr(_span_state, 'timings', None)
+    _span_state.timings = timings = {}
+    try:
+        yield timings
+    finally:
+        _span_state.timings = previous
+
+def _label_trie_pattern(labels: List[str]) -> str:
+    """Build a trie-shaped regex alternation that prefers the longest label at each position."""
+    trie = {}
+    for label in labels:
+        node = trie
+        for char in label:
+            node = node.setdefault(char, {})
+        node[''] = {}  # end-of-label marker
+    
+    def render(node):
+        is_end = '' in node
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if is_end:
+            # Optional, greedy continuation: longer labels win over their prefixes
+            return body + '?' if len(branches) == 1 and len(body) == 1 else '(?:' + body + ')?'
+        return body
+    
+    return render(trie)
+
+class LabelMatcher:
+    """Find every occurrence of a fixed set of labels with one compiled regex pass.
+    
+    The labels are merged into a single trie-shaped alternation. Each search resumes
+    one character after the previous match start, so overlapping labels are all
+    reported (e.g. "Type" inside "Body Type"). At each position the regex reports the
+    longest label; any shorter label starting at the same position is necessarily a
+    prefix of it and is added from a lookup table.
+    """
+    
+    def __init__(self, labels: List[str]):
+        self.labels = list(dict.fromkeys(label for label in labels if label))
+        self.regex = re.compile(_label_trie_pattern(self.labels))
+        self._prefixes = {
+            label: [other for other in self.labels if label.startswith(other)]
+            for label in self.labels
+        }
+    
+    def find(self, text: str) -> set:
+        """Return the set of labels occurring anywhere in `text`."""
+        found = set()
+        search = self.regex.search
+        match = search(text)
+        while match:
+            found.update(self._prefixes[match.group()])
+            match = search(text, match.start() + 1)
+        return found
+
+FIELD_KINDS = ('text', 'simple', 'multi_column', 'min_max')
+
+class FieldSchema:
+    """Extraction rules compiled from a field-schema file (see field_schema.json).
+    
+    Each field has a display `name`, the `label` searched for (defaults to the name),
+    optional `aliases` also looked up in the table label column, and a `kind`:
+    'simple' (single value in the value column), 'multi_column' (one value per role
+    column, e.g. Max/Norm/Min), 'min_max' (rows picked by `row_words`, value split
+    into min/max) or 'text' (default; only found by the generic strategies).
+    Fields with `"typed": true` get typed columns (see normalize_fields). The
+    label matchers are compiled once; pickling a schema only sends its path (or
+    spec), and load_field_schema() caches the compiled schema per process.
+    """
+    
+    def __init__(self, spec: Dict, path: Optional[str] = None):
+        self.spec = spec
+        self.path = path
+        self.name = spec.get('name', os.path.basename(path) if path else 'schema')
+        
+        columns = spec.get('columns', {})
+        self.label_column = columns.get('label', 1)
+        self.value_column = columns.get('value', 3)
+        self.fallback_value_column = columns.get('fallback_value', 4)
+        self.roles = {int(col): role for col, role in columns.get('roles', {}).items()}
+        
+        self.fields = []  # (display name, search label) in schema order
+        self.multi_column_fields = {}  # display name -> labels searched in the label column
+        self.simple_fields = set()
+        self.min_max_rules = []  # (display name, words that must all occur, words of which one must)
+        self.typed_columns = []  # (column, display name, component) written by normalize_fields()
+        for field in spec['fields']:
+            name = field['name']
+            label = field.get('label', name)
+            kind = field.get('kind', 'text')
+            if kind not in FIELD_KINDS:
+                raise ValueError(f"Field {name!r} in schema {self.name!r} has unknown kind {kind!r}")
+            self.fields.append((name, label))
+            if kind == 'simple':
+                self.simple_fields.add(name)
+            elif kind == 'multi_column':
+                self.multi_column_fields[name] = [label] + field.get('aliases', [])
+            elif kind == 'min_max':
+                words = field.get('row_words', {})
+                self.min_max_rules.append((name, words.get('all', []), words.get('any', [])))
+            if field.get('typed'):
+                components = {'multi_column': list(self.roles.values()), 'min_max': ['Min', 'Max']}.get(kind, ['Value'])
+                self.typed_columns.extend((f"{name} [{component}]", name, component)
+                                          for component in components + ['Unit'])
+        self.display_names = [name for name, _ in self.fields]
+        
+        split = spec.get('min_max_split', {})
+        self.min_max_known = {value: tuple(parts) for value, parts in split.get('known', {}).items()}
+        self.min_max_digit_splits = [
+            (re.compile(rf"^(\d{{{min_len}}})(\d{{{max_len}}})$"), min_len, max_len)
+            for min_len, max_len in split.get('digit_splits', [])
+        ]
+        self.min_max_split_middle = split.get('split_middle', True)
+        
+        # Matchers over the search labels (text layer) and every label a table strategy may look up
+        self.field_matcher = LabelMatcher([label for _, label in self.fields])
+        self.table_matcher = LabelMatcher(
+            [label for _, label in self.fields] +
+            [label for labels in self.multi_column_fields.values() for label in labels]
+        )
+        roles = "|".join(re.escape(role) for role in self.roles.values()) or "(?!)"
+        self.role_part_re = re.compile(rf"^({roles}):(.*)$", re.DOTALL)
+    
+    def __reduce__(self):
+        # Workers rebuild from the path (or spec) through the per-process cache
+        return (_restore_field_schema, (self.path, None if self.path else self.spec))
+
+_field_schema_cache = {}
+
+def load_field_schema(path: str) -> FieldSchema:
+    """Load and compile a field-schema JSON file; compiled once per process and file version."""
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    cached = _field_schema_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = (mtime, FieldSchema(json.load(f), path=path))
+        _field_schema_cache[path] = cached
+    return cached[1]
+
+def _restore_field_schema(path: Optional[str], spec: Optional[Dict]) -> FieldSchema:
+    if path is not None:
+        return load_field_schema(path)
+    key = hashlib.sha1(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+    if key not in _field_schema_cache:
+        _field_schema_cache[key] = (None, FieldSchema(spec))
+    return _field_schema_cache[key][1]
+
+# Default schema, shipped next to this script and compiled once at import time
+DEFAULT_FIELD_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'field_schema.json')
+FIELD_SCHEMA = load_field_schema(DEFAULT_FIELD_SCHEMA_PATH)
+
+# The default schema's rules, under the names the rest of the module (and callers) use:
+# FIELDS holds (Display Name, Search Pattern) pairs
+FIELDS = FIELD_SCHEMA.fields
+FIELD_MATCHER = FIELD_SCHEMA.field_matcher
+TABLE_MATCHER = FIELD_SCHEMA.table_matcher
+MULTI_COLUMN_FIELDS = FIELD_SCHEMA.multi_column_fields
+MULTI_COLUMN_ROLES = FIELD_SCHEMA.roles
+SIMPLE_FIELDS = [name for name in FIELD_SCHEMA.display_names if name in FIELD_SCHEMA.simple_fields]
+
+# Column separators tried (in order) when splitting a text line into cells
+LINE_SEPARATORS = [re.compile(sep) for sep in (r"\s{2,}", r"\t+", r"\s*\|\s*", r"\s*;\s*")]
+
+class TableLabelIndex:
+    """Label -> (row, col) index of a table, built in one pass.
+    
+    The cells are stringified and stripped once with vectorized pandas string ops;
+    only cells the combined TABLE_MATCHER regex flags are scanned for individual
+    labels. Row and column numbers are positional (as used with `iloc`).
+    """
+    
+    def __init__(self, df: pd.DataFrame, matcher: LabelMatcher = TABLE_MATCHER):
+        self.n_rows, self.n_cols = df.shape
+        flat = pd.Series(df.astype(str).to_numpy().ravel(), dtype=object)
+        stripped = flat.str.strip()
+        self.raw = flat.to_numpy().reshape(df.shape)  # str(cell)
+        self.cells = stripped.to_numpy().reshape(df.shape)  # str(cell).strip()
+        self.valid = (~stripped.isin(["", "nan", "<NA>"])).to_numpy().reshape(df.shape)
+        
+        self.positions = {}  # label -> [(row, col), ...] in row-major order
+        hit_mask = stripped.str.contains(matcher.regex).to_numpy()
+        for flat_idx in hit_mask.nonzero()[0]:
+            position = divmod(int(flat_idx), self.n_cols)
+            for label in matcher.find(stripped.iat[flat_idx]):
+                self.positions.setdefault(label, []).append(position)
+    
+    def rows_with(self, label: str, col_idx: int) -> List[int]:
+        """Rows whose cell in column `col_idx` contains `label`, top to bottom."""
+        return [row for row, col in self.positions.get(label, ()) if col == col_idx]
+    
+    def value(self, row_idx: int, col_idx: int, pattern: Optional[str] = None) -> str:
+        """Stripped cell text if it holds a usable value (non-empty, not nan, not the label)."""
+        if 0 <= row_idx < self.n_rows and 0 <= col_idx < self.n_cols and self.valid[row_idx, col_idx]:
+            value = self.cells[row_idx, col_idx]
+            if value != pattern:
+                return value
+        return ""
+    
+    def column_contains(self, col_idx: int, word: str) -> pd.Series:
+        """Vectorized substring test over one column; all False if the column is missing."""
+        if col_idx >= self.n_cols:
+            return pd.Series(False, index=range(self.n_rows))
+        return pd.Series(self.cells[:, col_idx]).str.contains(word, regex=False)
+
+class ParseSession:
+    """Everything parsed from one PDF, shared by all extraction strategies for it.
+    
+    The PDF is opened once (PyPDF2) for the page count, the page texts and the
+    single-page files Camelot works on. Each page is split out once, and pdfminer's
+    layout analysis runs once per page and set of layout parameters, whichever
+    Camelot stream or lattice configuration asks for it first (camelot.read_pdf()
+    splits and analyses every page again on every call, twice per page). Lattice
+    pages are rendered once per image backend, and their thresholded images are
+    kept for every further lattice pass (see page_threshold). Page texts are
+    cached for the pre-filter, templates and the text fallback.
+    close(), or leaving the `with` block, removes the page files and images and
+    releases the layouts.
+    """
+    
+    def __init__(self, pdf_path: str):
+        self.pdf_path = pdf_path
+        self.page_texts = {}  # page number -> text
+        self.stats = {'page_files': 0, 'layouts': 0, 'layout_reuses': 0,
+                      'page_images': 0, 'thresholds': 0, 'threshold_reuses': 0}
+        self._reader = None
+        self._tempdir = None
+        self._page_files = {}  # page number -> single-page PDF
+        self._layouts = {}  # (page file, layout kwargs) -> (LTPage, (width, height))
+        self._page_images = {}  # (page file, backend) -> rendered PNG
+        self._thresholds = collections.OrderedDict()  # (page file, backend, threshold args) -> array, LRU first
+        self._threshold_bytes = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    @property
+    def reader(self):
+        if self._reader is None:
+            self._reader = PyPDF2.PdfReader(self.pdf_path)
+        return self._reader
+    
+    @property
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+    
+    def page_text(self, page_num: int) -> str:
+        """Text of a page (1-based), extracted once."""
+        if page_num not in self.page_texts:
+            self.page_texts[page_num] = self.reader.pages[page_num - 1].extract_text() or ""
+        return self.page_texts[page_num]
+    
+    def page_numbers(self, pages: str = '1') -> List[int]:
+        """Page numbers for a Camelot `pages` argument, e.g. '1,3,4', '1,4-end' or 'all'."""
+        if pages == 'all':
+            return list(range(1, self.page_count + 1))
+        numbers = set()
+        for part in pages.split(','):
+            start, _, end = part.partition('-')
+            end = self.page_count if end == 'end' else int(end or start)
+            numbers.update(range(int(start), end + 1))
+        return sorted(numbers)
+    
+    def page_file(self, page_num: int) -> str:
+        """Single-page PDF of a page, written once; rotated pages are turned upright as Camelot does."""
+        if page_num not in self._page_files:
+            if self._tempdir is None:
+                self._tempdir = tempfile.mkdtemp(prefix='pdfxtract-')
+            page_path = os.path.join(self._tempdir, f"page-{page_num}.pdf")
+            writer = PyPDF2.PdfWriter()
+            writer.add_page(self.reader.pages[page_num - 1])
+            with open(page_path, 'wb') as f:
+                writer.write(f)
+            
+            # Camelot's rotation check; the layout is kept for the parsers' default parameters
+            layout, _ = self.page_layout(page_path, {})
+            get_text_objects = camelot.utils.get_text_objects
+            rotation = camelot.utils.get_rotation(get_text_objects(layout, ltype='char'),
+                                                  get_text_objects(layout, ltype='horizontal_text'),
+                                                  get_text_objects(layout, ltype='vertical_text'))
+            if rotation:
+                rotated = PyPDF2.PdfReader(page_path).pages[0]
+                rotated.rotate(90 if rotation == 'anticlockwise' else -90)
+                writer = PyPDF2.PdfWriter()
+                writer.add_page(rotated)
+                with open(page_path, 'wb') as f:
+                    writer.write(f)
+                self._layouts = {key: value for key, value in self._layouts.items() if key[0] != page_path}
+            
+            self._page_files[page_num] = page_path
+            self.stats['page_files'] += 1
+        return self._page_files[page_num]
+    
+    def page_layout(self, page_path: str, layout_kwargs: Dict) -> Tuple:
+        """pdfminer layout and dimensions of a single-page PDF, analysed once per set of parameters."""
+        key = (page_path, json.dumps(layout_kwargs, sort_keys=True))
+        if key in self._layouts:
+            self.stats['layout_reuses'] += 1
+        else:
+            self._layouts[key] = camelot.utils.get_page_layout(page_path, **layout_kwargs)
+            self.stats['layouts'] += 1
+        return self._layouts[key]
+    
+    def page_image(self, page_path: str, backend) -> str:
+        """PNG of a single-page PDF, rendered once per image backend (at its fixed 300 dpi)."""
+        key = (page_path, type(backend).__name__)
+        if key not in self._page_images:
+            image_path = f"{os.path.splitext(page_path)[0]}-{type(backend).__name__}.png"
+            backend.convert(page_path, image_path)
+            self._page_images[key] = image_path
+            self.stats['page_images'] += 1
+        return self._page_images[key]
+    
+    def page_threshold(self, page_path: str, backend, process_background: bool = False,
+                       blocksize: int = 15, c: int = -2):
+        """Camelot's adaptive threshold of a rendered page, computed once per set of threshold arguments.
+        
+        Thresholds are held in memory up to PAGE_IMAGE_CACHE_BYTES, least recently
+        used first out; an evicted one is recomputed from the page's PNG, which stays
+        in the session's temporary directory, so a page is never rendered twice.
+        """
+        key = (page_path, type(backend).__name__, process_background, blocksize, c)
+        if key in self._thresholds:
+            self._thresholds.move_to_end(key)
+            self.stats['threshold_reuses'] += 1
+            return self._thresholds[key]
+        
+        _, threshold = camelot.image_processing.adaptive_threshold(
+            self.page_image(page_path, backend), process_background=process_background, blocksize=blocksize, c=c)
+        self._thresholds[key] = threshold
+        self._threshold_bytes += threshold.nbytes
+        self.stats['thresholds'] += 1
+        while self._threshold_bytes > PAGE_IMAGE_CACHE_BYTES and len(self._thresholds) > 1:
+            _, evicted = self._thresholds.popitem(last=False)
+            self._threshold_bytes -= evicted.nbytes
+        return threshold
+    
+    def read_pdf(self, pages: str = '1', flavor: str = 'lattice', suppress_stdout: bool = False,
+                 layout_kwargs: Optional[Dict] = None, **kwargs):
+        """camelot.read_pdf() for this document, on the session's page files and layouts.
+        
+        Besides 'lattice' and 'stream', `flavor` may be 'vector': lattice, with the
+        table grid read from the page's vector drawing instead of a rendered image.
+        It takes the lattice arguments.
+        """
+        if flavor not in ('lattice', 'stream', 'vector'):
+            raise NotImplementedError("Unknown flavor specified. Use either 'lattice', 'stream' or 'vector'")
+        with warnings.catch_warnings():
+            if suppress_stdout:
+                warnings.simplefilter('ignore')
+            camelot_flavor = 'lattice' if flavor == 'vector' else flavor
+            camelot.utils.validate_input(kwargs, flavor=camelot_flavor)
+            kwargs = camelot.utils.remove_extra(kwargs, flavor=camelot_flavor)
+            parser = _session_parsers()[flavor](self, **kwargs)
+            tables = []
+            for page_num in self.page_numbers(pages):
+                tables.extend(parser.extract_tables(self.page_file(page_num), suppress_stdout=suppress_stdout,
+                                                    layout_kwargs=layout_kwargs or {}))
+        return camelot.core.TableList(sorted(tables))
+    
+    def release_layouts(self):
+        """Drop the cached layouts and thresholds (e.g. once a page window is done); page files and images are kept."""
+        self._layouts = {}
+        self._thresholds.clear()
+        self._threshold_bytes = 0
+    
+    def close(self):
+        self.release_layouts()
+        self._page_images = {}
+        self._page_files = {}
+        self.page_texts = {}
+        self._reader = None
+        if self._tempdir is not None:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+            self._tempdir = None
+
+# Thresholded lattice page images kept in memory per document (about 9 MB per A4 page at 300 dpi)
+PAGE_IMAGE_CACHE_BYTES = 256 * 1024 * 1024
+
+# Vector lattice: table rulings read from the page's drawing operators, no rendering
+VECTOR_LINE_MAX_WIDTH = 2.0  # filled rectangles at most this thick are drawn lines
+VECTOR_MAX_TABLES = 10  # as Camelot lattice, which keeps the 10 largest line contours
+# Pieces of a line further apart than this stay separate lines, as in the rendered page
+VECTOR_JOIN_GAP = 0.5
+
+def _is_white(color) -> bool:
+    """Whether a pdfminer colour (gray, RGB or CMYK) is white, i.e. invisible on paper."""
+    values = color if isinstance(color, (list, tuple)) else [color]
+    try:
+        values = [float(value) for value in values]
+    except (TypeError, ValueError):  # patterns and missing colours
+        return False
+    if len(values) == 4:
+        return all(value <= 0.05 for value in values)
+    return bool(values) and all(value >= 0.95 for value in values)
+
+def ruling_segments(layout) -> Tuple[List, List]:
+    """Horizontal and vertical line pieces drawn on a pdfminer page, as (position, start, end).
+    
+    Lines, polylines and stroked rectangles contribute their axis-parallel edges;
+    thin filled rectangles (many generators draw table borders that way) their
+    centre line. Fill-only shapes thicker than VECTOR_LINE_MAX_WIDTH (cell
+    shading) and white strokes are ignored, as they leave no line on the page.
+    """
+    horizontal, vertical = [], []
+    
+    def add(x0, y0, x1, y1):
+        if abs(y1 - y0) <= 0.1:
+            horizontal.append(((y0 + y1) / 2, min(x0, x1), max(x0, x1)))
+        elif abs(x1 - x0) <= 0.1:
+            vertical.append(((x0 + x1) / 2, min(y0, y1), max(y0, y1)))
+    
+    stack = [layout]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, pdfminer_layout.LTRect):
+            width, height = obj.x1 - obj.x0, obj.y1 - obj.y0
+            if min(width, height) <= VECTOR_LINE_MAX_WIDTH and (
+                    (obj.fill and not _is_white(obj.non_stroking_color))
+                    or (obj.stroke and not _is_white(obj.stroking_color))):
+                if width >= height:
+                    add(obj.x0, (obj.y0 + obj.y1) / 2, obj.x1, (obj.y0 + obj.y1) / 2)
+                else:
+                    add((obj.x0 + obj.x1) / 2, obj.y0, (obj.x0 + obj.x1) / 2, obj.y1)
+            elif obj.stroke and not _is_white(obj.stroking_color):
+                add(obj.x0, obj.y0, obj.x1, obj.y0)
+                add(obj.x0, obj.y1, obj.x1, obj.y1)
+                add(obj.x0, obj.y0, obj.x0, obj.y1)
+                add(obj.x1, obj.y0, obj.x1, obj.y1)
+        elif isinstance(obj, pdfminer_layout.LTCurve):
+            if obj.stroke and not _is_white(obj.stroking_color):
+                for (x0, y0), (x1, y1) in zip(obj.pts, obj.pts[1:]):
+                    add(x0, y0, x1, y1)
+        elif isinstance(obj, pdfminer_layout.LTContainer) and not isinstance(obj, pdfminer_layout.LTTextContainer):
+            stack.extend(obj)  # pages and figures (form XObjects)
+    return horizontal, vertical
+
+def merge_segments(segments: List[Tuple], line_tol: float, gap: float) -> List[Tuple]:
+    """Join (position, start, end) pieces of the same line: positions within `line_tol`, gaps up to `gap`."""
+    merged = []
+    lines = []  # [[position sum, count, pieces]]
+    for position, start, end in sorted(segments):
+        if lines and position - lines[-1][0] / lines[-1][1] <= line_tol:
+            lines[-1][0] += position
+            lines[-1][1] += 1
+            lines[-1][2].append((start, end))
+        else:
+            lines.append([position, 1, [(start, end)]])
+    for total, count, pieces in lines:
+        position = total / count
+        pieces.sort()
+        current_start, current_end = pieces[0]
+        for start, end in pieces[1:]:
+            if start <= current_end + gap:
+                current_end = max(current_end, end)
+            else:
+                merged.append((position, current_start, current_end))
+                current_start, current_end = start, end
+        merged.append((position, current_start, current_end))
+    return merged
+
+def _clip_segments(segments: List[Tuple], regions: List[Tuple], vertical: bool) -> List[Tuple]:
+    """Parts of (position, start, end) segments inside (x0, y0, x1, y1) regions."""
+    clipped = []
+    for position, start, end in segments:
+        for x0, y0, x1, y1 in regions:
+            low, high, across_low, across_high = (y0, y1, x0, x1) if vertical else (x0, x1, y0, y1)
+            if across_low <= position <= across_high and start < high and end > low:
+                clipped.append((position, max(start, low), min(end, high)))
+    return clipped
+
+def _parse_areas(areas: List[str]) -> List[Tuple]:
+    """Camelot 'x1,y1,x2,y2' areas (left-top, right-bottom in PDF space) as (x0, y0, x1, y1) boxes."""
+    boxes = []
+    for area in areas:
+        x1, y1, x2, y2 = (float(value) for value in area.split(','))
+        boxes.append((min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)))
+    return boxes
+
+def vector_table_grid(layout, page_width: float, page_height: float, line_scale: int = 15,
+                      line_tol: float = 2, joint_tol: float = 2, table_regions: Optional[List[str]] = None,
+                      table_areas: Optional[List[str]] = None) -> Tuple[Dict, List, List]:
+    """Camelot lattice's table boundaries, joints and line segments, from the page's vector drawing.
+    
+    Returns (table_bbox, vertical_segments, horizontal_segments) in the form
+    Lattice._generate_table_bbox() leaves them after scaling back to PDF space:
+    {(x0, y0, x1, y1): [(x, y) joints]}, [(x, y0, x, y1)] and [(x0, y, x1, y)].
+    As in the image-based version, lines shorter than the page size divided by
+    `line_scale` are ignored, a table is a connected set of lines with more than
+    four joints, and only the VECTOR_MAX_TABLES largest tables are kept.
+    """
+    horizontal, vertical = ruling_segments(layout)
+    if table_regions:
+        regions = _parse_areas(table_regions)
+        horizontal = _clip_segments(horizontal, regions, vertical=False)
+        vertical = _clip_segments(vertical, regions, vertical=True)
+    horizontal = [segment for segment in merge_segments(horizontal, line_tol, VECTOR_JOIN_GAP)
+                  if segment[2] - segment[1] >= page_width / line_scale]
+    vertical = [segment for segment in merge_segments(vertical, line_tol, VECTOR_JOIN_GAP)
+                if segment[2] - segment[1] >= page_height / line_scale]
+    v_segments = [(x, y0, x, y1) for x, y0, y1 in vertical]
+    h_segments = [(x0, y, x1, y) for y, x0, x1 in horizontal]
+    if not horizontal or not vertical:
+        return {}, v_segments, h_segments
+    
+    # Joints: every vertical x horizontal pair that crosses or touches
+    v = np.array(vertical, dtype=float)
+    h = np.array(horizontal, dtype=float)
+    touches = ((h[None, :, 1] - joint_tol <= v[:, None, 0]) & (v[:, None, 0] <= h[None, :, 2] + joint_tol)
+               & (v[:, None, 1] - joint_tol <= h[None, :, 0]) & (h[None, :, 0] <= v[:, None, 2] + joint_tol))
+    v_index, h_index = np.nonzero(touches)
+    joints = list(zip(v[v_index, 0].tolist(), h[h_index, 0].tolist()))
+    
+    def joints_in(x0, y0, x1, y1):
+        return [(x, y) for x, y in joints
+                if x0 - joint_tol <= x <= x1 + joint_tol and y0 - joint_tol <= y <= y1 + joint_tol]
+    
+    table_bbox = {}
+    if table_areas:
+        for box in _parse_areas(table_areas):
+            area_joints = joints_in(*box)
+            if len(area_joints) > 4:
+                table_bbox[box] = area_joints
+        return table_bbox, v_segments, h_segments
+    
+    # Tables: connected components of the line graph (vertical lines 0.., horizontal after them)
+    parent = list(range(len(vertical) + len(horizontal)))
+    
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+    
+    for i, j in zip(v_index.tolist(), h_index.tolist()):
+        parent[find(i)] = find(len(vertical) + j)
+    components = {}
+    for i, j in zip(v_index.tolist(), h_index.tolist()):
+        components.setdefault(find(i), set()).update([('v', i), ('h', j)])
+    
+    boxes = []
+    for members in components.values():
+        xs, ys = [], []
+        for kind, i in members:
+            if kind == 'v':
+                xs.append(v[i, 0])
+                ys.extend([v[i, 1], v[i, 2]])
+            else:
+                ys.append(h[i, 0])
+                xs.extend([h[i, 1], h[i, 2]])
+        boxes.append((min(xs), min(ys), max(xs), max(ys)))
+    boxes.sort(key=lambda box: (box[2] - box[0]) * (box[3] - box[1]), reverse=True)
+    for box in boxes[:VECTOR_MAX_TABLES]:
+        box_joints = joints_in(*box)
+        if len(box_joints) > 4:
+            table_bbox[tuple(float(value) for value in box)] = box_joints
+    return table_bbox, v_segments, h_segments
+
+@functools.lru_cache(maxsize=None)
+def _session_parsers() -> Dict[str, type]:
+    """Camelot's Stream and Lattice parsers, reading page layouts from a ParseSession.
+    
+    Built on first use, since camelot itself is only imported when needed.
+    """
+    get_text_objects = camelot.utils.get_text_objects
+    
+    class SessionLayoutMixin:
+        def __init__(self, session: ParseSession, **kwargs):
+            super().__init__(**kwargs)
+            self.session = session
+        
+        def _generate_layout(self, filename, layout_kwargs):
+            # As BaseParser._generate_layout(), without re-running pdfminer
+            self.filename = filename
+            self.layout_kwargs = layout_kwargs
+            self.layout, self.dimensions = self.session.page_layout(filename, layout_kwargs)
+            self.images = get_text_objects(self.layout, ltype='image')
+            self.horizontal_text = get_text_objects(self.layout, ltype='horizontal_text')
+            self.vertical_text = get_text_objects(self.layout, ltype='vertical_text')
+            self.pdf_width, self.pdf_height = self.dimensions
+            self.rootname, _ = os.path.splitext(self.filename)
+            self.imagename = ''.join([self.rootname, '.png'])
+    
+    class SessionStream(SessionLayoutMixin, camelot.parsers.Stream):
+        pass
+    
+    class NoImage:
+        """Image backend that renders nothing; the vector lattice needs no page image."""
+        
+        def convert(self, pdf_path, png_path):
+            pass
+    
+    class SessionLattice(SessionLayoutMixin, camelot.parsers.Lattice):
+        """Lattice reading the rendered, thresholded page from the session (see ParseSession.page_threshold)."""
+        
+        def __init__(self, session: ParseSession, **kwargs):
+            super().__init__(session, **kwargs)
+            # extract_tables() renders every page on every call; the session renders it once
+            self.render_backend, self.backend = self.backend, NoImage()
+        
+        def _generate_table_bbox(self):
+            # As Lattice._generate_table_bbox(), with the session's cached threshold
+            image_processing = camelot.image_processing
+            self.threshold = self.session.page_threshold(
+                self.filename, self.render_backend, process_background=self.process_background,
+                blocksize=self.threshold_blocksize, c=self.threshold_constant)
+            self.image = None  # only used by Camelot's plots
+            image_height, image_width = self.threshold.shape[:2]
+            image_scalers = (image_width / float(self.pdf_width), image_height / float(self.pdf_height),
+                             self.pdf_height)
+            pdf_scalers = (self.pdf_width / float(image_width), self.pdf_height / float(image_height), image_height)
+            
+            def scale_areas(areas):
+                scaled_areas = []
+                for area in areas:
+                    x1, y1, x2, y2 = camelot.utils.scale_pdf(tuple(float(v) for v in area.split(',')),
+                                                             image_scalers)
+                    scaled_areas.append((x1, y1, abs(x2 - x1), abs(y2 - y1)))
+                return scaled_areas
+            
+            regions = None
+            if self.table_areas is None and self.table_regions is not None:
+                regions = scale_areas(self.table_regions)
+            vertical_mask, vertical_segments = image_processing.find_lines(
+                self.threshold, regions=regions, direction='vertical',
+                line_scale=self.line_scale, iterations=self.iterations)
+            horizontal_mask, horizontal_segments = image_processing.find_lines(
+                self.threshold, regions=regions, direction='horizontal',
+                line_scale=self.line_scale, iterations=self.iterations)
+            if self.table_areas is None:
+                contours = image_processing.find_contours(vertical_mask, horizontal_mask)
+            else:
+                contours = scale_areas(self.table_areas)
+            table_bbox = image_processing.find_joints(contours, vertical_mask, horizontal_mask)
+            
+            self.table_bbox_unscaled = copy.deepcopy(table_bbox)
+            self.table_bbox, self.vertical_segments, self.horizontal_segments = camelot.utils.scale_image(
+                table_bbox, vertical_segments, horizontal_segments, pdf_scalers)
+    
+    class SessionVectorLattice(SessionLattice):
+        """Lattice with the table grid taken from the page's line drawing (see vector_table_grid).
+        
+        Columns, rows, spanning cells and text assignment are Camelot's own, so
+        the tables match lattice output on ruled tables, without Ghostscript or OpenCV.
+        """
+        
+        def __init__(self, session: ParseSession, **kwargs):
+            kwargs.pop('backend', None)
+            super().__init__(session, backend=NoImage(), **kwargs)
+        
+        def _generate_table_bbox(self):
+            self.image = self.table_bbox_unscaled = None  # only used by Camelot's plots
+            self.table_bbox, self.vertical_segments, self.horizontal_segments = vector_table_grid(
+                self.layout, self.pdf_width, self.pdf_height, line_scale=self.line_scale,
+                line_tol=self.line_tol, joint_tol=self.joint_tol,
+                table_regions=self.table_regions, table_areas=self.table_areas)
+    
+    return {'stream': SessionStream, 'lattice': SessionLattice, 'vector': SessionVectorLattice}
+
+def parse_session(pdf_path: str, session: Optional[ParseSession] = None):
+    """Context manager yielding `session`, or a new ParseSession for `pdf_path` that is closed on exit."""
+    return contextlib.nullcontext(session) if session is not None else ParseSession(pdf_path)
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """Extract text from a PDF file with improved error handling."""
     try:
-        reader = PdfReader(pdf_path)
+        reader = PyPDF2.PdfReader(pdf_path)
         text = ""
         total_pages = len(reader.pages)
         
@@ -140,76 +783,160 @@ def extract_text_from_pdf(pdf_path: str) -> str:
         logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
         return ""
 
+def iter_page_texts(pdf_path: str, chunk_size: int = 5, session: Optional[ParseSession] = None) -> Iterator[str]:
+    """Yield the text of each page (with its '--- PAGE n ---' header), one page at a time.
+    
+    Pages are only parsed when the consumer asks for them, so a consumer that stops
+    early never pays for the remaining pages. Progress is logged every `chunk_size` pages.
+    With a `session`, pages it has already extracted are not parsed again.
+    """
+    session = session or ParseSession(pdf_path)
+    try:
+        total_pages = session.page_count
+    except Exception as e:
+        logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
+        return
+    
+    for page_num in range(total_pages):
+        try:
+            page_text = session.page_text(page_num + 1)
+        except Exception as e:
+            logger.warning(f"Error extracting text from page {page_num + 1}: {e}")
+            continue
+        
+        if page_text:
+            yield f"--- PAGE {page_num + 1} ---\n{page_text}\n"
+        
+        if (page_num + 1) % chunk_size == 0 or page_num + 1 == total_pages:
+            logger.debug(f"Processed pages {page_num + 1}/{total_pages}")
+
+def extract_page_texts(pdf_path: str, chunk_size: int = 5, session: Optional[ParseSession] = None) -> List[str]:
+    """Extract the text of every page (with its '--- PAGE n ---' header)."""
+    return list(iter_page_texts(pdf_path, chunk_size, session=session))
+
 def extract_text_from_pdf_chunked(pdf_path: str, chunk_size: int = 5) -> str:
     """Extract text from PDF in chunks to reduce memory usage."""
+    return "".join(iter_page_texts(pdf_path, chunk_size))
+
+# Page pre-filter: documents with more pages than PREFILTER_MIN_DOC_PAGES only get
+# their PREFILTER_TOP_PAGES best pages (by distinct FIELDS labels, at least
+# PREFILTER_MIN_LABELS) passed to Camelot
+PREFILTER_MIN_DOC_PAGES = 3
+PREFILTER_TOP_PAGES = 3
+PREFILTER_MIN_LABELS = 3
+
+PAGE_HEADER_RE = re.compile(r"--- PAGE (\d+) ---\n")
+
+def count_pdf_pages(pdf_path: str, session: Optional[ParseSession] = None) -> int:
+    """Number of pages in a PDF (0 if it cannot be read)."""
     try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        total_pages = len(reader.pages)
-        
-        for start_page in range(0, total_pages, chunk_size):
-            end_page = min(start_page + chunk_size, total_pages)
-            chunk_text = ""
-            
-            for page_num in range(start_page, end_page):
-                try:
-                    page = reader.pages[page_num]
-                    page_text = page.extract_text()
-                    if page_text:
-                        chunk_text += f"--- PAGE {page_num + 1} ---\n{page_text}\n"
-                except Exception as e:
-                    logger.warning(f"Error extracting text from page {page_num + 1}: {e}")
-                    continue
-            
-            text += chunk_text
-            logger.debug(f"Processed pages {start_page + 1}-{end_page}/{total_pages}")
-            
-        return text
+        return (session or ParseSession(pdf_path)).page_count
     except Exception as e:
-        logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
-        return ""
+        logger.debug(f"Could not count pages of {pdf_path}: {e}")
+        return 0
+
+def score_pages(page_texts: List[str], schema: Optional[FieldSchema] = None) -> Dict[int, int]:
+    """Distinct `schema` labels per page, for page texts from extract_page_texts()."""
+    matcher = (schema or FIELD_SCHEMA).field_matcher
+    scores = {}
+    for page_text in page_texts:
+        header = PAGE_HEADER_RE.match(page_text)
+        if header:
+            scores[int(header.group(1))] = len(matcher.find(page_text[header.end():]))
+    return scores
 
-def extract_fields_from_text_optimized(text: str) -> Dict[str, str]:
+def select_table_pages(page_texts: List[str], top_pages: int = PREFILTER_TOP_PAGES,
+                       min_labels: int = PREFILTER_MIN_LABELS, schema: Optional[FieldSchema] = None) -> str:
+    """Camelot `pages` argument covering the pages most likely to hold the datasheet table.
+    
+    Returns 'all' when no page carries enough labels (e.g. scanned documents).
+    """
+    scores = score_pages(page_texts, schema)
+    ranked = sorted((page for page, score in scores.items() if score >= min_labels),
+                    key=lambda page: (-scores[page], page))
+    if not ranked:
+        return 'all'
+    return ','.join(str(page) for page in sorted(ranked[:top_pages]))
+
+def extract_fields_from_text_optimized(text: str, schema: Optional[FieldSchema] = None) -> Dict[str, str]:
     """Optimized text-based field extraction with better pattern matching."""
+    return extract_fields_from_pages([text], schema=schema)
+
+def extract_fields_from_pages(pages: Iterable[str], schema: Optional[FieldSchema] = None) -> Dict[str, str]:
+    """Incremental text-based field extraction over page texts (e.g. from iter_page_texts).
+    
+    Lines are consumed one at a time with a single line of lookahead. Each line is
+    scanned once by the schema's field matcher to find every label it contains and
+    is split into columns at most once; as soon as every field is resolved no further
+    lines (and so no further pages) are read.
+    """
     data = {}
-    lines = text.splitlines()
+    schema = schema or FIELD_SCHEMA
+    field_matcher = schema.field_matcher
+    lines = (line for page in pages for line in page.splitlines())
     
     # Create a more efficient search pattern
-    field_patterns = {pattern: display_name for display_name, pattern in FIELDS}
+    field_patterns = {pattern: display_name for display_name, pattern in schema.fields}
+    field_order = {pattern: order for order, pattern in enumerate(field_patterns)}
     
-    # Process lines in batches for better performance
-    for i, line in enumerate(lines):
+    line = next(lines, None)
+    line_columns = None  # split columns of `line`, computed on first use
+    next_line, next_columns, peeked = None, None, False
+    
+    while line is not None:
         # Skip empty lines
-        if not line.strip():
-            continue
-            
-        # Try to find field patterns in current line
-        for pattern, display_name in field_patterns.items():
-            if display_name in data:  # Skip if already found
-                continue
+        if line.strip():
+            # Find all field patterns in the current line in a single pass
+            found = field_matcher.find(line)
+            for pattern in sorted(found, key=field_order.__getitem__):
+                display_name = field_patterns[pattern]
+                if display_name in data:  # Skip if already found
+                    continue
                 
-            if pattern in line:
                 # Try to extract value from the same line
-                value = extract_value_from_line(line, pattern)
+                if line_columns is None:
+                    line_columns = split_line_columns(line)
+                value = extract_value_from_columns(line_columns, pattern)
                 
                 # If not found on same line, try next line
-                if not value and i + 1 < len(lines):
-                    value = extract_value_from_line(lines[i + 1], pattern, is_next_line=True)
+                if not value:
+                    if not peeked:
+                        next_line, peeked = next(lines, None), True
+                    if next_line is not None:
+                        if next_columns is None:
+                            next_columns = split_line_columns(next_line)
+                        value = extract_value_from_columns(next_columns, pattern, is_next_line=True)
                 
                 if value:
                     data[display_name] = value
                     logger.debug(f"Found {display_name}: {value}")
+            
+            # Stop early once every field has a value
+            if len(data) == len(field_patterns):
+                break
+        
+        # Advance, re-using the lookahead line (and its columns) if it was read
+        if peeked:
+            line, line_columns = next_line, next_columns
+        else:
+            line, line_columns = next(lines, None), None
+        next_line, next_columns, peeked = None, None, False
     
     return data
 
+def split_line_columns(line: str) -> List[List[str]]:
+    """Split a line once per separator in LINE_SEPARATORS."""
+    return [sep.split(line) for sep in LINE_SEPARATORS]
+
 def extract_value_from_line(line: str, pattern: str, is_next_line: bool = False) -> str:
     """Extract value from a line containing a pattern."""
+    return extract_value_from_columns(split_line_columns(line), pattern, is_next_line)
+
+def extract_value_from_columns(line_columns: List[List[str]], pattern: str, is_next_line: bool = False) -> str:
+    """Extract value from a line already split by split_line_columns()."""
     try:
         # Try different column separators
-        separators = [r"\s{2,}", r"\t+", r"\s*\|\s*", r"\s*;\s*"]
-        
-        for sep in separators:
-            columns = re.split(sep, line)
+        for columns in line_columns:
             for j, col in enumerate(columns):
                 if pattern in col:
                     # Try to get value from next column
@@ -226,8 +953,7 @@ def extract_value_from_line(line: str, pattern: str, is_next_line: bool = False)
         
         # If it's a next line and no pattern found, return first non-empty value
         if is_next_line:
-            for sep in separators:
-                columns = re.split(sep, line)
+            for columns in line_columns:
                 for col in columns:
                     value = col.strip()
                     if value and value != pattern:
@@ -238,66 +964,59 @@ def extract_value_from_line(line: str, pattern: str, is_next_line: bool = False)
     
     return ""
 
-def extract_fields_from_table_improved(df: pd.DataFrame) -> Dict[str, str]:
+def extract_fields_from_table_improved(df: pd.DataFrame, index: Optional[TableLabelIndex] = None,
+                                       schema: Optional[FieldSchema] = None) -> Dict[str, str]:
     """Improved table-based field extraction with better matching."""
     data = {}
+    schema = schema or FIELD_SCHEMA
+    label_col, value_col, fallback_col = schema.label_column, schema.value_column, schema.fallback_value_column
     
-    # Convert DataFrame to string for easier searching
-    df_str = df.astype(str)
+    # Build (or reuse) the label index instead of rescanning the table per field
+    if index is None:
+        index = TableLabelIndex(df, schema.table_matcher)
     
     # Based on the screenshot, this is a key-value pair table where:
-    # - Field names are in column B (index 1)
-    # - Values are in column D (index 3) and sometimes E (index 4)
+    # - Field names are in column B (schema label column)
+    # - Values are in column D (value column) and sometimes E (fallback value column)
     
     # First, let's analyze the table structure
     logger.info(f"Table shape: {df.shape}")
     logger.info(f"Number of columns: {len(df.columns)}")
     
     # Look for the key-value pattern: field names in column B, values in column D
-    for display_name, pattern in FIELDS:
+    for display_name, pattern in schema.fields:
         if display_name in data:  # Skip if already found
             continue
             
         value = ""
         
-        # Search for the field name in column B (index 1)
-        for row_idx, row in df_str.iterrows():
-            if len(row) > 1:  # Make sure column B exists
-                cell_b = str(row.iloc[1]).strip()  # Column B
-                if pattern in cell_b:
-                    # Found the field name in column B, now get the value from column D
-                    if len(row) > 3:  # Make sure column D exists
-                        cell_d = str(row.iloc[3]).strip()  # Column D
-                        if cell_d and cell_d != "nan" and cell_d != "<NA>" and cell_d != pattern:
-                            value = cell_d
-                            logger.debug(f"Found {display_name}: {value} at row {row_idx} (B->D)")
-                            break
-                    
-                    # If no value in column D, try column E
-                    if not value and len(row) > 4:
-                        cell_e = str(row.iloc[4]).strip()  # Column E
-                        if cell_e and cell_e != "nan" and cell_e != "<NA>" and cell_e != pattern:
-                            value = cell_e
-                            logger.debug(f"Found {display_name}: {value} at row {row_idx} (B->E)")
-                            break
+        # Rows with the field name in column B
+        for row_idx in index.rows_with(pattern, label_col):
+            # Found the field name in column B, now get the value from column D
+            value = index.value(row_idx, value_col, pattern)
+            if value:
+                logger.debug(f"Found {display_name}: {value} at row {row_idx} (B->D)")
+                break
+            
+            # If no value in column D, try column E
+            value = index.value(row_idx, fallback_col, pattern)
+            if value:
+                logger.debug(f"Found {display_name}: {value} at row {row_idx} (B->E)")
+                break
         
         data[display_name] = value
     
     # For any fields not found in the key-value pattern, try alternative approaches
-    for display_name, pattern in FIELDS:
+    for display_name, pattern in schema.fields:
         if display_name in data and data[display_name]:  # Skip if already found
             continue
             
         value = ""
         
-        # Search in all cells for the pattern
-        for i, row in df_str.iterrows():
-            for j, cell in enumerate(row):
-                if pattern in str(cell):
-                    # Try to get value from adjacent cells
-                    value = extract_value_from_table_cell(df_str, i, j, pattern)
-                    if value:
-                        break
+        # Every cell containing the pattern, in row-major order
+        for row_idx, col_idx in index.positions.get(pattern, ()):
+            # Try to get value from adjacent cells
+            value = extract_value_from_table_cell(df, row_idx, col_idx, pattern, index=index)
             if value:
                 break
         
@@ -359,50 +1078,44 @@ def extract_value_for_field(df: pd.DataFrame, row_idx: int, col_idx: int, patter
     
     return ""
 
-def extract_fields_from_key_value_table(df: pd.DataFrame) -> Dict[str, str]:
+def extract_fields_from_key_value_table(df: pd.DataFrame, index: Optional[TableLabelIndex] = None,
+                                       schema: Optional[FieldSchema] = None) -> Dict[str, str]:
     """Specialized extraction for key-value pair tables like the one in the screenshot."""
     data = {}
-    df_str = df.astype(str)
+    schema = schema or FIELD_SCHEMA
+    if index is None:
+        index = TableLabelIndex(df, schema.table_matcher)
     
     logger.info("Using specialized key-value table extraction")
     logger.info(f"Table shape: {df.shape}")
     logger.info(f"Columns: {len(df.columns)}")
     
     # Check if this is a multi-column table (like the one in your screenshot)
-    if len(df.columns) >= 4:
+    if len(df.columns) > schema.value_column:
         logger.info("Detected multi-column table structure - using enhanced extraction")
-        return extract_fields_from_multi_column_table(df)
+        return extract_fields_from_multi_column_table(df, index=index, schema=schema)
     
     # Fallback to original key-value extraction for simpler tables
     # Based on the screenshot analysis:
-    # - Field names are in column B (index 1)
-    # - Values are in column D (index 3) and sometimes E (index 4)
+    # - Field names are in column B (schema label column)
+    # - Values are in column D (value column) and sometimes E (fallback value column)
     
-    for display_name, pattern in FIELDS:
+    for display_name, pattern in schema.fields:
         value = ""
         
-        # Search for the field name in column B
-        for row_idx, row in df_str.iterrows():
-            if len(row) > 1:  # Ensure column B exists
-                cell_b = str(row.iloc[1]).strip()  # Column B
-                
-                # Check if this cell contains our field pattern
-                if pattern in cell_b:
-                    # Found the field name, now get the corresponding value
-                    if len(row) > 3:  # Ensure column D exists
-                        cell_d = str(row.iloc[3]).strip()  # Column D
-                        if cell_d and cell_d != "nan" and cell_d != "<NA>" and cell_d != pattern:
-                            value = cell_d
-                            logger.info(f"✓ {display_name}: {value} (from column D)")
-                            break
-                    
-                    # If no value in column D, try column E
-                    if not value and len(row) > 4:
-                        cell_e = str(row.iloc[4]).strip()  # Column E
-                        if cell_e and cell_e != "nan" and cell_e != "<NA>" and cell_e != pattern:
-                            value = cell_e
-                            logger.info(f"✓ {display_name}: {value} (from column E)")
-                            break
+        # Rows with the field name in column B
+        for row_idx in index.rows_with(pattern, schema.label_column):
+            # Found the field name, now get the corresponding value
+            value = index.value(row_idx, schema.value_column, pattern)
+            if value:
+                logger.info(f"✓ {display_name}: {value} (from column D)")
+                break
+            
+            # If no value in column D, try column E
+            value = index.value(row_idx, schema.fallback_value_column, pattern)
+            if value:
+                logger.info(f"✓ {display_name}: {value} (from column E)")
+                break
         
         data[display_name] = value
         if not value:
@@ -410,10 +1123,14 @@ def extract_fields_from_key_value_table(df: pd.DataFrame) -> Dict[str, str]:
     
     return data
 
-def extract_fields_from_multi_column_table(df: pd.DataFrame) -> Dict[str, str]:
+def extract_fields_from_multi_column_table(df: pd.DataFrame, index: Optional[TableLabelIndex] = None,
+                                          schema: Optional[FieldSchema] = None) -> Dict[str, str]:
     """Extract fields from multi-column tables with proper column separation."""
     data = {}
-    df_str = df.astype(str)
+    schema = schema or FIELD_SCHEMA
+    label_col, value_col = schema.label_column, schema.value_column
+    if index is None:
+        index = TableLabelIndex(df, schema.table_matcher)
     
     logger.info("Extracting from multi-column table structure")
     logger.info(f"Table shape: {df.shape}")
@@ -421,85 +1138,59 @@ def extract_fields_from_multi_column_table(df: pd.DataFrame) -> Dict[str, str]:
     # FIRST: Handle Min/Max fields with highest priority
     logger.info("=== STEP 1: Processing Min/Max fields ===")
     
-    # Search through ALL rows for Min/Max patterns
-    for row_idx, row in df_str.iterrows():
-        if len(row) > 3:  # Ensure we have enough columns
-            cell_b = str(row.iloc[1]).strip()  # Field name
-            cell_d = str(row.iloc[3]).strip()  # Value
-            
-            logger.debug(f"Row {row_idx}: Field='{cell_b}', Value='{cell_d}'")
-            
-            # Check for Ambient Temperature Min/Max
-            if "Ambient" in cell_b and "Temperature" in cell_b and ("Min" in cell_b or "Max" in cell_b):
-                logger.info(f"Found Ambient Temperature field: {cell_b}")
-                if cell_d and cell_d != "nan" and cell_d != "<NA>":
-                    min_val, max_val = split_min_max_value(cell_d)
-                    if min_val and max_val:
-                        data["Ambient Temperature"] = f"{min_val}/{max_val}"
-                        logger.info(f"✓ Ambient Temperature: {min_val}/{max_val}")
-                    else:
-                        data["Ambient Temperature"] = cell_d
-                        logger.warning(f"Could not split Ambient Temperature value: {cell_d}")
-            
-            # Check for Available Air Supply Pressure Min/Max
-            elif ("Available" in cell_b and "Supply" in cell_b and "Pressure" in cell_b) or \
-                 ("Available" in cell_b and "Air" in cell_b and "Pressure" in cell_b):
-                logger.info(f"Found Available Air Supply Pressure field: {cell_b}")
-                if cell_d and cell_d != "nan" and cell_d != "<NA>":
-                    min_val, max_val = split_min_max_value(cell_d)
-                    if min_val and max_val:
-                        data["Available Air Supply Pressure"] = f"{min_val}/{max_val}"
-                        logger.info(f"✓ Available Air Supply Pressure: {min_val}/{max_val}")
-                    else:
-                        data["Available Air Supply Pressure"] = cell_d
-                        logger.warning(f"Could not split Available Air Supply Pressure value: {cell_d}")
+    # Classify every row's field name (column B) at once; values come from column D
+    if index.n_cols > value_col and schema.min_max_rules:  # Ensure we have enough columns
+        def has(word):
+            return index.column_contains(label_col, word)
+        
+        # Each row belongs to the first min/max rule whose words it contains
+        row_field = {}
+        for display_name, all_words, any_words in schema.min_max_rules:
+            rows = pd.Series(True, index=range(index.n_rows))
+            for word in all_words:
+                rows &= has(word)
+            if any_words:
+                rows &= functools.reduce(operator.or_, (has(word) for word in any_words))
+            for row_idx in rows.to_numpy().nonzero()[0]:
+                row_field.setdefault(int(row_idx), display_name)
+        
+        # Later rows win, as in a top-to-bottom scan
+        for row_idx in sorted(row_field):
+            cell_b = index.cells[row_idx, label_col]
+            cell_d = index.value(row_idx, value_col)
+            display_name = row_field[row_idx]
+            logger.info(f"Found {display_name} field: {cell_b}")
+            if cell_d:
+                min_val, max_val = split_min_max_value(cell_d, schema)
+                if min_val and max_val:
+                    data[display_name] = f"{min_val}/{max_val}"
+                    logger.info(f"✓ {display_name}: {min_val}/{max_val}")
+                else:
+                    data[display_name] = cell_d
+                    logger.warning(f"Could not split {display_name} value: {cell_d}")
     
     # SECOND: Handle multi-column fields (flow conditions)
     logger.info("=== STEP 2: Processing multi-column fields ===")
     
-    multi_column_fields = {
-        "Flow Rate": ["Flow Rate", "18 Flow Rate"],
-        "Inlet Pressure": ["Inlet Pressure", "19 Inlet Pressure"],
-        "Pressure Drop": ["Pressure Drop", "20 Pressure Drop"],
-        "Inlet Temperature": ["Inlet Temperature", "21 Inlet Temperature"],
-        "Inlet Density / Specific Gravity / Molecular Mass": ["Inlet Density", "22 Inlet Density"],
-        "Inlet Viscosity": ["Inlet Viscosity", "24 Inlet Viscosity"],
-        "Inlet Vapour Pressure": ["Inlet Vapour Pressure", "26 Inlet Vapour Pressure"],
-        "Flow Coefficient Cv": ["Flow Coefficient Cv", "28 Flow Coefficient Cv"],
-        "Travel": ["Travel", "29 Travel"],
-        "Sound Pressure Level @ Maximum Flow": ["Sound Pressure Level", "30 Sound Pressure Level"]
-    }
-    
-    for display_name, search_patterns in multi_column_fields.items():
+    for display_name, search_patterns in schema.multi_column_fields.items():
         if display_name in data:  # Skip if already found
             continue
-            
-        values = []
         
-        for row_idx, row in df_str.iterrows():
-            if len(row) > 1:
-                cell_b = str(row.iloc[1]).strip()
-                
-                if any(pattern in cell_b for pattern in search_patterns):
-                    row_values = []
-                    
-                    # Extract from columns D, E, F
-                    for col_idx in [3, 4, 5]:  # D, E, F
-                        if len(row) > col_idx:
-                            cell_val = str(row.iloc[col_idx]).strip()
-                            if cell_val and cell_val != "nan" and cell_val != "<NA>":
-                                if col_idx == 3:
-                                    row_values.append(f"Max:{cell_val}")
-                                elif col_idx == 4:
-                                    row_values.append(f"Norm:{cell_val}")
-                                elif col_idx == 5:
-                                    row_values.append(f"Min:{cell_val}")
-                    
-                    if row_values:
-                        combined_value = " | ".join(row_values)
-                        data[display_name] = combined_value
-                        logger.info(f"✓ {display_name}: {combined_value}")
-                        break
+        rows = sorted({row_idx for pattern in search_patterns for row_idx in index.rows_with(pattern, label_col)})
+        for row_idx in rows:
+            row_values = []
+            
+            # Extract from the role columns (D, E, F: Max, Norm, Min)
+            for col_idx, role in schema.roles.items():
+                cell_val = index.value(row_idx, col_idx)
+                if cell_val:
+                    row_values.append(f"{role}:{cell_val}")
+            
+            if row_values:
+                combined_value = " | ".join(row_values)
+                data[display_name] = combined_value
+                logger.info(f"✓ {display_name}: {combined_value}")
+                break
         
         if display_name not in data:
             logger.debug(f"✗ {display_name}: Not found")
@@ -507,65 +1198,43 @@ def extract_fields_from_multi_column_table(df: pd.DataFrame) -> Dict[str, str]:
     # THIRD: Handle simple fields
     logger.info("=== STEP 3: Processing simple fields ===")
     
-    simple_fields = [
-        "Tag No.", "Service", "Line No.", "Area Classification", 
-        "Allowable Sound Pressure Level", "Tightness Requirements", 
-        "Power Failure Position"
-    ]
-    
-    for display_name, pattern in FIELDS:
+    for display_name, pattern in schema.fields:
         if display_name in data:  # Skip if already found
             continue
             
-        if display_name in simple_fields:
+        if display_name in schema.simple_fields:
             value = ""
             
-            for row_idx, row in df_str.iterrows():
-                if len(row) > 1:
-                    cell_b = str(row.iloc[1]).strip()
-                    
-                    if pattern in cell_b:
-                        if len(row) > 3:
-                            cell_d = str(row.iloc[3]).strip()
-                            if cell_d and cell_d != "nan" and cell_d != "<NA>" and cell_d != pattern:
-                                value = cell_d
-                                logger.info(f"✓ {display_name}: {value} (simple field)")
-                                break
+            for row_idx in index.rows_with(pattern, label_col):
+                value = index.value(row_idx, value_col, pattern)
+                if value:
+                    logger.info(f"✓ {display_name}: {value} (simple field)")
+                    break
             
             data[display_name] = value
     
     return data
 
-def split_min_max_value(concatenated_value: str) -> Tuple[str, str]:
-    """Split concatenated Min/Max values like '1242' into '12' and '42'."""
+def split_min_max_value(concatenated_value: str, schema: Optional[FieldSchema] = None) -> Tuple[str, str]:
+    """Split concatenated Min/Max values like '1242' into '12' and '42'.
+    
+    The known cases and digit splits (e.g. 2+2 digits: 1242 -> 12/42, 3+4 digits:
+    8001000 -> 800/1000) come from the schema's `min_max_split` rules.
+    """
+    schema = schema or FIELD_SCHEMA
     try:
         value = str(concatenated_value).strip()
         logger.info(f"Attempting to split Min/Max value: '{value}'")
         
         # Handle specific known cases first
-        if value == "1242":
-            logger.info("Found specific case: 1242 -> 12/42")
-            return "12", "42"
-        elif value == "8001000":
-            logger.info("Found specific case: 8001000 -> 800/1000")
-            return "800", "1000"
+        if value in schema.min_max_known:
+            min_val, max_val = schema.min_max_known[value]
+            logger.info(f"Found specific case: {value} -> {min_val}/{max_val}")
+            return min_val, max_val
         
         # Common patterns for Min/Max values
-        patterns = [
-            # Pattern: 2 digits + 2 digits (like 1242 -> 12/42)
-            (r'^(\d{2})(\d{2})$', 2, 2),
-            # Pattern: 3 digits + 4 digits (like 8001000 -> 800/1000)
-            (r'^(\d{3})(\d{4})$', 3, 4),
-            # Pattern: 1 digit + 2 digits (like 142 -> 1/42)
-            (r'^(\d{1})(\d{2})$', 1, 2),
-            # Pattern: 2 digits + 3 digits (like 12100 -> 12/100)
-            (r'^(\d{2})(\d{3})$', 2, 3),
-            # Pattern: 1 digit + 1 digit (like 12 -> 1/2)
-            (r'^(\d{1})(\d{1})$', 1, 1),
-        ]
-        
-        for pattern, min_len, max_len in patterns:
-            match = re.match(pattern, value)
+        for pattern, min_len, max_len in schema.min_max_digit_splits:
+            match = pattern.match(value)
             if match:
                 min_val = value[:min_len]
                 max_val = value[min_len:min_len + max_len]
@@ -573,7 +1242,7 @@ def split_min_max_value(concatenated_value: str) -> Tuple[str, str]:
                 return min_val, max_val
         
         # If no pattern matches, try to split at the middle
-        if len(value) >= 2:
+        if schema.min_max_split_middle and len(value) >= 2:
             mid = len(value) // 2
             min_val = value[:mid]
             max_val = value[mid:]
@@ -587,35 +1256,23 @@ def split_min_max_value(concatenated_value: str) -> Tuple[str, str]:
         logger.error(f"Error splitting Min/Max value '{concatenated_value}': {e}")
         return "", ""
 
-def extract_value_from_table_cell(df: pd.DataFrame, row_idx: int, col_idx: int, pattern: str) -> str:
-    """Extract value from table cell and its neighbors."""
+def extract_value_from_table_cell(df: pd.DataFrame, row_idx: int, col_idx: int, pattern: str,
+                                  index: Optional[TableLabelIndex] = None) -> str:
+    """Extract value from table cell and its neighbors (row_idx/col_idx are positional)."""
     try:
-        # Try right neighbor
-        if col_idx + 1 < len(df.columns):
-            value = str(df.iloc[row_idx, col_idx + 1]).strip()
-            if value and value != pattern and value != "nan" and value != "<NA>":
-                return value
-        
-        # Try bottom neighbor
-        if row_idx + 1 < len(df):
-            value = str(df.iloc[row_idx + 1, col_idx]).strip()
-            if value and value != pattern and value != "nan" and value != "<NA>":
-                return value
-        
-        # Try diagonal neighbor
-        if row_idx + 1 < len(df) and col_idx + 1 < len(df.columns):
-            value = str(df.iloc[row_idx + 1, col_idx + 1]).strip()
-            if value and value != pattern and value != "nan" and value != "<NA>":
-                return value
+        if index is None:
+            index = TableLabelIndex(df)
         
-        # Try left neighbor (for cases where value is before the field name)
-        if col_idx > 0:
-            value = str(df.iloc[row_idx, col_idx - 1]).strip()
-            if value and value != pattern and value != "nan" and value != "<NA>":
+        # Try right, bottom, diagonal, then left neighbor
+        # (the left one covers cases where the value is before the field name)
+        for neighbor_row, neighbor_col in ((row_idx, col_idx + 1), (row_idx + 1, col_idx),
+                                           (row_idx + 1, col_idx + 1), (row_idx, col_idx - 1)):
+            value = index.value(neighbor_row, neighbor_col, pattern)
+            if value:
                 return value
         
         # Extract from current cell if it contains more than just the pattern
-        current_cell = str(df.iloc[row_idx, col_idx])
+        current_cell = index.raw[row_idx, col_idx]
         if pattern != current_cell:
             # Try to extract value after the pattern in the same cell
             value = current_cell.replace(pattern, "").strip()
@@ -633,14 +1290,39 @@ def extract_value_from_table_cell(df: pd.DataFrame, row_idx: int, col_idx: int,
     
     return ""
 
+# Leading characters that make Excel treat a cell as a formula
+EXCEL_FORMULA_PREFIXES = ('=', '+', '-', '@')
+
 def escape_excel_formula(val):
     """Escape Excel formulas to prevent execution."""
-    if isinstance(val, str) and val and val[0] in ('=', '+', '-', '@'):
+    if isinstance(val, str) and val and val[0] in EXCEL_FORMULA_PREFIXES:
         return "'" + val
     return val
 
-def debug_table_structure(df: pd.DataFrame, output_folder: str, filename: str):
-    """Debug function to analyze table structure and save detailed analysis."""
+def escape_excel_formulas(df: pd.DataFrame) -> pd.DataFrame:
+    """escape_excel_formula applied to every cell of a DataFrame at once.
+    
+    Returns `df` itself when no cell needs escaping.
+    """
+    values = df.to_numpy(dtype=object)
+    try:
+        formulas = pd.Series(values.ravel(), dtype=object) \
+            .str.startswith(EXCEL_FORMULA_PREFIXES, na=False).to_numpy(dtype=bool).reshape(df.shape)
+    except AttributeError:  # no string cells at all
+        return df
+    if not formulas.any():
+        return df
+    values = values.copy()
+    values[formulas] = "'" + values[formulas]
+    return pd.DataFrame(values, index=df.index, columns=df.columns)
+
+def debug_table_structure(df: pd.DataFrame, output_folder: str, filename: str,
+                          index: Optional[TableLabelIndex] = None):
+    """Write a readable analysis of a table to {name}_debug.txt.
+    
+    Not run by the pipeline; see Diagnostics for the structured traces. Label
+    positions come from `index` (a TableLabelIndex of `df`) if given.
+    """
     try:
         debug_info = []
         debug_info.append(f"Table Analysis for {filename}")
@@ -673,41 +1355,26 @@ def debug_table_structure(df: pd.DataFrame, output_folder: str, filename: str):
         # Field pattern matching analysis
         debug_info.append("FIELD PATTERN MATCHING:")
         debug_info.append("-" * 30)
+        index = index or TableLabelIndex(df)
         for display_name, pattern in FIELDS[:15]:  # First 15 fields for brevity
-            found = False
-            
-            # Search through all rows and columns
-            for row_idx, row in df.iterrows():
-                for col_idx, cell in enumerate(row):
-                    if pattern in str(cell):
-                        found = True
-                        debug_info.append(f"  {display_name}: Found at row {row_idx}, column {col_idx} = '{cell}'")
-                        
-                        # Also check what's in adjacent cells
-                        if col_idx + 1 < len(df.columns):
-                            right_cell = str(df.iloc[row_idx, col_idx + 1]).strip()
-                            if right_cell and right_cell != "nan" and right_cell != "<NA>":
-                                debug_info.append(f"    -> Right neighbor: '{right_cell}'")
-                        
-                        if col_idx + 2 < len(df.columns):
-                            right2_cell = str(df.iloc[row_idx, col_idx + 2]).strip()
-                            if right2_cell and right2_cell != "nan" and right2_cell != "<NA>":
-                                debug_info.append(f"    -> Right+1 neighbor: '{right2_cell}'")
-                        
-                        if row_idx + 1 < len(df):
-                            bottom_cell = str(df.iloc[row_idx + 1, col_idx]).strip()
-                            if bottom_cell and bottom_cell != "nan" and bottom_cell != "<NA>":
-                                debug_info.append(f"    -> Bottom neighbor: '{bottom_cell}'")
-                        
-                        break
-                if found:
-                    break
-            
-            if not found:
+            positions = index.positions.get(pattern)
+            if not positions:
                 debug_info.append(f"  {display_name}: NOT FOUND")
+                continue
+            
+            row_idx, col_idx = positions[0]
+            debug_info.append(f"  {display_name}: Found at row {row_idx}, column {col_idx} = '{index.raw[row_idx, col_idx]}'")
+            # Also show what's in adjacent cells
+            for name, (neighbor_row, neighbor_col) in (('Right', (row_idx, col_idx + 1)),
+                                                       ('Right+1', (row_idx, col_idx + 2)),
+                                                       ('Bottom', (row_idx + 1, col_idx))):
+                neighbor = index.value(neighbor_row, neighbor_col)
+                if neighbor:
+                    debug_info.append(f"    -> {name} neighbor: '{neighbor}'")
         
         # Save debug info
         debug_file = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}_debug.txt")
+        os.makedirs(os.path.dirname(debug_file), exist_ok=True)
         with open(debug_file, 'w', encoding='utf-8') as f:
             f.write('\n'.join(debug_info))
         
@@ -716,209 +1383,1655 @@ def debug_table_structure(df: pd.DataFrame, output_folder: str, filename: str):
     except Exception as e:
         logger.error(f"Error in debug analysis: {e}")
 
-def try_camelot_extraction(pdf_path: str) -> Tuple[bool, Optional[pd.DataFrame], str]:
-    """Try multiple Camelot extraction methods for better table detection."""
-    if not camelot_available:
-        return False, None, "Camelot not available"
-    
-    # Try different Camelot flavors and parameters with better table preservation
-    extraction_methods = [
-        ('lattice', {'pages': 'all', 'line_scale': 40}),  # Better for structured tables
-        ('stream', {'pages': 'all', 'edge_tol': 500, 'row_tol': 10}),
-        ('lattice', {'pages': 'all', 'line_scale': 60}),
-        ('stream', {'pages': 'all', 'edge_tol': 300, 'row_tol': 5}),
-        ('stream', {'pages': '1-3', 'edge_tol': 500, 'row_tol': 10}),
-    ]
+class Diagnostics:
+    """Opt-in per-document diagnostics, written as structured JSON traces.
     
-    best_df = None
-    best_score = 0
-    best_method = ""
+    Off unless enabled for every file (`all_files`), for files whose relative path
+    or name matches one of the `include` globs, or for a random `sample_percent`
+    of files. The sample is drawn from a hash of the relative path, so every
+    worker and every rerun picks the same files. Traces are written to
+    Output/.diagnostics/{relative path}.json (see document_trace).
+    """
     
-    for flavor, params in extraction_methods:
-        try:
-            logger.debug(f"Trying Camelot with flavor: {flavor}, params: {params}")
-            tables = camelot.read_pdf(pdf_path, flavor=flavor, **params)
-            
-            if tables and len(tables) > 0:
-                # Evaluate each table and find the best one
-                for table in tables:
-                    df = table.df
-                    
-                    # Calculate a score based on table quality
-                    score = len(df) * len(df.columns)  # Basic score
-                    
-                    # Bonus for tables with more columns (better structure)
-                    if len(df.columns) >= 4:
-                        score *= 1.5
-                    
-                    # Bonus for tables with numeric data
-                    numeric_cells = 0
-                    total_cells = 0
-                    for i, row in df.iterrows():
-                        for j, cell in enumerate(row):
-                            if str(cell).strip():
-                                total_cells += 1
-                                try:
-                                    float(str(cell).replace(',', ''))
-                                    numeric_cells += 1
-                                except:
-                                    pass
-                    
-                    if total_cells > 0:
-                        numeric_ratio = numeric_cells / total_cells
-                        score *= (1 + numeric_ratio)
-                    
-                    if score > best_score:
-                        best_score = score
-                        best_df = df.copy()
-                        best_method = f"{flavor} flavor"
-                
-        except Exception as e:
-            logger.debug(f"Camelot extraction failed with {flavor}: {e}")
-            continue
+    def __init__(self, all_files: bool = False, include: Optional[List[str]] = None, sample_percent: float = 0.0):
+        self.all_files = all_files
+        self.include = [pattern.lower() for pattern in include or []]
+        self.sample_percent = sample_percent
     
-    if best_df is not None:
-        # Clean the DataFrame while preserving structure
-        best_df = best_df.applymap(escape_excel_formula)
-        best_df = best_df.replace('', pd.NA)
-        
-        # Only drop completely empty rows/columns
-        best_df = best_df.dropna(how='all')
-        best_df = best_df.dropna(axis=1, how='all')
-        
-        if len(best_df) > 0 and len(best_df.columns) > 0:
-            return True, best_df, f"Success with {best_method}"
+    def wants(self, relative_path: str) -> bool:
+        """Whether to trace the document at `relative_path`."""
+        if self.all_files or (self.include and _glob_match(relative_path, self.include)):
+            return True
+        if self.sample_percent <= 0:
+            return False
+        bucket = int(hashlib.sha1(relative_path.encode('utf-8')).hexdigest()[:8], 16) % 10000
+        return bucket < self.sample_percent * 100
     
-    return False, None, "All Camelot methods failed"
+    def write(self, output_folder: str, relative_path: str, trace: Dict) -> str:
+        trace_file = os.path.join(output_folder, '.diagnostics', f"{os.path.splitext(relative_path)[0]}.json")
+        os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+        with open(trace_file, 'w', encoding='utf-8') as f:
+            json.dump(trace, f, indent=2, ensure_ascii=False, default=str)
+        return trace_file
 
-def process_single_pdf(pdf_path: str, output_folder: str) -> Dict[str, any]:
-    """Process a single PDF file with comprehensive extraction methods."""
-    pdf_file = os.path.basename(pdf_path)
-    result = {
-        'filename': pdf_file,
-        'success': False,
-        'method': 'none',
-        'output_file': '',
-        'error': '',
-        'extraction_time': 0
+def table_trace(index: TableLabelIndex, schema: Optional[FieldSchema] = None) -> Dict:
+    """Shape, header row and label hit positions of the chosen table, from its label index."""
+    schema = schema or FIELD_SCHEMA
+    labels = {}
+    for display_name, label in schema.fields:
+        positions = index.positions.get(label)
+        if positions:
+            row_idx, col_idx = positions[0]
+            labels[display_name] = {
+                'label': label,
+                'positions': [list(position) for position in positions],
+                'right': index.value(row_idx, col_idx + 1),
+                'right2': index.value(row_idx, col_idx + 2),
+                'below': index.value(row_idx + 1, col_idx),
+            }
+    return {
+        'shape': [index.n_rows, index.n_cols],
+        'header': [str(cell) for cell in index.raw[0]] if index.n_rows else [],
+        'labels': labels,
+        'labels_missing': [display_name for display_name, _ in schema.fields if display_name not in labels],
     }
+
+def document_trace(result: Dict, artifacts: Optional[Dict] = None,
+                   table_index: Optional[TableLabelIndex] = None, schema: Optional[FieldSchema] = None) -> Dict:
+    """Structured diagnostics for one document: outcome, Camelot candidates and label positions.
     
-    start_time = time.time()
+    Candidate tables are listed with their strategy, parameters, score, label count
+    and shape; the chosen one is flagged. `table_index` is the label index built
+    during field matching, so the table is not scanned again.
+    """
+    candidates = (artifacts or {}).get('candidates') or []
+    winner = best_candidate(candidates) if artifacts and artifacts.get('table') is not None else None
+    fields_data = result.get('fields') or {}
+    return {
+        'file': result.get('relative_path', result['filename']),
+        'success': result['success'],
+        'method': result.get('method'),
+        'error': result.get('error', ''),
+        'cache_hit': result.get('cache_hit', False),
+        'table_pages': result.get('table_pages', ''),
+        'strategies_tried': result.get('strategies_tried', []),
+        'chosen_strategy': result.get('camelot_strategy', ''),
+        'candidates': [{
+            'strategy': candidate['strategy'],
+            'params': candidate['params'],
+            'score': round(candidate['score'], 2),
+            'labels': candidate['labels'],
+            'shape': list(candidate['df'].shape),
+            'chosen': candidate is winner,
+        } for candidate in candidates],
+        'table': table_trace(table_index, schema) if table_index is not None else None,
+        'fields_found': result.get('fields_found', 0),
+        'fields_missing': [name for name, value in fields_data.items() if not value and name != 'Filename'],
+        'timings': result.get('timings', {}),
+    }
+
+# Camelot strategies in default order: (name, flavor, read_pdf keyword arguments). The
+# 'vector' lattice (see ParseSession.read_pdf) needs no page rendering, so it goes first;
+# the image-based lattices remain for tables whose rulings it cannot read
+CAMELOT_STRATEGIES = [
+    ('vector-40', 'vector', {'pages': 'all', 'line_scale': 40}),
+    ('lattice-40', 'lattice', {'pages': 'all', 'line_scale': 40}),  # Better for structured tables
+    ('stream-500-10', 'stream', {'pages': 'all', 'edge_tol': 500, 'row_tol': 10}),
+    ('lattice-60', 'lattice', {'pages': 'all', 'line_scale': 60}),
+    ('stream-300-5', 'stream', {'pages': 'all', 'edge_tol': 300, 'row_tol': 5}),
+    ('stream-first-pages', 'stream', {'pages': '1-3', 'edge_tol': 500, 'row_tol': 10}),
+]
+
+# A candidate table containing at least this many distinct FIELDS labels is good
+# enough to stop trying further strategies
+EARLY_EXIT_MIN_LABELS = 10
+
+# What float() accepts once thousands separators are removed: optional sign and
+# surrounding whitespace, digits with single underscores, an optional fraction and
+# exponent, or inf/infinity/nan in any case
+NUMERIC_CELL_RE = re.compile(
+    r"\s*[+-]?(?:(?:\d(?:_?\d)*(?:\.(?:\d(?:_?\d)*)?)?|\.\d(?:_?\d)*)(?:[eE][+-]?\d(?:_?\d)*)?"
+    r"|(?i:inf(?:inity)?|nan))\s*"
+)
+
+def score_tables(dfs: List[pd.DataFrame]) -> List[float]:
+    """Score candidate tables in one pass: bigger, wider and more numeric tables score higher.
     
-    try:
-        logger.info(f"Processing: {pdf_file}")
+    The cells of all tables are stringified, stripped and matched against
+    NUMERIC_CELL_RE as one Series, then counted per table, so scoring costs a
+    handful of pandas string operations however many candidates a document has.
+    """
+    if not dfs:
+        return []
+    sizes = [df.size for df in dfs]
+    cells = pd.Series(
+        np.concatenate([df.astype(str).to_numpy(dtype=object).ravel() for df in dfs]), dtype=object)
+    non_empty = (cells.str.strip() != '').to_numpy(dtype=bool)
+    numeric = np.zeros(len(cells), dtype=bool)
+    numeric[non_empty] = cells[non_empty].str.replace(',', '', regex=False) \
+        .str.fullmatch(NUMERIC_CELL_RE).to_numpy(dtype=bool)
+    
+    table_ids = np.repeat(np.arange(len(dfs)), sizes)
+    total_cells = np.bincount(table_ids, weights=non_empty, minlength=len(dfs)).astype(int)
+    numeric_cells = np.bincount(table_ids, weights=numeric, minlength=len(dfs)).astype(int)
+    
+    scores = []
+    for df, total, numerics in zip(dfs, total_cells.tolist(), numeric_cells.tolist()):
+        score = len(df) * len(df.columns)  # Basic score
         
-        # Try Camelot table extraction first
-        camelot_success, table_df, camelot_message = try_camelot_extraction(pdf_path)
+        # Bonus for tables with more columns (better structure)
+        if len(df.columns) >= 4:
+            score *= 1.5
         
-        if camelot_success and table_df is not None:
-            # Debug table structure
-            debug_table_structure(table_df, output_folder, pdf_file)
-            
-            # Try specialized key-value table extraction first
-            fields_data = extract_fields_from_key_value_table(table_df)
-            
-            # If that didn't work well, try the improved general method
-            if not any(fields_data.values()):
-                logger.info("Key-value extraction failed, trying general method")
-                fields_data = extract_fields_from_table_improved(table_df)
-            
-            fields_data['Filename'] = pdf_file
+        # Bonus for tables with numeric data
+        if total > 0:
+            score *= (1 + numerics / total)
+        scores.append(score)
+    return scores
+
+def score_table(df: pd.DataFrame) -> float:
+    """Score a single candidate table; see score_tables."""
+    return score_tables([df])[0]
+
+def count_table_labels(df: pd.DataFrame, schema: Optional[FieldSchema] = None) -> int:
+    """Number of distinct `schema` labels that occur anywhere in a table."""
+    return len((schema or FIELD_SCHEMA).field_matcher.find("\n".join(df.astype(str).to_numpy().ravel())))
+
+def document_signature(pdf_path: str, session: Optional[ParseSession] = None) -> str:
+    """Cheap fingerprint of a document's origin, used to group similar documents."""
+    try:
+        reader = (session or ParseSession(pdf_path)).reader
+        metadata = reader.metadata or {}
+        first_page = reader.pages[0].mediabox if len(reader.pages) else None
+        size = f"{round(float(first_page.width))}x{round(float(first_page.height))}" if first_page else "?"
+        return "|".join([
+            str(metadata.get('/Producer', '')),
+            str(metadata.get('/Creator', '')),
+            size,
+            str(min(len(reader.pages), 10)),  # page counts above 10 look alike
+        ])
+    except Exception as e:
+        logger.debug(f"Could not read signature of {pdf_path}: {e}")
+        return ""
+
+class StrategyPlanner:
+    """Orders the Camelot strategies per document and decides when to stop early.
+    
+    The strategy that produced the winning table for a document signature is
+    tried first for later documents with the same signature. Each worker process
+    keeps its own planner, so memory builds up as a warm worker handles its chunks.
+    """
+    
+    def __init__(self, strategies: List = CAMELOT_STRATEGIES, min_labels: int = EARLY_EXIT_MIN_LABELS,
+                 max_memory: int = 1024):
+        self.strategies = strategies
+        self.min_labels = min_labels
+        self.max_memory = max_memory
+        self.winners = {}  # document signature -> winning strategy name
+    
+    def plan(self, signature: str) -> List:
+        """Strategies in the order to try them: the remembered winner first."""
+        winner = self.winners.get(signature)
+        return sorted(self.strategies, key=lambda strategy: strategy[0] != winner)
+    
+    def is_good_enough(self, candidate: Dict) -> bool:
+        """Whether a candidate table clears the early-exit quality threshold."""
+        return candidate['labels'] >= self.min_labels
+    
+    def record(self, signature: str, strategy_name: str):
+        """Remember the strategy that won for a document signature."""
+        self.winners.pop(signature, None)
+        self.winners[signature] = strategy_name
+        if len(self.winners) > self.max_memory:
+            del self.winners[next(iter(self.winners))]  # forget the oldest entry
+
+# Per-process planner shared by every document a worker handles
+strategy_planner = StrategyPlanner()
+
+def collect_camelot_candidates(pdf_path: str, planner: Optional[StrategyPlanner] = None,
+                               early_exit: bool = True, pages: str = 'all',
+                               session: Optional[ParseSession] = None,
+                               schema: Optional[FieldSchema] = None) -> Tuple[List[Dict], List[str]]:
+    """Run Camelot strategies in planned order and return (candidate tables, strategies tried).
+    
+    With `early_exit`, no further strategies are run once one produces a table
+    that the planner considers good enough (counting the labels of `schema`). A `pages` selection other than 'all'
+    (see select_table_pages) replaces every strategy's page range; strategies that
+    become identical under it are only run once. All strategies share one
+    ParseSession (`session`, or one opened for this call), so every page is split
+    out and laid out by pdfminer once.
+    """
+    candidates = []
+    tried = []
+    seen = set()
+    if not camelot_available:
+        return candidates, tried
+    
+    planner = planner or strategy_planner
+    with parse_session(pdf_path, session) as session:
+        signature = document_signature(pdf_path, session=session)
+        
+        # Try different Camelot flavors and parameters with better table preservation
+        for name, flavor, params in planner.plan(signature):
+            if pages != 'all':
+                params = dict(params, pages=pages)
+                params_key = (flavor, json.dumps(params, sort_keys=True))
+                if params_key in seen:
+                    continue
+                seen.add(params_key)
+            tried.append(name)
+            try:
+                logger.debug(f"Trying Camelot strategy {name}: flavor={flavor}, params={params}")
+                with span(f"camelot/{name}"):
+                    tables = session.read_pdf(flavor=flavor, **params)
+                
+                # Evaluate the strategy's tables together
+                with span('score_tables'):
+                    table_dfs = [table.df for table in tables]
+                    for table_df, score in zip(table_dfs, score_tables(table_dfs)):
+                        candidates.append({
+                            'strategy': name,
+                            'method': f"{flavor} flavor",
+                            'params': params,
+                            'score': score,
+                            'labels': count_table_labels(table_df, schema),
+                            'df': table_df.copy(),
+                        })
             
-            # Save both table and extracted fields
-            base_name = os.path.splitext(pdf_file)[0]
+            except Exception as e:
+                logger.debug(f"Camelot extraction failed with {name}: {e}")
+                continue
             
-            # Save full table
-            table_output = os.path.join(output_folder, f"{base_name}_table.xlsx")
-            table_df.to_excel(table_output, index=False, header=False)
+            if early_exit and any(c['strategy'] == name and planner.is_good_enough(c) for c in candidates):
+                logger.debug(f"Strategy {name} produced a good enough table, skipping the rest")
+                break
+    
+    best = best_candidate(candidates)
+    if best is not None:
+        planner.record(signature, best['strategy'])
+    
+    return candidates, tried
+
+def best_candidate(candidates: List[Dict]) -> Optional[Dict]:
+    """Highest-scoring candidate (the first one on ties), or None."""
+    best = None
+    best_score = 0
+    for candidate in candidates:
+        if candidate['score'] > best_score:
+            best_score = candidate['score']
+            best = candidate
+    return best
+
+def select_best_table(candidates: List[Dict]) -> Tuple[bool, Optional[pd.DataFrame], str]:
+    """Pick the highest-scoring candidate table and clean it for field extraction."""
+    best = best_candidate(candidates)
+    
+    if best is not None:
+        # Clean the DataFrame while preserving structure
+        best_df = best['df'].replace('', pd.NA)
+        
+        # Only drop completely empty rows/columns
+        best_df = best_df.dropna(how='all')
+        best_df = best_df.dropna(axis=1, how='all')
+        
+        if len(best_df) > 0 and len(best_df.columns) > 0:
+            return True, best_df, f"Success with {best['method']}"
+    
+    return False, None, "All Camelot methods failed"
+
+def try_camelot_extraction(pdf_path: str) -> Tuple[bool, Optional[pd.DataFrame], str]:
+    """Try multiple Camelot extraction methods for better table detection."""
+    if not camelot_available:
+        return False, None, "Camelot not available"
+    
+    candidates, _ = collect_camelot_candidates(pdf_path)
+    return select_best_table(candidates)
+
+# Bump when the layout of stored artifacts or the way they are produced changes
+ARTIFACT_VERSION = 4
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's bytes, read in 1 MiB blocks."""
+    content_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+class ArtifactStore:
+    """Content-addressed on-disk store of intermediate extraction artifacts.
+    
+    Entries are keyed by the SHA-256 of the PDF bytes plus a digest of the extractor
+    settings, and hold the Camelot candidate tables, the chosen table, the page texts
+    and the winning method. That lets field-matching changes be re-run without parsing
+    the PDFs again. Reads refresh an entry's mtime; once the store grows past
+    `max_bytes`, the least recently used entries are evicted (checked on about one in
+    `evict_every` writes). The store only holds
+    paths and limits, so it can be passed to pool workers.
+    """
+    
+    def __init__(self, root: str, max_bytes: int = 2 * 1024 ** 3, evict_every: int = 50):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        os.makedirs(root, exist_ok=True)
+    
+    @staticmethod
+    def settings_digest(chunk_size: int = 5, schema: Optional[FieldSchema] = None) -> str:
+        """Digest of every setting that influences the stored artifacts.
+        
+        The schema's search labels are included, since the page pre-filter and the
+        early exit count them; its other matching rules are not, so they can be
+        re-matched over the cache.
+        """
+        labels = sorted(label for _, label in (schema or FIELD_SCHEMA).fields)
+        settings = {'version': ARTIFACT_VERSION, 'strategies': CAMELOT_STRATEGIES, 'labels': labels,
+                    'early_exit_min_labels': EARLY_EXIT_MIN_LABELS, 'chunk_size': chunk_size,
+                    'prefilter': [PREFILTER_MIN_DOC_PAGES, PREFILTER_TOP_PAGES, PREFILTER_MIN_LABELS],
+                    'window_pages': CAMELOT_WINDOW_PAGES}
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    
+    def key_for(self, pdf_path: str, chunk_size: int = 5, schema: Optional[FieldSchema] = None) -> str:
+        """Store key for a PDF: content hash plus settings digest."""
+        return f"{file_sha256(pdf_path)}-{self.settings_digest(chunk_size, schema)}"
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.pkl")
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Load the artifacts for `key`, or None if they are not stored."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                artifacts = pickle.load(f)
+            os.utime(path)  # mark as recently used
+            return artifacts
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable artifact entry {path}: {e}")
+            return None
+    
+    def put(self, key: str, artifacts: Dict):
+        """Store artifacts atomically, evicting old entries when over the size budget."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(artifacts, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not store artifacts for {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        
+        # Sample eviction scans so their cost is amortized across all workers' writes
+        if random.random() * self.evict_every < 1:
+            self.evict()
+    
+    def evict(self):
+        """Delete least recently used entries until the store fits in `max_bytes`."""
+        entries = []
+        total_bytes = 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.pkl'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_bytes += stat.st_size
+        
+        if total_bytes <= self.max_bytes:
+            return
+        
+        for mtime, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Already evicted by another worker
+            total_bytes -= size
+            if total_bytes <= self.max_bytes:
+                break
+        logger.info(f"Artifact store evicted entries down to {total_bytes / 1024 ** 2:.1f} MB")
+
+# Documents whose Camelot pass would cover more pages than this are read in windows
+# of this many pages, so Camelot never holds every page's layout and image at once
+CAMELOT_WINDOW_PAGES = 10
+
+def page_windows(total_pages: int, window: int = CAMELOT_WINDOW_PAGES) -> List[str]:
+    """Camelot `pages` arguments covering 1..total_pages in consecutive windows."""
+    windows = []
+    for start in range(1, total_pages + 1, window):
+        end = min(start + window - 1, total_pages)
+        windows.append(f"{start}-{end}" if end > start else str(start))
+    return windows
+
+def collect_camelot_candidates_windowed(pdf_path: str, total_pages: int, planner: Optional[StrategyPlanner] = None,
+                                        window: int = CAMELOT_WINDOW_PAGES,
+                                        session: Optional[ParseSession] = None,
+                                        schema: Optional[FieldSchema] = None) -> Tuple[List[Dict], List[str], str]:
+    """Run collect_camelot_candidates() one page window at a time.
+    
+    Stops after the first window that produces a good enough table. Returns
+    (candidates, strategies tried, windows scanned as a Camelot pages string).
+    Page layouts are released after each window.
+    """
+    planner = planner or strategy_planner
+    candidates, tried, scanned = [], [], []
+    with parse_session(pdf_path, session) as session:
+        for pages in page_windows(total_pages, window):
+            window_candidates, window_tried = collect_camelot_candidates(pdf_path, planner=planner, pages=pages,
+                                                                         session=session, schema=schema)
+            session.release_layouts()
+            candidates.extend(window_candidates)
+            tried.extend(name for name in window_tried if name not in tried)
+            scanned.append(pages)
+            if any(planner.is_good_enough(candidate) for candidate in window_candidates):
+                break
+    return candidates, tried, ','.join(scanned)
+
+def extract_artifacts(pdf_path: str, page_prefilter: bool = True, page_texts: Optional[List[str]] = None,
+                      total_pages: Optional[int] = None, keep_page_texts: bool = True,
+                      session: Optional[ParseSession] = None, schema: Optional[FieldSchema] = None) -> Dict:
+    """Run the expensive parsing stages: Camelot candidates, chosen table, and page texts.
+    
+    With `page_prefilter`, long documents are pre-scanned through the text layer and
+    only their best-scoring pages are handed to Camelot. Page texts (and the page
+    count) that the caller already extracted are re-used instead of read again.
+    Without `keep_page_texts`, page texts are not materialized just for the text
+    fallback; 'page_texts' is then None unless the pre-scan produced them, and the
+    caller streams the pages itself. Camelot passes over more than
+    CAMELOT_WINDOW_PAGES pages are run window by window. Every stage reads the
+    document through one ParseSession (`session`, or one opened for this call).
+    The pre-filter and the Camelot early exit count the labels of `schema`.
+    """
+    with parse_session(pdf_path, session) as session:
+        table_pages = 'all'
+        with span('page_prefilter'):
+            if total_pages is None and page_prefilter:
+                total_pages = count_pdf_pages(pdf_path, session=session)
+            if page_prefilter and total_pages > PREFILTER_MIN_DOC_PAGES:
+                if page_texts is None:
+                    page_texts = extract_page_texts(pdf_path, session=session)
+                table_pages = select_table_pages(page_texts, schema=schema)
+                logger.info(f"Page pre-filter selected pages: {table_pages}")
+        
+        if camelot_available:
+            if table_pages == 'all' and total_pages is None:
+                total_pages = count_pdf_pages(pdf_path, session=session)
+            if table_pages == 'all' and total_pages > CAMELOT_WINDOW_PAGES:
+                # Oversized for one pass (e.g. scanned packages the pre-filter cannot rank)
+                logger.info(f"Reading {total_pages} pages with Camelot in windows of {CAMELOT_WINDOW_PAGES}")
+                candidates, tried, table_pages = collect_camelot_candidates_windowed(pdf_path, total_pages,
+                                                                                      session=session, schema=schema)
+            else:
+                candidates, tried = collect_camelot_candidates(pdf_path, pages=table_pages, session=session,
+                                                               schema=schema)
+            with span('select_best_table'):
+                camelot_success, table_df, camelot_message = select_best_table(candidates)
+        else:
+            candidates, tried, camelot_success, table_df, camelot_message = [], [], False, None, "Camelot not available"
+        winner = best_candidate(candidates) if camelot_success else None
+        
+        # Page texts are needed for the text fallback; re-use the pre-scan if there was one
+        if not camelot_success and page_texts is None and keep_page_texts:
+            with span('page_texts'):
+                page_texts = extract_page_texts(pdf_path, session=session)
+    
+    return {
+        'version': ARTIFACT_VERSION,
+        'candidates': candidates,
+        'strategies_tried': tried,
+        'strategy': winner['strategy'] if winner else '',
+        'table': table_df if camelot_success else None,
+        'table_pages': table_pages,
+        'camelot_message': camelot_message,
+        'method': 'camelot' if camelot_success else 'text',
+        'page_texts': page_texts,
+    }
+
+# Template fingerprinting: label positions are quantized to TEMPLATE_GRID points, a
+# page needs TEMPLATE_MIN_LABELS distinct labels to be fingerprinted, and cached
+# value regions match text fragments within TEMPLATE_TOLERANCE points
+TEMPLATE_GRID = 5
+TEMPLATE_MIN_LABELS = 8
+TEMPLATE_TOLERANCE = 2.0
+
+MIN_MAX_VALUE_RE = re.compile(r"^(.+?)/(.+)$")
+
+def extract_page_layouts(pdf_path: str, session: Optional[ParseSession] = None) -> List[Dict]:
+    """Extract each page's text together with its positioned text fragments.
+    
+    Returns one dict per page: {'page': number, 'text': page text,
+    'fragments': [(x, y, text), ...]} with positions in PDF user space. With a
+    `session`, the page texts are kept in it for the later stages.
+    """
+    try:
+        session = session or ParseSession(pdf_path)
+        reader = session.reader
+        layouts = []
+        for page_num, page in enumerate(reader.pages, 1):
+            fragments = []
             
-            # Save extracted fields
-            fields_df = pd.DataFrame([fields_data])
-            fields_output = os.path.join(output_folder, f"{base_name}_fields.xlsx")
-            fields_df.to_excel(fields_output, index=False)
+            def visit(text, cm, tm, font_dict, font_size, fragments=fragments):
+                if text.strip():
+                    x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+                    y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+                    fragments.append((round(x, 1), round(y, 1), text))
             
-            result.update({
-                'success': True,
-                'method': 'camelot',
-                'output_file': fields_output,
-                'table_file': table_output,
-                'fields_found': len([v for v in fields_data.values() if v]),
-                'total_fields': len(FIELDS)
-            })
+            try:
+                page_text = page.extract_text(visitor_text=visit)
+            except Exception as e:
+                logger.warning(f"Error extracting text from page {page_num}: {e}")
+                continue
+            session.page_texts[page_num] = page_text or ""
+            layouts.append({'page': page_num, 'text': page_text or "", 'fragments': fragments})
+        return layouts
+    except Exception as e:
+        logger.error(f"Error reading PDF {pdf_path}: {str(e)}")
+        return []
+
+def page_texts_from_layouts(page_layouts: List[Dict]) -> List[str]:
+    """Page texts in the format returned by extract_page_texts()."""
+    return [f"--- PAGE {layout['page']} ---\n{layout['text']}\n" for layout in page_layouts if layout['text']]
+
+def layout_fingerprint(page_layout: Dict, schema: Optional[FieldSchema] = None) -> Optional[str]:
+    """Fingerprint of a page's template: which `schema` labels sit where (None if too few labels)."""
+    matcher = (schema or FIELD_SCHEMA).field_matcher
+    entries = set()
+    for x, y, text in page_layout['fragments']:
+        for label in matcher.find(text):
+            entries.add((label, round(x / TEMPLATE_GRID), round(y / TEMPLATE_GRID)))
+    if len({label for label, _, _ in entries}) < TEMPLATE_MIN_LABELS:
+        return None
+    return hashlib.sha1(json.dumps(sorted(entries)).encode('utf-8')).hexdigest()
+
+def find_anchor_page(page_layouts: List[Dict], schema: Optional[FieldSchema] = None) -> Optional[Dict]:
+    """The page with the most distinct `schema` labels: the datasheet page of a template."""
+    matcher = (schema or FIELD_SCHEMA).field_matcher
+    best, best_labels = None, 0
+    for layout in page_layouts:
+        labels = len(matcher.find(layout['text']))
+        if labels > best_labels:
+            best, best_labels = layout, labels
+    return best
+
+def _fragment_at(page_layout: Dict, x: float, y: float) -> List[str]:
+    """Texts of the fragments positioned at (x, y), within TEMPLATE_TOLERANCE."""
+    return [text for fx, fy, text in page_layout['fragments']
+            if abs(fx - x) <= TEMPLATE_TOLERANCE and abs(fy - y) <= TEMPLATE_TOLERANCE]
+
+def _locate_value(page_layout: Dict, value: str) -> Optional[Dict]:
+    """Find the single fragment holding `value` and describe its region, or None."""
+    needles = [(value, None)]
+    min_max = MIN_MAX_VALUE_RE.match(value)
+    if min_max:
+        # Values split by split_min_max_value() appear concatenated on the page
+        needles.append((min_max.group(1) + min_max.group(2), 'min_max'))
+    
+    for needle, transform in needles:
+        # Prefer a fragment holding exactly the value, then a unique partial match
+        hits = [(x, y, text) for x, y, text in page_layout['fragments'] if text.strip() == needle]
+        if not hits:
+            hits = [(x, y, text) for x, y, text in page_layout['fragments'] if needle in text]
+        if len(hits) == 1 and hits[0][2].count(needle) == 1:
+            x, y, text = hits[0]
+            pos = text.index(needle)
+            return {'x': x, 'y': y, 'prefix': text[:pos], 'suffix': text[pos + len(needle):],
+                    'transform': transform}
+    return None
+
+def _read_region(page_layout: Dict, region: Dict, schema: Optional[FieldSchema] = None) -> Optional[str]:
+    """Read a value from a cached region, or None if the page does not match it."""
+    prefix, suffix = region['prefix'], region['suffix']
+    for text in _fragment_at(page_layout, region['x'], region['y']):
+        if text.startswith(prefix) and text.endswith(suffix) and len(text) >= len(prefix) + len(suffix):
+            value = text[len(prefix):len(text) - len(suffix)].strip()
+            if region['transform'] == 'min_max':
+                min_val, max_val = split_min_max_value(value, schema)
+                if min_val and max_val:
+                    value = f"{min_val}/{max_val}"
+            return value
+    return None
+
+def apply_template(template: Dict, page_layout: Dict, schema: Optional[FieldSchema] = None) -> Optional[Dict[str, str]]:
+    """Read the learned fields of a template from a page; None if any region is missing.
+    
+    Only fields with a learned region are returned; read_template_fields() adds the
+    unlearned ones.
+    """
+    data = {}
+    for name, parts in template['regions'].items():
+        values = []
+        for part in parts:
+            value = _read_region(page_layout, part, schema)
+            if value is None:
+                return None
+            if value:
+                values.append(f"{part['role']}:{value}" if part['role'] else value)
+        data[name] = " | ".join(values)
+    return data
+
+def learn_template(page_layout: Dict, fields_data: Dict[str, str], schema: Optional[FieldSchema] = None) -> Optional[Dict]:
+    """Learn the value regions of a template page from fields extracted the normal way.
+    
+    A field gets a region when its value can be located on the page and reading the
+    region back reproduces it exactly. The other fields, including blank ones, are
+    recorded as 'unlearned' with their text-layer reading and their value. Returns
+    None if fewer than TEMPLATE_MIN_LABELS fields could be learned.
+    """
+    schema = schema or FIELD_SCHEMA
+    fields = {name: value for name, value in fields_data.items() if name != 'Filename'}
+    regions = {}
+    for name, value in fields.items():
+        if not value:
+            continue
+        parts = [schema.role_part_re.match(part) for part in value.split(" | ")]
+        if all(parts):
+            parts = [(part.group(1), part.group(2)) for part in parts]
+        else:
+            parts = [(None, value)]
+        
+        field_regions = []
+        for role, part_value in parts:
+            region = _locate_value(page_layout, part_value)
+            if region is None:
+                logger.debug(f"Template learning: could not locate {name} = {part_value!r}")
+                break
+            field_regions.append(dict(region, role=role))
+        else:
+            if apply_template({'regions': {name: field_regions}}, page_layout, schema) == {name: value}:
+                regions[name] = field_regions
+    
+    if len(regions) < TEMPLATE_MIN_LABELS:
+        return None
+    text_fields = extract_fields_from_pages(page_texts_from_layouts([page_layout]), schema=schema)
+    return {'fields': list(fields), 'regions': regions,
+            'unlearned': {name: [text_fields.get(name, ""), value]
+                          for name, value in fields.items() if name not in regions}}
+
+def read_template_fields(template: Dict, page_layout: Dict, schema: Optional[FieldSchema] = None) -> Optional[Dict[str, str]]:
+    """Read a document's fields through its template, or None for a template miss.
+    
+    Learned fields are read from their regions. An unlearned field keeps the value it
+    had in the document the template was learned from only while the text layer of
+    the page still reads the same there; otherwise (say a field that was blank has
+    been filled in) the document is a miss and goes through the normal extraction.
+    """
+    schema = schema or FIELD_SCHEMA
+    data = apply_template(template, page_layout, schema)
+    # Templates learned before unlearned fields were recorded are learned again
+    if data is None or 'unlearned' not in template:
+        return None
+    if template['unlearned']:
+        text_fields = extract_fields_from_pages(page_texts_from_layouts([page_layout]), schema=schema)
+        for name, (text_value, value) in template['unlearned'].items():
+            if text_fields.get(name, "") != text_value:
+                logger.debug(f"Template miss: {name} reads {text_fields.get(name, '')!r} instead of {text_value!r}")
+                return None
+            data[name] = value
+    return {name: data.get(name, "") for name in template['fields']}
+
+class TemplateStore:
+    """Learned template layouts, keyed by layout fingerprint, kept in one JSON file.
+    
+    The file is re-read when another process has changed it; updates are merged
+    into the latest version on disk and written atomically.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._templates = {}
+        self._mtime = None
+    
+    def _refresh(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._templates = json.load(f)
+                self._mtime = mtime
+            except Exception as e:
+                logger.warning(f"Could not read template store {self.path}: {e}")
+    
+    def get(self, fingerprint: str) -> Optional[Dict]:
+        self._refresh()
+        return self._templates.get(fingerprint)
+    
+    def add(self, fingerprint: str, template: Dict):
+        self._refresh()
+        self._templates[fingerprint] = template
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._templates, f)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except Exception as e:
+            logger.warning(f"Could not save template store {self.path}: {e}")
+
+def learn_document_template(template_store: Optional[TemplateStore], fingerprint: Optional[str],
+                            anchor_page: Optional[Dict], fields_data: Dict[str, str],
+                            schema: Optional[FieldSchema] = None, pdf_file: str = ''):
+    """Learn and store the template of a document that went through the normal path.
+    
+    A non-default field schema is recorded in the template as 'schema' (its file
+    path), so later documents of the template are extracted with the same schema.
+    """
+    if template_store is None or not fingerprint or not any(
+            value for name, value in fields_data.items() if name != 'Filename'):
+        return
+    template = learn_template(anchor_page, fields_data, schema)
+    if template is not None:
+        if schema is not None and schema is not FIELD_SCHEMA and schema.path:
+            template['schema'] = schema.path
+        template_store.add(fingerprint, template)
+        logger.info(f"Learned template {fingerprint[:12]} from {pdf_file} ({len(template['regions'])} fields, "
+                    f"{len(template['unlearned'])} unlearned)")
+    else:
+        logger.debug(f"Could not learn a template from {pdf_file}")
+
+def write_per_file_outputs(fields_data: Dict[str, str], table_df: Optional[pd.DataFrame],
+                           output_folder: str, pdf_file: str) -> Dict[str, str]:
+    """Write the legacy per-document workbooks: {name}_fields.xlsx and {name}_table.xlsx.
+    
+    `pdf_file` may be a relative path; its folders are created under `output_folder`.
+    """
+    base_name = os.path.splitext(pdf_file)[0]
+    os.makedirs(os.path.dirname(os.path.join(output_folder, base_name)), exist_ok=True)
+    outputs = {}
+    
+    # Save full table
+    if table_df is not None:
+        outputs['table_file'] = os.path.join(output_folder, f"{base_name}_table.xlsx")
+        escape_excel_formulas(table_df).to_excel(outputs['table_file'], index=False, header=False)
+    
+    # Save extracted fields
+    outputs['output_file'] = os.path.join(output_folder, f"{base_name}_fields.xlsx")
+    fields_row = {name: escape_excel_formula(value) for name, value in fields_data.items()}
+    pd.DataFrame([fields_row]).to_excel(outputs['output_file'], index=False)
+    return outputs
+
+def process_single_pdf(pdf_path: str, output_folder: str, artifact_store: Optional[ArtifactStore] = None,
+                       rematch_only: bool = False, page_prefilter: bool = True,
+                       template_store: Optional[TemplateStore] = None, write_files: bool = True,
+                       include_table: bool = False, profile_budget: Optional[float] = None,
+                       schema: Optional[FieldSchema] = None, relative_path: Optional[str] = None,
+                       diagnostics: Optional[Diagnostics] = None) -> Dict[str, any]:
+    """Process a single PDF file with comprehensive extraction methods.
+    
+    With an `artifact_store`, the parsed tables and page texts are cached by content
+    hash and reused on later runs. `rematch_only` re-runs just the field extraction
+    over cached artifacts and skips files that have none. `page_prefilter` limits
+    Camelot to the pages carrying datasheet labels; the pages used are recorded in
+    the result as 'table_pages'. With a `template_store`, documents whose layout
+    fingerprint matches a learned template are read straight from the cached value
+    regions without running Camelot; unknown templates are learned after the
+    normal extraction.
+    
+    Fields are extracted with `schema` (default: field_schema.json), unless the
+    matched template names its own schema file.
+    
+    The extracted fields are always returned in the result as 'fields'. With
+    `write_files` the per-document workbooks are written as well; otherwise output
+    is left to a ResultWriter, and `include_table` adds the chosen table to the
+    result as 'table_rows'. Per-document files are written under `output_folder`
+    at the file's `relative_path` in the input tree (default: its name).
+    
+    In a process-pool worker, the worker's peak RSS while the file ran is returned
+    as 'peak_rss_mb'; it is None elsewhere, since a process shared by concurrent
+    files (threads) has one peak for all of them.
+    The document is parsed through one ParseSession, released when the file is done.
+    Documents selected by `diagnostics` get a JSON trace ('diagnostics_file').
+    Time spent per stage (and per Camelot strategy) is returned as 'timings'. With
+    a `profile_budget` in seconds, the file runs under cProfile and files that take
+    longer than the budget get their profile saved (see dump_profile).
+    """
+    pdf_file = os.path.basename(pdf_path)
+    relative_path = relative_path or pdf_file
+    result = {
+        'filename': pdf_file,
+        'relative_path': relative_path,
+        'success': False,
+        'method': 'none',
+        'output_file': '',
+        'error': '',
+        'extraction_time': 0,
+        'cache_hit': False,
+        'camelot_strategy': '',
+        'strategies_tried': [],
+        'table_pages': '',
+        'timings': {}
+    }
+    
+    start_time = time.time()
+    profiler = cProfile.Profile() if profile_budget is not None else None
+    schema = schema or FIELD_SCHEMA
+    # Per-file peak RSS needs a process running one file at a time whose peak can be reset
+    measure_rss = _process_worker and reset_peak_rss()
+    
+    session = ParseSession(pdf_path)
+    with record_spans() as result['timings'], (profiler or contextlib.nullcontext()), session:
+        try:
+            logger.info(f"Processing: {pdf_file}")
+            fields_data = None
+            table_df = None
+            method = 'none'
             
-            logger.info(f"[Camelot] Successfully processed {pdf_file} - Found {result['fields_found']}/{result['total_fields']} fields")
+            # Recognize known templates by their label layout and read values directly
+            page_layouts = anchor_page = fingerprint = None
+            artifacts = table_index = None
+            if template_store is not None and not rematch_only:
+                with span('template'):
+                    page_layouts = extract_page_layouts(pdf_path, session=session)
+                    anchor_page = find_anchor_page(page_layouts, schema)
+                    fingerprint = layout_fingerprint(anchor_page, schema) if anchor_page else None
+                    template = template_store.get(fingerprint) if fingerprint else None
+                    if template and template.get('schema'):
+                        # Templates may name the field schema their documents are read with
+                        schema = load_field_schema(template['schema'])
+                    fields_data = read_template_fields(template, anchor_page, schema) if template else None
+                
+                if fields_data is not None:
+                    method = 'template'
+                elif template:
+                    logger.info(f"Template {fingerprint[:12]} did not match {pdf_file}, using full extraction")
             
-        else:
-            # Fallback to text extraction
-            logger.info(f"[Fallback] Using text extraction for {pdf_file}")
-            text = extract_text_from_pdf_chunked(pdf_path)
+            if fields_data is None:
+                if artifact_store is not None:
+                    with span('artifact_cache'):
+                        artifact_key = artifact_store.key_for(pdf_path, schema=schema)
+                        artifacts = artifact_store.get(artifact_key)
+                    result['cache_hit'] = artifacts is not None
+                
+                if artifacts is None and rematch_only:
+                    result['error'] = 'No cached artifacts (re-match only mode)'
+                    logger.warning(f"Skipping {pdf_file}: no cached artifacts to re-match")
+                else:
+                    if artifacts is None:
+                        # Try Camelot table extraction first, falling back to the text layer
+                        # Full page texts are only kept when they will be cached for re-matching
+                        keep_page_texts = artifact_store is not None
+                        if page_layouts is not None:
+                            artifacts = extract_artifacts(pdf_path, page_prefilter=page_prefilter,
+                                                          page_texts=page_texts_from_layouts(page_layouts),
+                                                          total_pages=len(page_layouts), keep_page_texts=keep_page_texts,
+                                                          session=session, schema=schema)
+                        else:
+                            artifacts = extract_artifacts(pdf_path, page_prefilter=page_prefilter,
+                                                          keep_page_texts=keep_page_texts, session=session, schema=schema)
+                        if artifact_store is not None:
+                            with span('artifact_cache'):
+                                artifact_store.put(artifact_key, artifacts)
+                    else:
+                        logger.info(f"Re-using cached artifacts for {pdf_file} ({artifacts['camelot_message']})")
+                    
+                    table_df = artifacts['table']
+                    result['camelot_strategy'] = artifacts['strategy']
+                    result['strategies_tried'] = artifacts['strategies_tried']
+                    result['table_pages'] = artifacts['table_pages']
+                    
+                    if table_df is not None:
+                        with span('field_matching'):
+                            # Index label positions once and share it between the strategies
+                            table_index = TableLabelIndex(table_df, schema.table_matcher)
+                            
+                            # Try specialized key-value table extraction first
+                            fields_data = extract_fields_from_key_value_table(table_df, index=table_index, schema=schema)
+                            
+                            # If that didn't work well, try the improved general method
+                            if not any(fields_data.values()):
+                                logger.info("Key-value extraction failed, trying general method")
+                                fields_data = extract_fields_from_table_improved(table_df, index=table_index, schema=schema)
+                        method = 'camelot'
+                        
+                    else:
+                        # Fallback to text extraction
+                        logger.info(f"[Fallback] Using text extraction for {pdf_file}")
+                        # Streamed pages are read while matching, so this span covers both
+                        with span('text_fallback'):
+                            pages = artifacts['page_texts']
+                            if pages is None:
+                                # Stream pages; matching stops reading once every field is found
+                                pages = iter_page_texts(pdf_path, session=session)
+                            pages = iter(pages)
+                            first_page = next(pages, None)
+                            
+                            if first_page is not None:
+                                fields_data = extract_fields_from_pages(itertools.chain([first_page], pages), schema=schema)
+                                method = 'text'
+                            else:
+                                result['error'] = 'No text extracted from PDF'
+                                logger.error(f"No text extracted from {pdf_file}")
+                    
+                    if fields_data is not None and template_store is not None:
+                        with span('template'):
+                            learn_document_template(template_store, fingerprint, anchor_page, fields_data, schema,
+                                                    pdf_file)
             
-            if text:
-                fields_data = extract_fields_from_text_optimized(text)
+            if fields_data is not None:
                 fields_data['Filename'] = pdf_file
                 
-                df = pd.DataFrame([fields_data])
-                output_file = os.path.join(output_folder, f"{os.path.splitext(pdf_file)[0]}_fields.xlsx")
-                df.to_excel(output_file, index=False)
+                # Save extracted fields (and the full table, if any)
+                with span('write_outputs'):
+                    if write_files:
+                        result.update(write_per_file_outputs(fields_data, table_df, output_folder, relative_path))
+                    if include_table and table_df is not None:
+                        result['table_rows'] = table_df.astype(object).where(table_df.notna(), None).values.tolist()
                 
                 result.update({
                     'success': True,
-                    'method': 'text',
-                    'output_file': output_file,
+                    'method': method,
+                    'fields': fields_data,
                     'fields_found': len([v for v in fields_data.values() if v]),
-                    'total_fields': len(FIELDS)
+                    'total_fields': len(schema.fields)
                 })
                 
-                logger.info(f"[Text] Successfully processed {pdf_file} - Found {result['fields_found']}/{result['total_fields']} fields")
-            else:
-                result['error'] = 'No text extracted from PDF'
-                logger.error(f"No text extracted from {pdf_file}")
-                
-    except Exception as e:
-        result['error'] = str(e)
-        logger.error(f"Error processing {pdf_file}: {e}")
+                logger.info(f"[{method.capitalize()}] Successfully processed {pdf_file} - Found {result['fields_found']}/{result['total_fields']} fields")
+                    
+        except Exception as e:
+            result['error'] = str(e)
+            logger.error(f"Error processing {pdf_file}: {e}")
     
     result['extraction_time'] = time.time() - start_time
+    peak_rss = peak_rss_bytes() if measure_rss else None
+    result['peak_rss_mb'] = round(peak_rss / 2 ** 20, 1) if peak_rss else None
+    if diagnostics is not None and diagnostics.wants(relative_path):
+        try:
+            trace = document_trace(result, artifacts, table_index, schema)
+            result['diagnostics_file'] = diagnostics.write(output_folder, relative_path, trace)
+        except Exception as e:
+            logger.error(f"Error writing diagnostics for {pdf_file}: {e}")
+    if profiler is not None and result['extraction_time'] > profile_budget:
+        result['profile_file'] = dump_profile(profiler, output_folder, relative_path)
+        logger.warning(f"{pdf_file} took {result['extraction_time']:.1f}s (budget {profile_budget}s), "
+                       f"profile saved to {result['profile_file']}")
     return result
 
-def process_pdfs_parallel(input_folder: str, output_folder: str = 'Output', max_workers: int = 4) -> List[Dict]:
-    """Process multiple PDFs in parallel for improved speed."""
+def dump_profile(profiler: cProfile.Profile, output_folder: str, pdf_file: str) -> str:
+    """Save a cProfile run as Output/.profiles/{relative path}.prof (open with pstats or snakeviz)."""
+    profile_file = os.path.join(output_folder, '.profiles', f"{os.path.splitext(pdf_file)[0]}.prof")
+    os.makedirs(os.path.dirname(profile_file), exist_ok=True)
+    profiler.dump_stats(profile_file)
+    return profile_file
+
+EXCEL_SHEET_NAME_RE = re.compile(r"[\[\]:*?/\\]")
+
+RESULT_COLUMNS = ['Filename', 'Relative Path', 'Method', 'Extraction Time (s)']
+# Field and typed columns of the default schema; sinks take theirs from the run's schema
+FIELD_COLUMNS = [display_name for display_name, _ in FIELDS]
+TYPED_COLUMNS = [column for column, _, _ in FIELD_SCHEMA.typed_columns]
+
+def default_run_id() -> str:
+    """Partition name for one extraction run, e.g. '20240131T154500'."""
+    return time.strftime('%Y%m%dT%H%M%S')
+
+def result_record(result: Dict, schema: Optional[FieldSchema] = None) -> Dict:
+    """Flatten a process_single_pdf() result into one row of the fixed output schema (one column per `schema` field)."""
+    schema = schema or FIELD_SCHEMA
+    fields_data = result['fields']
+    record = {
+        'Filename': result['filename'],
+        'Relative Path': result.get('relative_path', result['filename']),
+        'Method': result.get('method', ''),
+        'Extraction Time (s)': round(result.get('extraction_time', 0), 3),
+    }
+    for column in schema.display_names:
+        record[column] = fields_data.get(column, '')
+    return record
+
+# A number as written on datasheets ('1,250.5', '-40', '.5', '1e-3') and the unit token after it
+# ('%', 'degC', '°C', 'bar(g)', 'm3/h', 'kg/m³'): one word of at most 12 characters
+NUMBER_PATTERN = r"[-+]?(?:(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?"
+UNIT_PATTERN = r"(?:%|[°µ]?[A-Za-z][A-Za-z0-9°µ²³()^./\-]{0,10})"
+TYPED_VALUE_RE = re.compile(rf"^\s*({NUMBER_PATTERN})\s*({UNIT_PATTERN})?\s*$")
+# 'Min/Max' as joined after split_min_max_value(), e.g. '-40/80 degC'; a unit after Min has no '/'
+TYPED_MIN_MAX_RE = re.compile(rf"^\s*({NUMBER_PATTERN})\s*(?:%|[°µ]?[A-Za-z][A-Za-z0-9°µ²³()^.\-]{{0,10}})?\s*/\s*"
+                              rf"({NUMBER_PATTERN})\s*({UNIT_PATTERN})?\s*$")
+
+def _parse_numbers(numbers: pd.Series) -> pd.Series:
+    """Floats from NUMBER_PATTERN matches (NaN where missing), parsed exactly as float() does."""
+    return numbers.str.replace(',', '', regex=False).astype(float)
+
+def normalize_fields(df: pd.DataFrame, schema: Optional[FieldSchema] = None) -> pd.DataFrame:
+    """Typed columns for the raw field strings of a batch of documents (one row per document).
+    
+    Each field's strings are parsed with vectorized regex extraction, all documents
+    at once, according to its kind: 'Max:120 | Norm:90 | Min:40' into the role
+    components of multi-column fields, '12/42' into Min and Max of min/max fields,
+    and '5.5 bar(g)' into the Value of other fields. Each field also gets the unit
+    token written after its numbers. Values that do not have this shape leave the
+    components NaN (None for units). Only fields marked `"typed": true` in the
+    schema are parsed; columns follow `schema.typed_columns`.
+    """
+    schema = schema or FIELD_SCHEMA
+    typed = {}
+    kinds = {}  # component list -> fields, so fields of one kind are parsed in one pass
+    for column, name, component in schema.typed_columns:
+        if component != 'Unit':
+            kinds.setdefault(name, []).append(component)
+    groups = {}
+    for name, components in kinds.items():
+        groups.setdefault(tuple(components), []).append(name)
+    
+    for components, names in groups.items():
+        raw = df.reindex(columns=names).fillna('').astype(str)
+        # All fields of the group stacked into one column, field after field
+        values = pd.Series(raw.to_numpy().ravel(order='F'), dtype=object)
+        parts = {}
+        if components == ('Value',):
+            match = values.str.extract(TYPED_VALUE_RE)
+            parts['Value'] = _parse_numbers(match[0])
+            unit = match[1]
+        elif components == ('Min', 'Max'):
+            match = values.str.extract(TYPED_MIN_MAX_RE)
+            parts['Min'], parts['Max'] = _parse_numbers(match[0]), _parse_numbers(match[1])
+            unit = match[2]
+        else:
+            unit = pd.Series(np.nan, index=values.index, dtype=object)
+            for role in components:
+                match = values.str.extract(rf"(?:^|\|)\s*{re.escape(role)}:\s*({NUMBER_PATTERN})\s*"
+                                           rf"({UNIT_PATTERN})?\s*(?:\||$)")
+                parts[role] = _parse_numbers(match[0])
+                unit = unit.fillna(match[1])
+        parts['Unit'] = unit.astype(object).where(unit.notna(), None)
+        
+        for component, series in parts.items():
+            for name, column in zip(names, series.to_numpy().reshape(len(names), len(df))):
+                typed[f"{name} [{component}]"] = column
+    
+    return pd.DataFrame(typed, index=df.index, columns=[column for column, _, _ in schema.typed_columns])
+
+def result_frame(batch: List[Dict], schema: Optional[FieldSchema] = None) -> pd.DataFrame:
+    """result_record() rows of a batch, followed by their typed columns from normalize_fields()."""
+    schema = schema or FIELD_SCHEMA
+    records = pd.DataFrame([result_record(result, schema) for result in batch],
+                           columns=RESULT_COLUMNS + schema.display_names)
+    return pd.concat([records, normalize_fields(records[schema.display_names], schema=schema)], axis=1)
+
+class ExcelSink:
+    """Consolidated workbook: a 'Fields' sheet plus optional per-document table sheets.
+    
+    The workbook is opened in openpyxl write-only mode, so rows are streamed to disk
+    instead of being held as cell objects. This is the only sink that escapes
+    formula-like values. The columns are those of `schema` (default: field_schema.json).
+    """
+    
+    def __init__(self, path: str, include_tables: bool = False, schema: Optional[FieldSchema] = None):
+        self.path = path
+        self.include_tables = include_tables
+        self.schema = schema or FIELD_SCHEMA
+        self._workbook = None
+        self._fields_sheet = None
+        self._sheet_names = set()
+    
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._fields_sheet = self._workbook.create_sheet('Fields')
+        self._sheet_names.add('fields')
+        self._fields_sheet.append(RESULT_COLUMNS + self.schema.display_names
+                                  + [column for column, _, _ in self.schema.typed_columns])
+    
+    def _table_sheet_name(self, filename: str) -> str:
+        # Excel sheet names: max 31 characters, no []:*?/\ and unique per workbook
+        base = EXCEL_SHEET_NAME_RE.sub('_', os.path.splitext(filename)[0])[:31] or 'Table'
+        name, suffix = base, 1
+        while name.lower() in self._sheet_names:
+            suffix += 1
+            name = f"{base[:31 - len(str(suffix)) - 1]}~{suffix}"
+        self._sheet_names.add(name.lower())
+        return name
+    
+    def write_batch(self, batch: List[Dict]):
+        frame = result_frame(batch, self.schema)
+        for row in frame.astype(object).where(frame.notna(), None).itertuples(index=False):
+            self._fields_sheet.append([escape_excel_formula(value) for value in row])
+        
+        if self.include_tables:
+            for result in batch:
+                if result.get('table_rows'):
+                    table_sheet = self._workbook.create_sheet(self._table_sheet_name(result['filename']))
+                    for table_row in result['table_rows']:
+                        table_sheet.append([escape_excel_formula(value) for value in table_row])
+    
+    def close(self):
+        self._workbook.save(self.path)
+
+class ParquetSink:
+    """Parquet datasets with a fixed schema, partitioned by run.
+    
+    Fields go to `{root}/fields/run={run_id}/part-0.parquet` (one string column per
+    `schema` field after Filename/Method/timing, then the float64/string columns of
+    normalize_fields()). With `include_tables`, tables go to
+    `{root}/tables/run={run_id}/part-0.parquet` in long form (Filename, Row, Column,
+    Value). Each batch is appended as a row group; earlier runs are never rewritten,
+    and `pd.read_parquet(f"{root}/fields")` reads all runs with a `run` column.
+    """
+    
+    def __init__(self, root: str, run_id: Optional[str] = None, include_tables: bool = False,
+                 schema: Optional[FieldSchema] = None):
+        self.root = root
+        self.run_id = run_id or default_run_id()
+        self.include_tables = include_tables
+        self.schema = schema or FIELD_SCHEMA
+        self.path = os.path.join(root, 'fields', f"run={self.run_id}", 'part-0.parquet')
+        self.tables_path = os.path.join(root, 'tables', f"run={self.run_id}", 'part-0.parquet')
+        self._fields_writer = None
+        self._tables_writer = None
+    
+    def open(self):
+        if not pyarrow_available:
+            raise ImportError("pyarrow is required for the Parquet sink")
+        self.fields_schema = pa.schema([('Filename', pa.string()), ('Relative Path', pa.string()),
+                                        ('Method', pa.string()), ('Extraction Time (s)', pa.float64())]
+                                       + [(column, pa.string()) for column in self.schema.display_names]
+                                       + [(column, pa.string() if component == 'Unit' else pa.float64())
+                                          for column, _, component in self.schema.typed_columns])
+        self.tables_schema = pa.schema([('Filename', pa.string()), ('Relative Path', pa.string()), ('Row', pa.int32()),
+                                        ('Column', pa.int32()), ('Value', pa.string())])
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fields_writer = pq.ParquetWriter(self.path, self.fields_schema)
+        if self.include_tables:
+            os.makedirs(os.path.dirname(self.tables_path), exist_ok=True)
+            self._tables_writer = pq.ParquetWriter(self.tables_path, self.tables_schema)
+    
+    def write_batch(self, batch: List[Dict]):
+        frame = result_frame(batch, self.schema)
+        self._fields_writer.write_table(pa.Table.from_pandas(frame, schema=self.fields_schema, preserve_index=False))
+        
+        if self._tables_writer is not None:
+            cells = [{'Filename': result['filename'], 'Relative Path': result.get('relative_path', result['filename']),
+                      'Row': r, 'Column': c, 'Value': str(value)}
+                     for result in batch
+                     for r, table_row in enumerate(result.get('table_rows') or [])
+                     for c, value in enumerate(table_row) if value is not None]
+            if cells:
+                self._tables_writer.write_table(pa.Table.from_pylist(cells, schema=self.tables_schema))
+    
+    def close(self):
+        self._fields_writer.close()
+        if self._tables_writer is not None:
+            self._tables_writer.close()
+
+class JsonlSink:
+    """One JSON object per document in `{root}/run={run_id}.jsonl`, appended as results arrive."""
+    
+    def __init__(self, root: str, run_id: Optional[str] = None, include_tables: bool = False,
+                 schema: Optional[FieldSchema] = None):
+        self.root = root
+        self.run_id = run_id or default_run_id()
+        self.include_tables = include_tables
+        self.schema = schema or FIELD_SCHEMA
+        self.path = os.path.join(root, f"run={self.run_id}.jsonl")
+        self._file = None
+    
+    def open(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+    
+    def write_batch(self, batch: List[Dict]):
+        frame = result_frame(batch, self.schema)
+        records = frame.astype(object).where(frame.notna(), None).to_dict('records')
+        for result, record in zip(batch, records):
+            record['run'] = self.run_id
+            if self.include_tables:
+                record['table'] = result.get('table_rows')
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+    
+    def close(self):
+        self._file.close()
+
+class ResultWriter:
+    """Single writer stage that streams extraction results into one or more output sinks.
+    
+    Results are queued by the collecting process and written by a background thread,
+    so the extraction workers never touch the output files. Each sink (ExcelSink,
+    ParquetSink, JsonlSink) receives successful results in batches.
+    """
+    
+    def __init__(self, sinks: List, batch_size: int = 100):
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.include_tables = any(sink.include_tables for sink in self.sinks)
+        self.path = self.sinks[0].path if self.sinks else ''
+        self.rows_written = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._error = None
+    
+    def start(self) -> 'ResultWriter':
+        self._thread = threading.Thread(target=self._run, name='ResultWriter', daemon=True)
+        self._thread.start()
+        return self
+    
+    def submit(self, result: Dict):
+        """Queue a result from process_single_pdf(); failed results are skipped."""
+        if self._error is not None:
+            raise RuntimeError(f"Result writer failed: {self._error}") from self._error
+        if result.get('success') and result.get('fields') is not None:
+            # Queue a snapshot; the caller may trim its copy of the result
+            self._queue.put(dict(result))
+    
+    def close(self):
+        """Flush the queued results and close every sink."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            raise RuntimeError(f"Result writer failed: {self._error}") from self._error
+        for sink in self.sinks:
+            logger.info(f"Wrote {self.rows_written} documents to {sink.path}")
+    
+    def __enter__(self) -> 'ResultWriter':
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def _run(self):
+        try:
+            for sink in self.sinks:
+                sink.open()
+            
+            done = False
+            while not done:
+                # Block for one result, then drain whatever else is already queued
+                batch = []
+                item = self._queue.get()
+                while True:
+                    if item is None:
+                        done = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if batch:
+                    for sink in self.sinks:
+                        sink.write_batch(batch)
+                    self.rows_written += len(batch)
+            
+            for sink in self.sinks:
+                sink.close()
+        except Exception as e:
+            logger.error(f"Error writing results: {e}")
+            self._error = e
+
+# Set in process-pool workers, which run one file at a time
+_process_worker = False
+
+def _init_worker(log_level: int = logging.INFO):
+    """Process-pool initializer: import the heavy extraction libraries once per worker process."""
+    global _process_worker
+    _process_worker = True
+    logging.getLogger().setLevel(log_level)
+    _import_extraction_libraries()
+
+def _import_extraction_libraries():
+    try:
+        import pandas  # noqa: F401
+        import camelot  # noqa: F401  (also loads pdfminer)
+        import cv2  # noqa: F401  (used by Camelot lattice)
+    except ImportError as e:
+        logger.debug(f"Worker warm-up skipped an import: {e}")
+
+def _process_pdf_chunk(pdf_files: List[Tuple[str, str]], output_folder: str, options: Dict) -> List[Dict]:
+    """Process a chunk of (path, relative path) PDFs in one worker; results are plain, picklable dicts."""
+    return [process_single_pdf(pdf_path, output_folder, relative_path=relative_path, **options)
+            for pdf_path, relative_path in pdf_files]
+
+# Estimated peak memory of processing one PDF: Camelot lattice renders every page it
+# reads to an image and pdfminer keeps a layout per page, so cost grows with pages.
+# Pages are estimated from the file size (text datasheets take about 8-100 KB a page),
+# so admission never has to open the PDF; Camelot holds at most a window of pages.
+MEMORY_COST_PER_PAGE = 32 * 2 ** 20
+MEMORY_COST_PER_FILE_BYTE = 4
+MEMORY_COST_BASE = 64 * 2 ** 20
+MEMORY_FILE_BYTES_PER_PAGE = 16 * 1024
+
+def available_memory() -> Optional[int]:
+    """Bytes of memory available for new work (MemAvailable on Linux), or None if unknown."""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+class MemoryGovernor:
+    """Admission control that keeps the estimated memory cost of in-flight work under a budget.
+    
+    A file's cost is estimated from its size alone (see MEMORY_COST_*), so files
+    are admitted without being opened.
+    Work is admitted while the in-flight total stays within `budget` bytes; when
+    nothing is in flight, work is always admitted so an oversized file still runs
+    (alone, and page-windowed; see CAMELOT_WINDOW_PAGES).
+    """
+    
+    def __init__(self, budget: Optional[int] = None):
+        if budget is None:
+            available = available_memory()
+            budget = available // 2 if available else 4 * 2 ** 30
+        self.budget = budget
+        self.in_flight = 0
+    
+    @staticmethod
+    def estimate(pdf_path: str, size: Optional[int] = None) -> int:
+        """Estimated peak memory of processing a file; pass `size` when it is already known."""
+        if size is None:
+            try:
+                size = os.path.getsize(pdf_path)
+            except OSError:
+                size = 0
+        pages = min(-(-size // MEMORY_FILE_BYTES_PER_PAGE), CAMELOT_WINDOW_PAGES)
+        return MEMORY_COST_BASE + size * MEMORY_COST_PER_FILE_BYTE + pages * MEMORY_COST_PER_PAGE
+    
+    def try_acquire(self, cost: int, busy: bool = True) -> bool:
+        if busy and self.in_flight + cost > self.budget:
+            return False
+        self.in_flight += cost
+        return True
+    
+    def release(self, cost: int):
+        self.in_flight -= cost
+
+def reset_peak_rss() -> bool:
+    """Reset this process's peak RSS (Linux: VmHWM via /proc/self/clear_refs)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak RSS of this process since the last reset_peak_rss(), or since start where unsupported."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+    except (ImportError, OSError):
+        return None
+
+def create_executor(executor_type: str, max_workers: int):
+    """Worker pool for the 'thread' or 'process' backend.
+    
+    Worker processes are started from a fork server where available: the writer
+    thread may be running (and holding an import lock) when workers start, and
+    forking a multi-threaded parent can deadlock the child.
+    """
+    if executor_type == 'process':
+        context = None
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                                   initargs=(logger.getEffectiveLevel(),))
+    if executor_type == 'thread':
+        return ThreadPoolExecutor(max_workers=max_workers)
+    raise ValueError(f"Unknown executor_type: {executor_type!r} (expected 'thread' or 'process')")
+
+def _glob_match(relative_path: str, patterns: List[str]) -> bool:
+    """Whether a '/'-separated relative path, or its last part, matches any of the (lower-case) globs."""
+    relative_path = relative_path.lower()
+    name = relative_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatchcase(relative_path, pattern) or fnmatch.fnmatchcase(name, pattern)
+               for pattern in patterns)
+
+def discover_pdf_files(input_folder: str, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+                       recursive: bool = True) -> Iterator[Tuple[os.DirEntry, str]]:
+    """Yield (entry, relative path) for the PDFs under a folder as they are found.
+    
+    The tree is walked depth-first with os.scandir, one folder at a time, so files
+    are yielded before the rest of the tree has been read. Relative paths use '/'
+    separators. `include` and `exclude` are glob lists, matched case-insensitively
+    against the relative path and against the name; excluded folders are not
+    entered. Folders reached again through symlinks (including symlink loops) are
+    skipped by (st_dev, st_ino), and unreadable folders are logged and skipped.
+    """
+    include = [pattern.lower() for pattern in include or []]
+    exclude = [pattern.lower() for pattern in exclude or []]
+    visited = set()
+    folders = [(input_folder, '')]
+    
+    while folders:
+        folder, prefix = folders.pop()
+        subfolders = []
+        try:
+            stat = os.stat(folder)
+            if (stat.st_dev, stat.st_ino) in visited:
+                logger.debug(f"Skipping {folder}: already visited (symlink)")
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+            
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    relative_path = prefix + entry.name
+                    try:
+                        if entry.is_dir():
+                            if recursive and not _glob_match(relative_path, exclude):
+                                subfolders.append((entry.path, relative_path + '/'))
+                        elif (entry.is_file() and entry.name.lower().endswith('.pdf')
+                              and (not include or _glob_match(relative_path, include))
+                              and not _glob_match(relative_path, exclude)):
+                            yield entry, relative_path
+                    except OSError as e:
+                        logger.warning(f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            logger.warning(f"Skipping folder {folder}: {e}")
+        # Walk subfolders in name order, so repeated runs see the tree in the same order
+        folders.extend(sorted(subfolders, reverse=True))
+
+def process_pdfs_parallel(input_folder: str, output_folder: str = 'Output', max_workers: Optional[int] = None,
+                          executor_type: str = 'thread', chunksize: Optional[int] = None,
+                          writer: Optional[ResultWriter] = None, memory_budget: Optional[int] = None,
+                          include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+                          recursive: bool = True, **options) -> List[Dict]:
+    """Process multiple PDFs in parallel for improved speed.
+
+    executor_type selects the backend: 'thread' (shared process, limited by the GIL)
+    or 'process' (warm worker processes, scales with CPU cores). Files are submitted
+    in chunks of `chunksize` to keep scheduling overhead low on large batches.
+    Extra keyword options (e.g. `artifact_store`, `rematch_only`) are passed on to
+    process_single_pdf().
+    
+    PDFs are discovered while the pool runs (see discover_pdf_files for `include`,
+    `exclude` and `recursive`), and per-file outputs mirror their folder under
+    `output_folder`. Chunks are submitted as earlier ones finish, while their
+    estimated memory cost (see MemoryGovernor) fits into `memory_budget` bytes
+    (default: half of the available memory); at least one chunk is always in flight.
+    
+    With a started `writer`, per-document workbooks are not written by the workers;
+    each result is handed to the writer as it completes instead.
+    """
     os.makedirs(output_folder, exist_ok=True)
-    pdf_files = [f for f in os.listdir(input_folder) if f.lower().endswith('.pdf')]
+    if writer is not None:
+        options.setdefault('write_files', False)
+        options.setdefault('include_table', writer.include_tables)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    pdf_files = ((entry.path, relative_path) for entry, relative_path
+                 in discover_pdf_files(input_folder, include=include, exclude=exclude, recursive=recursive))
     
-    if not pdf_files:
+    # Look ahead just far enough to size the chunks as for a complete listing
+    head = list(itertools.islice(pdf_files, max_workers * 32))
+    if not head:
         logger.warning(f"No PDF files found in {input_folder}")
         return []
     
-    logger.info(f"Found {len(pdf_files)} PDF files to process")
+    if chunksize is None:
+        # A few chunks per worker balances load without flooding the queue
+        chunksize = max(1, min(8, len(head) // (max_workers * 4)))
+    governor = MemoryGovernor(memory_budget)
+    # Never queue more than a couple of chunks per worker ahead of time
+    max_in_flight = max_workers * 2
+    
+    logger.info(f"Processing PDFs under {input_folder} "
+                f"({executor_type} pool, {max_workers} workers, chunksize {chunksize}, "
+                f"memory budget {governor.budget / 2 ** 20:.0f} MB)")
     results = []
+    pdf_files = itertools.chain(head, pdf_files)
+    chunks = iter(lambda: list(itertools.islice(pdf_files, chunksize)), [])
     
     # Process files in parallel
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks
-        future_to_file = {
-            executor.submit(process_single_pdf, os.path.join(input_folder, pdf_file), output_folder): pdf_file
-            for pdf_file in pdf_files
-        }
+    with create_executor(executor_type, max_workers) as executor:
+        future_to_chunk = {}  # future -> (chunk, estimated cost)
+        chunk = next(chunks, None)
+        discovered = len(chunk)
+        chunk_cost = None
         
-        # Collect results as they complete
-        for i, future in enumerate(as_completed(future_to_file), 1):
-            pdf_file = future_to_file[future]
-            try:
-                result = future.result()
-                results.append(result)
-                logger.info(f"Completed {i}/{len(pdf_files)}: {pdf_file}")
-            except Exception as e:
-                logger.error(f"Error processing {pdf_file}: {e}")
-                results.append({
-                    'filename': pdf_file,
-                    'success': False,
-                    'error': str(e),
-                    'extraction_time': 0
-                })
+        while chunk is not None or future_to_chunk:
+            # Submit chunks while their estimated cost fits into the budget
+            while chunk is not None and len(future_to_chunk) < max_in_flight:
+                if chunk_cost is None:
+                    chunk_cost = sum(governor.estimate(pdf_path) for pdf_path, _ in chunk)
+                if not governor.try_acquire(chunk_cost, busy=bool(future_to_chunk)):
+                    break
+                future = executor.submit(_process_pdf_chunk, chunk, output_folder, options)
+                future_to_chunk[future] = (chunk, chunk_cost)
+                chunk, chunk_cost = next(chunks, None), None
+                discovered += len(chunk or [])
+            
+            # Collect results as they complete
+            done, _ = wait(future_to_chunk, return_when=FIRST_COMPLETED)
+            for future in done:
+                done_chunk, done_cost = future_to_chunk.pop(future)
+                governor.release(done_cost)
+                try:
+                    chunk_results = future.result()
+                except Exception as e:
+                    # A crashed worker takes the whole chunk with it
+                    logger.error(f"Error processing chunk {[relative_path for _, relative_path in done_chunk]}: {e}")
+                    chunk_results = [{
+                        'filename': os.path.basename(pdf_path),
+                        'relative_path': relative_path,
+                        'success': False,
+                        'error': str(e),
+                        'extraction_time': 0
+                    } for pdf_path, relative_path in done_chunk]
+                
+                for result in chunk_results:
+                    if writer is not None:
+                        writer.submit(result)
+                        # The writer has the fields now; keep the collected results small
+                        result.pop('table_rows', None)
+                        if result['success'] and not result.get('output_file'):
+                            result['output_file'] = writer.path
+                    results.append(result)
+                    # '+' while discovery is still running
+                    logger.info(f"Completed {len(results)}/{discovered}{'+' if chunk is not None else ''}: "
+                                f"{result['relative_path']}")
     
+    logger.info(f"Processed {len(results)} PDF files found under {input_folder}")
     return results
 
+def strategy_hit_rates(results: List[Dict]) -> pd.DataFrame:
+    """Per-strategy counts of how often each Camelot strategy was tried and won."""
+    rows = []
+    for name, _, _ in CAMELOT_STRATEGIES:
+        tried = len([r for r in results if name in r.get('strategies_tried', [])])
+        wins = len([r for r in results if r.get('camelot_strategy') == name])
+        rows.append({
+            'Strategy': name,
+            'Tried': tried,
+            'Wins': wins,
+            'Hit Rate (%)': round(wins / tried * 100, 1) if tried else 0,
+        })
+    return pd.DataFrame(rows)
+
+TIMING_QUANTILES = [0.5, 0.9, 0.99]
+
+def stage_timings(results: List[Dict]) -> pd.DataFrame:
+    """Long table of (Filename, Stage, Seconds), including each file's total time."""
+    rows = []
+    for result in results:
+        rows.append({'Filename': result['filename'], 'Stage': 'total', 'Seconds': result.get('extraction_time', 0)})
+        for stage, seconds in result.get('timings', {}).items():
+            rows.append({'Filename': result['filename'], 'Stage': stage, 'Seconds': seconds})
+    return pd.DataFrame(rows, columns=['Filename', 'Stage', 'Seconds'])
+
+def timing_stats(results: List[Dict]) -> pd.DataFrame:
+    """Per-stage percentile statistics over the files that ran each stage."""
+    timings = stage_timings(results)
+    grouped = timings.groupby('Stage')['Seconds']
+    stats = pd.DataFrame({'Files': grouped.count(), 'Total (s)': grouped.sum(), 'Mean (s)': grouped.mean()})
+    for q in TIMING_QUANTILES:
+        stats[f"P{q * 100:g} (s)"] = grouped.quantile(q)
+    stats['Max (s)'] = grouped.max()
+    return stats.round(4).sort_values('Total (s)', ascending=False).reset_index()
+
+def write_metrics_file(results: List[Dict], path: str):
+    """Export run metrics in the Prometheus text format (e.g. for a node_exporter textfile collector)."""
+    lines = [
+        "# HELP pdfxtract_files_total Processed PDF files by outcome and extraction method.",
+        "# TYPE pdfxtract_files_total counter",
+    ]
+    outcomes = {}
+    for result in results:
+        key = ('true' if result['success'] else 'false', result.get('method', 'none'))
+        outcomes[key] = outcomes.get(key, 0) + 1
+    for (success, method), count in sorted(outcomes.items()):
+        lines.append(f'pdfxtract_files_total{{success="{success}",method="{method}"}} {count}')
+    
+    lines += [
+        "# HELP pdfxtract_stage_seconds Time spent per file in each pipeline stage.",
+        "# TYPE pdfxtract_stage_seconds summary",
+    ]
+    timings = stage_timings(results)
+    for stage, seconds in timings.groupby('Stage')['Seconds']:
+        for q in TIMING_QUANTILES:
+            lines.append(f'pdfxtract_stage_seconds{{stage="{stage}",quantile="{q}"}} {seconds.quantile(q):.6f}')
+        lines.append(f'pdfxtract_stage_seconds_sum{{stage="{stage}"}} {seconds.sum():.6f}')
+        lines.append(f'pdfxtract_stage_seconds_count{{stage="{stage}"}} {seconds.count()}')
+    
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+def summary_row(result: Dict) -> Dict:
+    """One row of the summary report for a process_single_pdf() result."""
+    return {
+        'Filename': result['filename'],
+        'Relative Path': result.get('relative_path', result['filename']),
+        'Success': result['success'],
+        'Method': result.get('method', 'none'),
+        'Fields Found': result.get('fields_found', 0),
+        'Total Fields': result.get('total_fields', len(FIELDS)),
+        'Success Rate (%)': round((result.get('fields_found', 0) / result.get('total_fields', len(FIELDS))) * 100, 1) if result['success'] else 0,
+        'Processing Time (s)': round(result.get('extraction_time', 0), 2),
+        'Peak RSS (MB)': result.get('peak_rss_mb'),
+        'Table Pages': result.get('table_pages', ''),
+        'Error': result.get('error', '')
+    }
+
 def generate_summary_report(results: List[Dict], output_folder: str):
     """Generate a summary report of the extraction process."""
     if not results:
@@ -934,26 +3047,23 @@ def generate_summary_report(results: List[Dict], output_folder: str):
     
     camelot_success = len([r for r in results if r.get('method') == 'camelot'])
     text_success = len([r for r in results if r.get('method') == 'text'])
+    template_success = len([r for r in results if r.get('method') == 'template'])
+    cache_hits = len([r for r in results if r.get('cache_hit')])
     
     # Create summary DataFrame
-    summary_data = []
-    for result in results:
-        summary_data.append({
-            'Filename': result['filename'],
-            'Success': result['success'],
-            'Method': result.get('method', 'none'),
-            'Fields Found': result.get('fields_found', 0),
-            'Total Fields': result.get('total_fields', len(FIELDS)),
-            'Success Rate (%)': round((result.get('fields_found', 0) / len(FIELDS)) * 100, 1) if result['success'] else 0,
-            'Processing Time (s)': round(result.get('extraction_time', 0), 2),
-            'Error': result.get('error', '')
-        })
-    
-    summary_df = pd.DataFrame(summary_data)
+    summary_df = pd.DataFrame([summary_row(result) for result in results])
+    strategy_df = strategy_hit_rates(results)
+    timing_df = timing_stats(results)
     
     # Save summary report
     summary_file = os.path.join(output_folder, 'extraction_summary.xlsx')
-    summary_df.to_excel(summary_file, index=False)
+    with pd.ExcelWriter(summary_file) as writer:
+        summary_df.to_excel(writer, sheet_name='Summary', index=False)
+        strategy_df.to_excel(writer, sheet_name='Camelot Strategies', index=False)
+        timing_df.to_excel(writer, sheet_name='Stage Timings', index=False)
+    
+    metrics_file = os.path.join(output_folder, 'metrics.prom')
+    write_metrics_file(results, metrics_file)
     
     # Print summary
     logger.info("\n" + "="*60)
@@ -966,22 +3076,1193 @@ def generate_summary_report(results: List[Dict], output_folder: str):
     logger.info(f"Average processing time: {avg_time:.2f} seconds")
     logger.info(f"Camelot extractions: {camelot_success}")
     logger.info(f"Text extractions: {text_success}")
+    logger.info(f"Template extractions: {template_success}")
+    logger.info(f"Artifact cache hits: {cache_hits}")
+    peak_rss = [r['peak_rss_mb'] for r in results if r.get('peak_rss_mb')]
+    if peak_rss:
+        logger.info(f"Peak worker RSS: {max(peak_rss):.0f} MB (median {pd.Series(peak_rss).median():.0f} MB)")
+    for row in strategy_df.to_dict('records'):
+        logger.info(f"Strategy {row['Strategy']}: won {row['Wins']}/{row['Tried']} tries ({row['Hit Rate (%)']}%)")
+    for row in timing_df.head(5).to_dict('records'):
+        logger.info(f"Stage {row['Stage']}: {row['Total (s)']:.2f}s total, p50 {row['P50 (s)']:.3f}s, "
+                    f"p90 {row['P90 (s)']:.3f}s over {row['Files']} files")
     logger.info(f"Summary saved to: {summary_file}")
+    logger.info(f"Metrics saved to: {metrics_file}")
     logger.info("="*60)
 
-def main():
-    input_folder = 'Input'
-    output_folder = 'Output'
+class ProcessedManifest:
+    """Persistent record of processed files: path, size, mtime, content hash and result.
     
-    if not os.path.exists(input_folder):
-        logger.error(f"Error: {input_folder} folder not found!")
-        return
+    Kept as an append-only JSON-lines file where the last line for a path wins, so
+    every update is a single small write and a crash loses at most the last line.
+    Superseded lines are compacted away when the manifest is loaded.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self._load()
+    
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash; the file is processed again
+                    continue
+                self.entries[entry['path']] = entry
+        
+        if lines > 2 * len(self.entries):
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.path)
+    
+    def is_current(self, path: str, size: int, mtime_ns: int) -> bool:
+        """True when the file was processed and has not changed since (no hashing needed)."""
+        entry = self.entries.get(path)
+        return entry is not None and entry['size'] == size and entry['mtime_ns'] == mtime_ns
+    
+    def get(self, path: str) -> Optional[Dict]:
+        return self.entries.get(path)
+    
+    def record(self, path: str, size: int, mtime_ns: int, content_hash: str, result: Dict):
+        entry = {'path': path, 'size': size, 'mtime_ns': mtime_ns, 'sha256': content_hash, 'result': result}
+        self.entries[path] = entry
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+
+class IncrementalSummary:
+    """Summary report that grows one row per result instead of being rebuilt.
+    
+    Rows are appended to extraction_summary.csv (same columns as the Summary sheet)
+    and running totals are kept in extraction_totals.json, both surviving restarts.
+    The totals count files, not results: a file's latest row (by relative path)
+    replaces its earlier ones, as rows are re-read from the CSV on start. Failed
+    attempts that were not written as rows are only counted under `retries`.
+    """
+    
+    def __init__(self, output_folder: str):
+        self.csv_path = os.path.join(output_folder, 'extraction_summary.csv')
+        self.totals_path = os.path.join(output_folder, 'extraction_totals.json')
+        self.totals = {'files': 0, 'successful': 0, 'failed': 0, 'fields_found': 0,
+                       'processing_time': 0.0, 'methods': {}, 'retries': 0}
+        self.latest = {}  # relative path -> (success, fields found, processing time, method) of its latest row
+        if os.path.exists(self.totals_path):
+            with open(self.totals_path, 'r', encoding='utf-8') as f:
+                self.totals['retries'] = json.load(f).get('retries', 0)
+        if os.path.exists(self.csv_path):
+            with open(self.csv_path, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    self._replace(row.get('Relative Path') or row['Filename'],
+                                  (row['Success'] == 'True', int(row['Fields Found']),
+                                   float(row['Processing Time (s)']), row['Method']))
+    
+    def _replace(self, key: str, counts: Tuple):
+        totals = self.totals
+        previous = self.latest.get(key)
+        changes = [(-1, previous), (1, counts)] if previous else [(1, counts)]
+        for sign, (success, fields_found, processing_time, method) in changes:
+            totals['files'] += sign
+            totals['successful' if success else 'failed'] += sign
+            totals['fields_found'] += sign * fields_found
+            totals['processing_time'] += sign * processing_time
+            totals['methods'][method] = totals['methods'].get(method, 0) + sign
+        self.latest[key] = counts
+    
+    def add(self, result: Dict):
+        """Append the result's row; it replaces the file's previous result in the totals."""
+        row = summary_row(result)
+        write_header = not os.path.exists(self.csv_path)
+        with open(self.csv_path, 'a', newline='', encoding='utf-8') as f:
+            csv_writer = csv.DictWriter(f, fieldnames=list(row))
+            if write_header:
+                csv_writer.writeheader()
+            csv_writer.writerow(row)
+        
+        self._replace(row['Relative Path'], (row['Success'], row['Fields Found'],
+                                             row['Processing Time (s)'], row['Method']))
+        self._save()
+        totals = self.totals
+        logger.info(f"Totals: {totals['successful']}/{totals['files']} successful, "
+                    f"average {totals['processing_time'] / totals['files']:.2f} s per file")
+    
+    def add_retry(self):
+        """Count another failed attempt at a file whose failure is already in the summary."""
+        self.totals['retries'] += 1
+        self._save()
+    
+    def _save(self):
+        tmp_path = f"{self.totals_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.totals, f)
+        os.replace(tmp_path, self.totals_path)
+
+def scan_pdf_files(input_folder: str, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+                   recursive: bool = True) -> Iterator[Tuple[str, str, int, int]]:
+    """Yield (path, relative path, size, mtime_ns) for the PDFs under a folder (see discover_pdf_files)."""
+    for entry, relative_path in discover_pdf_files(input_folder, include=include, exclude=exclude, recursive=recursive):
+        try:
+            stat = entry.stat()
+        except OSError:
+            # Removed since it was listed
+            continue
+        yield entry.path, relative_path, stat.st_size, stat.st_mtime_ns
+
+# Longest wait before a file that keeps failing in watch mode is tried again
+WATCH_RETRY_MAX_DELAY = 3600.0
+
+def _watch_retry_later(retries: Dict, path: str, poll_interval: float):
+    """Count a failure of `path` and set when it may be queued again: the next poll, then backing off."""
+    failures = retries.get(path, (0, 0.0))[0] + 1
+    delay = min(poll_interval * 2 ** (failures - 1), WATCH_RETRY_MAX_DELAY)
+    retries[path] = (failures, time.monotonic() + delay)
+
+def watch_folder(input_folder: str, output_folder: str = 'Output', poll_interval: float = 5.0,
+                 max_workers: Optional[int] = None, executor_type: str = 'thread',
+                 writer: Optional[ResultWriter] = None, stop_event: Optional[threading.Event] = None,
+                 memory_budget: Optional[int] = None, include: Optional[List[str]] = None,
+                 exclude: Optional[List[str]] = None, recursive: bool = True, **options):
+    """Watch a folder and process new or changed PDFs until `stop_event` is set.
+    
+    The folder is polled every `poll_interval` seconds. A file is queued once its
+    size and mtime are unchanged between two polls, so half-copied files are not
+    picked up. The manifest (Output/.manifest.jsonl) makes restarts skip finished
+    work: unchanged files are skipped on size/mtime alone, and touched files whose
+    content hash is unchanged are not processed again. Each result updates the
+    incremental summary and is handed to `writer`, if given. Files whose estimated
+    memory cost does not fit into `memory_budget` wait for the next poll. Files are
+    found as in process_pdfs_parallel(). Extra keyword options are passed on to
+    process_single_pdf().
+    
+    Only successful results are recorded in the manifest; failed files are tried
+    again from the next poll on, waiting twice as long after each further failure
+    (up to WATCH_RETRY_MAX_DELAY seconds). A failure is written to the summary and
+    `writer` once per version (size and mtime) of a file; further failed attempts
+    are only counted as retries. A worker crash that breaks the process pool
+    replaces the pool; the files that were on it are tried again like failures.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = ProcessedManifest(os.path.join(output_folder, '.manifest.jsonl'))
+    summary = IncrementalSummary(output_folder)
+    stop_event = stop_event or threading.Event()
+    if writer is not None:
+        options.setdefault('write_files', False)
+        options.setdefault('include_table', writer.include_tables)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    # Keep a few files per worker queued; the rest wait for the next poll
+    max_in_flight = max_workers * 4
+    governor = MemoryGovernor(memory_budget)
+    
+    logger.info(f"Watching {input_folder} every {poll_interval}s "
+                f"({executor_type} pool, {max_workers} workers, {len(manifest.entries)} files in manifest)")
+    last_seen = {}  # path -> (size, mtime_ns) from the previous poll
+    retries = {}  # failed path -> (consecutive failures, monotonic time it may be queued again)
+    reported = {}  # failed path -> (size, mtime_ns) of the version whose failure was written
+    in_flight = {}  # future -> (path, relative path, size, mtime_ns, content_hash, estimated cost)
+    last_scan = 0.0
+    
+    executor = create_executor(executor_type, max_workers)
+    try:
+        while not stop_event.is_set():
+            broken = False
+            if time.monotonic() - last_scan >= poll_interval:
+                last_scan = time.monotonic()
+                busy = {item[0] for item in in_flight.values()}
+                seen = {}
+                for path, relative_path, size, mtime_ns in scan_pdf_files(input_folder, include=include,
+                                                                          exclude=exclude, recursive=recursive):
+                    if path in busy or manifest.is_current(path, size, mtime_ns):
+                        continue
+                    seen[path] = (size, mtime_ns)
+                    if last_seen.get(path) != (size, mtime_ns) or len(in_flight) >= max_in_flight:
+                        continue
+                    if path in retries and time.monotonic() < retries[path][1]:
+                        continue
+                    
+                    # Touched but identical files keep their previous result
+                    content_hash = file_sha256(path)
+                    previous = manifest.get(path)
+                    if previous is not None and previous['sha256'] == content_hash:
+                        manifest.record(path, size, mtime_ns, content_hash, previous['result'])
+                        continue
+                    
+                    cost = governor.estimate(path, size)
+                    if not governor.try_acquire(cost, busy=bool(in_flight)):
+                        continue
+                    try:
+                        future = executor.submit(process_single_pdf, path, output_folder,
+                                                 relative_path=relative_path, **options)
+                    except BrokenExecutor:
+                        governor.release(cost)
+                        broken = True
+                        break
+                    in_flight[future] = (path, relative_path, size, mtime_ns, content_hash, cost)
+                    logger.info(f"Queued {relative_path} ({len(in_flight)} in flight)")
+                last_seen = seen
+            
+            if not in_flight and not broken:
+                stop_event.wait(max(0.0, poll_interval - (time.monotonic() - last_scan)))
+                continue
+            
+            done, _ = wait(in_flight, timeout=max(0.0, poll_interval - (time.monotonic() - last_scan)),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                path, relative_path, size, mtime_ns, content_hash, cost = in_flight.pop(future)
+                governor.release(cost)
+                try:
+                    result = future.result()
+                except BrokenExecutor:
+                    broken = True
+                    _watch_retry_later(retries, path, poll_interval)
+                    continue
+                except Exception as e:
+                    logger.error(f"Error processing {path}: {e}")
+                    result = {'filename': os.path.basename(path), 'relative_path': relative_path,
+                              'success': False, 'error': str(e), 'extraction_time': 0}
+                
+                if not result['success'] and reported.get(path) == (size, mtime_ns):
+                    logger.info(f"{relative_path} failed again: {result.get('error', '')}")
+                    summary.add_retry()
+                    _watch_retry_later(retries, path, poll_interval)
+                    continue
+                if writer is not None:
+                    writer.submit(result)
+                    result.pop('table_rows', None)
+                    if result['success'] and not result.get('output_file'):
+                        result['output_file'] = writer.path
+                summary.add(result)
+                if result['success']:
+                    retries.pop(path, None)
+                    reported.pop(path, None)
+                    manifest.record(path, size, mtime_ns, content_hash,
+                                    {key: result.get(key) for key in ('success', 'method', 'fields_found',
+                                                                      'output_file', 'error', 'extraction_time')})
+                else:
+                    reported[path] = (size, mtime_ns)
+                    _watch_retry_later(retries, path, poll_interval)
+            
+            if broken:
+                # Every file still on the crashed pool failed with it; they are queued again on the next poll
+                logger.error(f"Worker pool crashed, restarting it; "
+                             f"{len(in_flight)} other files on it are queued again")
+                for path, relative_path, size, mtime_ns, content_hash, cost in in_flight.values():
+                    governor.release(cost)
+                    _watch_retry_later(retries, path, poll_interval)
+                in_flight.clear()
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = create_executor(executor_type, max_workers)
+    finally:
+        executor.shutdown(wait=True)
+    
+    logger.info("Stopped watching")
+
+# --- Shared job ledger for multi-host batch runs ---
+LEDGER_LEASE_SECONDS = 300
+LEDGER_MAX_ATTEMPTS = 3
+
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    relative_path TEXT PRIMARY KEY,
+    state TEXT NOT NULL DEFAULT 'pending',  -- pending, leased, done or quarantined
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, attempts);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+class JobLedger:
+    """SQLite job ledger through which several runners, on one or more hosts, drain one batch.
+    
+    Jobs are keyed by their path relative to the input folder, so hosts may mount
+    the shared folder at different paths. A runner leases jobs before processing
+    them and renews its leases with heartbeat() while it lives; the leases of a
+    crashed or disconnected runner expire after `lease_seconds` and the jobs are
+    handed out again. Every lease counts as an attempt: a job whose worker raised
+    goes back to pending until it has used `max_attempts`, and is then quarantined,
+    as is a job whose lease ran out on its last attempt. Finished results are stored
+    in the ledger, so any runner can build the summary of the whole batch.
+    
+    The database uses SQLite's default rollback journal (WAL needs shared memory,
+    which network filesystems do not provide); the shared filesystem must support
+    POSIX locks. Each thread gets its own connection.
+    """
+    
+    def __init__(self, path: str, lease_seconds: float = LEDGER_LEASE_SECONDS,
+                 max_attempts: int = LEDGER_MAX_ATTEMPTS, owner: Optional[str] = None):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript(LEDGER_SCHEMA)
+    
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # Transactions are managed explicitly; waits up to a minute for other runners' locks
+            db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._local.db = db
+        return db
+    
+    @contextlib.contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
     
-    # Process PDFs with parallel processing
-    results = process_pdfs_parallel(input_folder, output_folder, max_workers=4)
+    def close(self):
+        """Close the calling thread's connection."""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+    
+    def add(self, relative_paths: Iterable[str]) -> int:
+        """Add jobs for files not in the ledger yet; returns how many were new."""
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO jobs (relative_path, updated) VALUES (?, ?)",
+                           ((relative_path, time.time()) for relative_path in relative_paths))
+            added = db.total_changes - before
+            if added:
+                # The batch grew, so its summary has to be written again
+                db.execute("DELETE FROM meta WHERE key = 'summary_owner'")
+        return added
+    
+    @property
+    def discovered(self) -> bool:
+        """Whether a runner has walked the whole input tree into the ledger."""
+        return self._connect().execute("SELECT 1 FROM meta WHERE key = 'discovered'").fetchone() is not None
+    
+    def mark_discovered(self):
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('discovered', ?)", (self.owner,))
+    
+    def claim(self, limit: int, retries: bool = False) -> List[Dict]:
+        """Lease up to `limit` jobs: first attempts, or with `retries` jobs that failed or whose lease expired.
+        
+        Returns dicts with 'relative_path' and 'attempt' (1 for a first attempt).
+        """
+        now = time.time()
+        with self._transaction() as db:
+            # A lease that ran out on the last attempt: the file keeps taking its runner down
+            db.execute("UPDATE jobs SET state = 'quarantined', owner = NULL, lease_expires = NULL, updated = ?, "
+                       "error = COALESCE(error, 'Lease expired (runner crashed or stalled)') "
+                       "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                       (now, now, self.max_attempts))
+            rows = db.execute("SELECT relative_path, attempts FROM jobs "
+                              "WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) "
+                              "AND (attempts > 0) = ? ORDER BY rowid LIMIT ?",
+                              (now, bool(retries), limit)).fetchall()
+            db.executemany("UPDATE jobs SET state = 'leased', owner = ?, lease_expires = ?, "
+                           "attempts = attempts + 1, updated = ? WHERE relative_path = ?",
+                           [(self.owner, now + self.lease_seconds, now, relative_path)
+                            for relative_path, _ in rows])
+        return [{'relative_path': relative_path, 'attempt': attempts + 1} for relative_path, attempts in rows]
+    
+    def heartbeat(self) -> int:
+        """Extend all of this runner's leases; returns how many it holds."""
+        now = time.time()
+        with self._transaction() as db:
+            return db.execute("UPDATE jobs SET lease_expires = ? WHERE owner = ? AND state = 'leased'",
+                              (now + self.lease_seconds, self.owner)).rowcount
+    
+    def complete(self, relative_path: str, result: Dict) -> bool:
+        """Store a job's result; False if the lease was lost to another runner meanwhile."""
+        with self._transaction() as db:
+            return db.execute("UPDATE jobs SET state = 'done', owner = NULL, lease_expires = NULL, "
+                              "result = ?, error = ?, updated = ? "
+                              "WHERE relative_path = ? AND owner = ? AND state = 'leased'",
+                              (json.dumps(result, default=str), result.get('error'), time.time(),
+                               relative_path, self.owner)).rowcount == 1
+    
+    def fail(self, relative_path: str, error: str) -> Optional[str]:
+        """Record a failed attempt; returns the job's new state ('pending' or 'quarantined'), None if the lease was lost."""
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts FROM jobs WHERE relative_path = ? AND owner = ? AND state = 'leased'",
+                             (relative_path, self.owner)).fetchone()
+            if row is None:
+                return None
+            state = 'quarantined' if row[0] >= self.max_attempts else 'pending'
+            db.execute("UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, error = ?, updated = ? "
+                       "WHERE relative_path = ?", (state, error, time.time(), relative_path))
+        return state
+    
+    def release(self) -> int:
+        """Hand this runner's leases back without counting the attempts (e.g. on Ctrl+C)."""
+        with self._transaction() as db:
+            return db.execute("UPDATE jobs SET state = 'pending', attempts = attempts - 1, owner = NULL, "
+                              "lease_expires = NULL, updated = ? WHERE owner = ? AND state = 'leased'",
+                              (time.time(), self.owner)).rowcount
+    
+    def recover(self) -> int:
+        """Expire at once the leases of dead runners on this host (e.g. after a crash and restart)."""
+        host = socket.gethostname()
+        if os.name != 'posix':
+            return 0  # no cheap liveness check; the leases expire on their own
+        with self._transaction() as db:
+            dead = []
+            prefix = f"{host}:"
+            for (owner,) in db.execute("SELECT DISTINCT owner FROM jobs "
+                                       "WHERE state = 'leased' AND substr(owner, 1, ?) = ?",
+                                       (len(prefix), prefix)).fetchall():
+                # Custom owners (not '<host>:<pid>') cannot be checked; their leases expire on their own
+                if not owner[len(prefix):].isdecimal():
+                    continue
+                pid = int(owner[len(prefix):])
+                try:
+                    os.kill(pid, 0)
+                except ProcessLookupError:
+                    dead.append(owner)
+                except PermissionError:
+                    pass  # alive, owned by another user
+            expired = 0
+            for owner in dead:
+                expired += db.execute("UPDATE jobs SET lease_expires = 0 WHERE owner = ? AND state = 'leased'",
+                                      (owner,)).rowcount
+        return expired
+    
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per state."""
+        return dict(self._connect().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+    
+    def drained(self) -> bool:
+        """Whether the whole batch is discovered and every job is done or quarantined."""
+        counts = self.counts()
+        return self.discovered and not counts.get('pending') and not counts.get('leased')
+    
+    def claim_summary(self) -> bool:
+        """True for the one runner that should write the summary of the (drained) batch."""
+        with self._transaction() as db:
+            return db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('summary_owner', ?)",
+                              (self.owner,)).rowcount == 1
+    
+    def results(self) -> Iterator[Dict]:
+        """Results of all finished jobs, from every runner; quarantined files as failed results."""
+        rows = self._connect().execute("SELECT relative_path, state, attempts, result, error FROM jobs "
+                                       "WHERE state IN ('done', 'quarantined') ORDER BY rowid")
+        for relative_path, state, attempts, result, error in rows:
+            if state == 'done':
+                yield json.loads(result)
+            else:
+                yield {
+                    'filename': relative_path.rsplit('/', 1)[-1],
+                    'relative_path': relative_path,
+                    'success': False,
+                    'error': f"Quarantined after {attempts} attempts: {error}",
+                    'extraction_time': 0,
+                }
+
+def _discover_into_ledger(ledger: JobLedger, input_folder: str, include: Optional[List[str]],
+                          exclude: Optional[List[str]], recursive: bool):
+    """Walk the input tree into the ledger, in batches so runners can start on the first files."""
+    try:
+        relative_paths = (relative_path for _, relative_path
+                          in discover_pdf_files(input_folder, include=include, exclude=exclude, recursive=recursive))
+        added = 0
+        for batch in iter(lambda: list(itertools.islice(relative_paths, 500)), []):
+            added += ledger.add(batch)
+        ledger.mark_discovered()
+        logger.info(f"Discovery finished, {added} new files added to the job ledger")
+    except Exception as e:
+        logger.error(f"Discovery into the job ledger failed: {e}")
+    finally:
+        ledger.close()
+
+def _ledger_heartbeat(ledger: JobLedger, stop_event: threading.Event):
+    """Renew this runner's leases three times per lease period until `stop_event` is set."""
+    while not stop_event.wait(ledger.lease_seconds / 3):
+        try:
+            ledger.heartbeat()
+        except sqlite3.Error as e:
+            logger.warning(f"Job ledger heartbeat failed: {e}")
+    ledger.close()
+
+def process_ledger(ledger: JobLedger, input_folder: str, output_folder: str = 'Output',
+                   max_workers: Optional[int] = None, executor_type: str = 'thread',
+                   writer: Optional[ResultWriter] = None, memory_budget: Optional[int] = None,
+                   include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+                   recursive: bool = True, poll_interval: float = 5.0, **options) -> List[Dict]:
+    """Drain a shared JobLedger together with any other runners using it.
+    
+    Until some runner has walked the whole input tree, this runner walks it too
+    (see discover_pdf_files), adding the files it finds to the ledger while the
+    pool runs. Jobs are leased one per free worker, within `memory_budget` as in
+    process_pdfs_parallel(). Retries, including jobs left behind by a crashed
+    runner, are run alone once no first attempts are left, so a file that crashes
+    its worker process does not take other files down with it; a broken process
+    pool is replaced. The runner keeps polling while other runners hold leases, and
+    returns the merged results of the whole batch once it is drained. Only results
+    processed here are handed to `writer`. Extra keyword options are passed on to
+    process_single_pdf().
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    if writer is not None:
+        options.setdefault('write_files', False)
+        options.setdefault('include_table', writer.include_tables)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    governor = MemoryGovernor(memory_budget)
+    
+    recovered = ledger.recover()
+    if recovered:
+        logger.info(f"Released {recovered} leases of crashed runners on this host")
+    discovery = None
+    if not ledger.discovered:
+        discovery = threading.Thread(target=_discover_into_ledger, name='LedgerDiscovery',
+                                     args=(ledger, input_folder, include, exclude, recursive), daemon=True)
+        discovery.start()
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(target=_ledger_heartbeat, name='LedgerHeartbeat',
+                                 args=(ledger, stop_heartbeat), daemon=True)
+    heartbeat.start()
+    
+    logger.info(f"Runner {ledger.owner} working on {ledger.path} "
+                f"({executor_type} pool, {max_workers} workers, jobs: {ledger.counts()})")
+    processed = 0
+    claimed = []  # leased, waiting for a worker or for memory
+    in_flight = {}  # future -> (job, estimated cost)
+    executor = create_executor(executor_type, max_workers)
+    try:
+        while True:
+            # Fill free workers; a retry runs alone
+            isolated = any(job['attempt'] > 1 for job, _ in in_flight.values())
+            while not isolated and len(in_flight) < max_workers:
+                if not claimed:
+                    claimed = ledger.claim(max_workers - len(in_flight))
+                    if not claimed and not in_flight:
+                        claimed = ledger.claim(1, retries=True)
+                    if not claimed:
+                        break
+                job = claimed[0]
+                pdf_path = os.path.join(input_folder, *job['relative_path'].split('/'))
+                cost = governor.estimate(pdf_path)
+                if not governor.try_acquire(cost, busy=bool(in_flight)):
+                    break
+                claimed.pop(0)
+                future = executor.submit(process_single_pdf, pdf_path, output_folder,
+                                         relative_path=job['relative_path'], **options)
+                in_flight[future] = (job, cost)
+                isolated = job['attempt'] > 1
+                if isolated:
+                    logger.info(f"Retrying {job['relative_path']} alone (attempt {job['attempt']})")
+            
+            if not in_flight:
+                if ledger.drained():
+                    break
+                if discovery is not None and not discovery.is_alive() and not ledger.discovered:
+                    raise RuntimeError("Discovery into the job ledger failed, see the log")
+                # Discovery is still running or other runners hold leases that may expire
+                time.sleep(poll_interval)
+                continue
+            
+            done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                job, cost = in_flight.pop(future)
+                governor.release(cost)
+                relative_path = job['relative_path']
+                try:
+                    result = future.result()
+                except Exception as e:
+                    broken = broken or isinstance(e, BrokenExecutor)
+                    state = ledger.fail(relative_path, str(e))
+                    logger.error(f"Error processing {relative_path} (attempt {job['attempt']}): {e}"
+                                 f"{', quarantined' if state == 'quarantined' else ''}")
+                    continue
+                
+                record = {key: value for key, value in result.items() if key != 'table_rows'}
+                if not ledger.complete(relative_path, record):
+                    logger.warning(f"Lease on {relative_path} was lost to another runner, result discarded")
+                    continue
+                if writer is not None:
+                    writer.submit(result)
+                processed += 1
+                logger.info(f"Completed {relative_path} ({processed} by this runner)")
+            
+            if broken:
+                # Every document still on the crashed pool failed with it
+                for future, (job, cost) in list(in_flight.items()):
+                    governor.release(cost)
+                    ledger.fail(job['relative_path'], "Worker pool crashed")
+                in_flight.clear()
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = create_executor(executor_type, max_workers)
+    finally:
+        executor.shutdown(wait=not in_flight, cancel_futures=True)
+        stop_heartbeat.set()
+        heartbeat.join()
+        released = ledger.release()
+        if released:
+            logger.info(f"Handed {released} unfinished jobs back to the job ledger")
+    
+    results = list(ledger.results())
+    logger.info(f"Job ledger drained: {processed} files processed by this runner, "
+                f"{len(results)} in the batch ({ledger.counts()})")
+    return results
+
+# --- Local HTTP extraction service ---
+SERVICE_MAX_BODY_BYTES = 64 * 2 ** 20
+SERVICE_MAX_HEADERS = 100
+# Extract requests whose latency is kept for the /metrics quantiles
+SERVICE_LATENCY_WINDOW = 1000
+# Result keys returned by POST /extract
+SERVICE_RESULT_KEYS = ['filename', 'success', 'method', 'fields', 'fields_found', 'total_fields',
+                       'camelot_strategy', 'table_pages', 'cache_hit', 'error', 'extraction_time',
+                       'peak_rss_mb', 'timings']
+
+class HTTPRequestError(Exception):
+    """A request the service cannot read; answered with `status` and the connection closed."""
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+async def read_http_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                            max_body: int = SERVICE_MAX_BODY_BYTES) -> Optional[Dict]:
+    """Read one HTTP/1.x request with a Content-Length body; None once the client has closed.
+    
+    Returns a dict with 'method', 'path', 'query' (first value per name),
+    'version', 'headers' (lower-case names) and 'body'. Clients that send
+    `Expect: 100-continue` (curl does for large uploads) are told to go ahead.
+    """
+    try:
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise HTTPRequestError(400, "Malformed request line")
+        method, target, version = parts
+        
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= SERVICE_MAX_HEADERS:
+                raise HTTPRequestError(431, "Too many headers")
+            name, sep, value = line.decode('latin-1').partition(':')
+            if not sep:
+                raise HTTPRequestError(400, "Malformed header line")
+            headers[name.strip().lower()] = value.strip()
+    except ValueError:  # a line longer than the stream limit
+        raise HTTPRequestError(431, "Request line or header too long")
+    
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise HTTPRequestError(411, "Chunked uploads are not supported, send a Content-Length")
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPRequestError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HTTPRequestError(400, "Invalid Content-Length")
+    if length > max_body:
+        raise HTTPRequestError(413, f"Body larger than {max_body} bytes")
+    if length and headers.get('expect', '').lower() == '100-continue':
+        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        await writer.drain()
+    body = await reader.readexactly(length) if length else b''
+    
+    url = urllib.parse.urlsplit(target)
+    return {
+        'method': method.upper(),
+        'path': url.path,
+        'query': dict(urllib.parse.parse_qsl(url.query)),
+        'version': version,
+        'headers': headers,
+        'body': body,
+    }
+
+def http_response(status: int, payload, keep_alive: bool = True) -> bytes:
+    """Encode a response: dict payloads as JSON, strings as Prometheus-style plain text."""
+    if isinstance(payload, str):
+        body = payload.encode('utf-8')
+        content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    else:
+        body = json.dumps(payload, default=str).encode('utf-8')
+        content_type = 'application/json'
+    head = [
+        f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == 503:
+        head.append("Retry-After: 1")
+    return ("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body
+
+def _warm_up_worker() -> int:
+    """No-op task that makes the pool start a worker (running its initializer) before the first request."""
+    _import_extraction_libraries()
+    return os.getpid()
+
+def _extract_document(pdf_bytes: bytes, filename: str, output_folder: str, options: Dict) -> Dict:
+    """Worker side of ExtractionService: run process_single_pdf over uploaded PDF bytes."""
+    with tempfile.TemporaryDirectory(prefix='pdfxtract-upload-') as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, filename)
+        with open(pdf_path, 'wb') as f:
+            f.write(pdf_bytes)
+        return process_single_pdf(pdf_path, output_folder, **options)
+
+class ExtractionService:
+    """Local HTTP service that extracts FIELDS from uploaded PDFs on a pool of warm workers.
+    
+    Endpoints:
+    - POST /extract: the PDF bytes as the request body (optionally `?filename=`
+      and `?deadline=` seconds); returns the fields and extraction details as JSON,
+      with status 200, or 422 if no fields could be extracted
+    - GET /health: pool and queue state as JSON
+    - GET /metrics: request counters, queue gauges and latency quantiles in the
+      Prometheus text format
+    
+    Every worker is started, and has imported Camelot, before the service accepts
+    connections. At most `max_workers` documents run at once and up to `max_queue`
+    more wait for a worker; further requests get 503. A request not answered within
+    its deadline gets 504; a document that was already running finishes in the
+    background and holds its worker until then. If a worker dies, the pool is
+    rebuilt and warmed up again, and the documents it was running are retried once
+    on the new pool; a document that breaks the new pool too gets 503. `port=0` binds a free port, which
+    start() stores in `port`. Extra keyword options are passed on to
+    process_single_pdf(); per-file workbooks are never written.
+    """
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, max_workers: Optional[int] = None,
+                 executor_type: str = 'process', max_queue: Optional[int] = None, deadline: float = 30.0,
+                 output_folder: str = 'Output', **options):
+        self.host = host
+        self.port = port
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor_type = executor_type
+        self.max_queue = self.max_workers * 4 if max_queue is None else max_queue
+        self.deadline = deadline
+        self.output_folder = output_folder
+        self.options = dict(options, write_files=False, include_table=False)
+        self.executor = None
+        self.started = None
+        self.in_flight = 0  # documents on a worker, including ones whose request timed out
+        self.queued = 0  # requests waiting for a worker
+        self.responses = {}  # (path, status) -> count
+        self.latencies = collections.deque(maxlen=SERVICE_LATENCY_WINDOW)
+        self.pool_restarts = 0
+        self._slots = None
+        self._pool_lock = None
+        self._server = None
+    
+    async def start(self):
+        """Start and warm up the worker pool, then begin accepting connections."""
+        os.makedirs(self.output_folder, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        warm_start = time.time()
+        self.executor = await self._warm_pool()
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self._pool_lock = asyncio.Lock()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.started = time.time()
+        logger.info(f"Serving on http://{self.host}:{self.port} ({self.executor_type} pool, "
+                    f"{self.max_workers} workers ready in {self.started - warm_start:.1f}s)")
+    
+    async def _warm_pool(self):
+        executor = create_executor(self.executor_type, self.max_workers)
+        # Submitting one task per worker starts all of them up front
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(executor, _warm_up_worker) for _ in range(self.max_workers)))
+        return executor
+    
+    async def _restart_pool(self, broken):
+        """Replace a broken pool with a warm one, once however many requests saw it break."""
+        async with self._pool_lock:
+            if self.executor is not broken:
+                return  # another request has already replaced it
+            broken.shutdown(wait=False)
+            restart_start = time.time()
+            self.executor = await self._warm_pool()
+            self.pool_restarts += 1
+            logger.info(f"Worker pool restarted in {time.time() - restart_start:.1f}s")
+    
+    async def stop(self):
+        """Stop accepting connections and shut the worker pool down."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self.executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        logger.info("Service stopped")
+    
+    async def serve(self, stop_event: Optional[asyncio.Event] = None):
+        """Run until `stop_event` is set, SIGTERM is received or the task is cancelled."""
+        stop_event = stop_event or asyncio.Event()
+        # Only possible from the main thread, and not on Windows
+        with contextlib.suppress(NotImplementedError, RuntimeError, ValueError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_event.set)
+        await self.start()
+        try:
+            await stop_event.wait()
+        finally:
+            await self.stop()
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await read_http_request(reader, writer)
+                except HTTPRequestError as e:
+                    self._count('-', e.status)
+                    writer.write(http_response(e.status, {'error': str(e)}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                
+                status, payload = await self._dispatch(request)
+                keep_alive = (request['version'] == 'HTTP/1.1'
+                              and request['headers'].get('connection', '').lower() != 'close')
+                writer.write(http_response(status, payload, keep_alive=keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # client went away
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+    
+    async def _dispatch(self, request: Dict) -> Tuple[int, any]:
+        path, method = request['path'], request['method']
+        if path == '/extract':
+            if method != 'POST':
+                status, payload = 405, {'error': "Use POST with the PDF as the request body"}
+            else:
+                status, payload = await self._extract(request)
+        elif path in ('/health', '/metrics'):
+            if method != 'GET':
+                status, payload = 405, {'error': "Use GET"}
+            else:
+                status, payload = 200, self.health() if path == '/health' else self.metrics()
+        else:
+            status, payload = 404, {'error': f"Unknown path {path}"}
+        self._count(path if status != 404 else '-', status)
+        return status, payload
+    
+    def _count(self, path: str, status: int):
+        self.responses[(path, status)] = self.responses.get((path, status), 0) + 1
+    
+    async def _extract(self, request: Dict) -> Tuple[int, Dict]:
+        start_time = time.time()
+        body = request['body']
+        # The header may follow up to 1 KiB of junk, as in PDF readers
+        if b'%PDF-' not in body[:1024]:
+            return 400, {'error': "Request body is not a PDF"}
+        filename = os.path.basename(request['query'].get('filename', '')) or 'upload.pdf'
+        if filename in ('.', '..'):
+            return 400, {'error': "Invalid filename"}
+        try:
+            deadline = float(request['query'].get('deadline', self.deadline))
+        except ValueError:
+            return 400, {'error': "Invalid deadline"}
+        if not math.isfinite(deadline) or deadline <= 0:
+            return 400, {'error': "Invalid deadline"}
+        if self._slots.locked() and self.queued >= self.max_queue:
+            logger.warning(f"Rejected {filename}: {self.queued} requests already waiting")
+            return 503, {'error': "Too many requests waiting, retry later", 'filename': filename}
+        
+        try:
+            result = await asyncio.wait_for(self._run(body, filename), timeout=deadline)
+        except asyncio.TimeoutError:
+            logger.warning(f"{filename}: no result within {deadline:g}s")
+            return 504, {'error': f"No result within {deadline:g}s", 'filename': filename}
+        except BrokenExecutor:
+            logger.error(f"{filename}: worker pool broke twice, giving up")
+            return 503, {'error': "A worker died while processing the document, retry later", 'filename': filename}
+        except Exception as e:
+            logger.error(f"Error processing {filename}: {e}")
+            return 500, {'error': str(e), 'filename': filename}
+        
+        elapsed = time.time() - start_time
+        self.latencies.append(elapsed)
+        logger.info(f"{filename}: {result.get('fields_found', 0)} fields in {elapsed:.2f}s")
+        payload = {key: result.get(key) for key in SERVICE_RESULT_KEYS}
+        return (200 if result['success'] else 422), payload
+    
+    async def _run(self, body: bytes, filename: str) -> Dict:
+        """Wait for a free worker and run the document on it."""
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        task = asyncio.ensure_future(self._run_on_pool(body, filename))
+        # The worker stays busy until the document is done, even if the request times out
+        task.add_done_callback(self._release_worker)
+        return await asyncio.shield(task)
+    
+    async def _run_on_pool(self, body: bytes, filename: str) -> Dict:
+        """Run the document on the pool; if a worker dies, rebuild the pool and retry once."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self.executor
+            try:
+                return await loop.run_in_executor(
+                    executor, _extract_document, body, filename, self.output_folder, self.options)
+            except BrokenExecutor:
+                logger.warning(f"{filename}: worker pool broke, restarting it")
+                # Restart even after the retry, so that the next request finds a working pool
+                await self._restart_pool(executor)
+                if attempt:
+                    raise
+    
+    def _release_worker(self, future: asyncio.Future):
+        self.in_flight -= 1
+        self._slots.release()
+        if not future.cancelled() and future.exception() is not None:
+            logger.debug(f"Worker task failed: {future.exception()}")
+    
+    def health(self) -> Dict:
+        """Pool and queue state."""
+        return {
+            'status': 'ok',
+            'executor': self.executor_type,
+            'workers': self.max_workers,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'pool_restarts': self.pool_restarts,
+            'uptime_s': round(time.time() - self.started, 1),
+        }
+    
+    def metrics(self) -> str:
+        """Request counters, gauges and extract latency quantiles in the Prometheus text format."""
+        lines = [
+            "# HELP pdfxtract_service_requests_total HTTP requests by path and response status.",
+            "# TYPE pdfxtract_service_requests_total counter",
+        ]
+        for (path, status), count in sorted(self.responses.items()):
+            lines.append(f'pdfxtract_service_requests_total{{path="{path}",status="{status}"}} {count}')
+        for name, help_text, value in [
+            ('workers', "Worker pool size.", self.max_workers),
+            ('in_flight', "Documents running on a worker.", self.in_flight),
+            ('queued', "Requests waiting for a worker.", self.queued),
+        ]:
+            lines += [f"# HELP pdfxtract_service_{name} {help_text}", f"# TYPE pdfxtract_service_{name} gauge",
+                      f"pdfxtract_service_{name} {value}"]
+        lines += ["# HELP pdfxtract_service_pool_restarts_total Worker pools rebuilt after a worker died.",
+                  "# TYPE pdfxtract_service_pool_restarts_total counter",
+                  f"pdfxtract_service_pool_restarts_total {self.pool_restarts}"]
+        
+        lines += [
+            f"# HELP pdfxtract_service_extract_seconds Latency of the last {SERVICE_LATENCY_WINDOW} answered extract requests.",
+            "# TYPE pdfxtract_service_extract_seconds summary",
+        ]
+        latencies = list(self.latencies)
+        if latencies:
+            cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 \
+                else latencies * 99
+            for q in TIMING_QUANTILES:
+                lines.append(f'pdfxtract_service_extract_seconds{{quantile="{q}"}} {cuts[round(q * 100) - 1]:.6f}')
+        lines.append(f"pdfxtract_service_extract_seconds_sum {sum(latencies):.6f}")
+        lines.append(f"pdfxtract_service_extract_seconds_count {len(latencies)}")
+        return "\n".join(lines) + "\n"
+
+SINK_NAMES = ['excel', 'parquet', 'jsonl', 'files']
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='pdf_extractor.py',
+        description='Extract control valve datasheet fields from PDF files into Excel and other formats.')
+    parser.add_argument('input', nargs='?', default='Input',
+                        help='PDF file or folder of PDFs (default: Input)')
+    parser.add_argument('-o', '--output', default='Output', help='output folder (default: Output)')
+    parser.add_argument('--include', action='append', default=None, metavar='GLOB',
+                        help='only process PDFs whose relative path or name matches (repeatable)')
+    parser.add_argument('--exclude', action='append', default=None, metavar='GLOB',
+                        help='skip PDFs and folders whose relative path or name matches (repeatable)')
+    parser.add_argument('--no-recursive', action='store_true', help='do not descend into subfolders')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of parallel workers (default: one per CPU core)')
+    parser.add_argument('--executor', choices=['process', 'thread'], default='process',
+                        help='worker pool backend (default: process)')
+    parser.add_argument('--memory-budget', type=int, default=None, metavar='MB',
+                        help='estimated memory allowed for in-flight files (default: half of available memory)')
+    parser.add_argument('--sinks', default=None,
+                        help='comma-separated outputs: excel, parquet, jsonl, files (per-file workbooks); '
+                             'default: excel plus parquet when pyarrow is installed, jsonl in watch mode')
+    parser.add_argument('--include-tables', action='store_true',
+                        help='also write each document\'s Camelot table to the sinks')
+    parser.add_argument('--watch', action='store_true', help='keep running and process new or changed PDFs')
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                        help='seconds between folder scans in watch mode, and between ledger polls (default: 5)')
+    parser.add_argument('--ledger', nargs='?', const='', default=None, metavar='PATH',
+                        help='share the batch with other runners through a job ledger on the shared '
+                             'filesystem (default PATH: OUTPUT/.ledger.sqlite)')
+    parser.add_argument('--lease', type=float, default=LEDGER_LEASE_SECONDS, metavar='SECONDS',
+                        help=f'job lease renewed by heartbeats; a crashed runner\'s jobs are handed out again '
+                             f'after it expires (default: {LEDGER_LEASE_SECONDS})')
+    parser.add_argument('--max-attempts', type=int, default=LEDGER_MAX_ATTEMPTS,
+                        help=f'attempts before a file is quarantined (default: {LEDGER_MAX_ATTEMPTS})')
+    parser.add_argument('--serve', action='store_true',
+                        help='run the local HTTP extraction service instead of processing INPUT')
+    parser.add_argument('--host', default='127.0.0.1', help='address the service listens on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='service port, 0 for any free port (default: 8765)')
+    parser.add_argument('--max-queue', type=int, default=None,
+                        help='requests allowed to wait for a worker before answering 503 (default: 4 per worker)')
+    parser.add_argument('--deadline', type=float, default=30.0,
+                        help='seconds before an extract request is answered with 504 (default: 30)')
+    parser.add_argument('--schema', default=None,
+                        help='field schema JSON file (default: field_schema.json next to this script)')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the artifact cache')
+    parser.add_argument('--no-templates', action='store_true', help='do not use or learn template layouts')
+    parser.add_argument('--rematch-only', action='store_true',
+                        help='only re-run field matching over cached artifacts')
+    parser.add_argument('--profile-budget', type=float, default=None,
+                        help='profile files that take longer than this many seconds')
+    parser.add_argument('--diagnostics', action='store_true',
+                        help='write a JSON diagnostics trace for every file to OUTPUT/.diagnostics')
+    parser.add_argument('--diagnostics-include', action='append', default=None, metavar='GLOB',
+                        help='write diagnostics traces for files whose relative path or name matches (repeatable)')
+    parser.add_argument('--diagnostics-sample', type=float, default=0.0, metavar='PERCENT',
+                        help='write diagnostics traces for a random sample of files')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='logging level (default: INFO)')
+    return parser
+
+def create_sinks(names: List[str], output_folder: str, include_tables: bool = False,
+                 run_id: Optional[str] = None, schema: Optional[FieldSchema] = None) -> List:
+    """Output sinks for the --sinks names ('files' is handled by the workers, not a sink).
+    
+    A `run_id` also names the workbook, so runners sharing an output folder do not
+    write the same file. The sinks write the fields of the run's `schema`.
+    """
+    sinks = []
+    if 'excel' in names:
+        workbook = f"extraction_results-{run_id}.xlsx" if run_id else 'extraction_results.xlsx'
+        sinks.append(ExcelSink(os.path.join(output_folder, workbook), include_tables=include_tables, schema=schema))
+    if 'parquet' in names:
+        sinks.append(ParquetSink(os.path.join(output_folder, 'parquet'), run_id=run_id, include_tables=include_tables,
+                                 schema=schema))
+    if 'jsonl' in names:
+        sinks.append(JsonlSink(os.path.join(output_folder, 'jsonl'), run_id=run_id, include_tables=include_tables,
+                               schema=schema))
+    return sinks
+
+def main(argv: Optional[List[str]] = None):
+    args = build_arg_parser().parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+    input_path = args.input
+    output_folder = args.output
+    
+    if not args.serve and not os.path.exists(input_path):
+        logger.error(f"Error: {input_path} not found!")
+        return 1
+    
+    if args.sinks is None:
+        sink_names = ['jsonl'] if args.watch else ['excel'] + (['parquet'] if pyarrow_available else [])
+    else:
+        sink_names = [name.strip() for name in args.sinks.split(',') if name.strip()]
+        unknown = [name for name in sink_names if name not in SINK_NAMES]
+        if unknown:
+            logger.error(f"Unknown sinks: {', '.join(unknown)} (expected {', '.join(SINK_NAMES)})")
+            return 2
+    
+    options = {'rematch_only': args.rematch_only, 'profile_budget': args.profile_budget}
+    if args.schema:
+        options['schema'] = load_field_schema(args.schema)
+    if args.diagnostics or args.diagnostics_include or args.diagnostics_sample > 0:
+        options['diagnostics'] = Diagnostics(all_files=args.diagnostics, include=args.diagnostics_include,
+                                             sample_percent=args.diagnostics_sample)
+    if not args.no_cache:
+        # Cache parsed tables/texts so field-rule changes can be re-matched without re-parsing
+        options['artifact_store'] = ArtifactStore(os.path.join(output_folder, '.artifacts'))
+    if not args.no_templates:
+        # Learned template layouts let known datasheets skip Camelot entirely
+        options['template_store'] = TemplateStore(os.path.join(output_folder, '.templates.json'))
+    if 'files' in sink_names:
+        options['write_files'] = True
+    
+    if args.serve:
+        # Answers go back to the client; no sinks or per-file workbooks are written
+        service = ExtractionService(host=args.host, port=args.port, max_workers=args.workers,
+                                    executor_type=args.executor, max_queue=args.max_queue,
+                                    deadline=args.deadline, output_folder=output_folder, **options)
+        try:
+            asyncio.run(service.serve())
+        except KeyboardInterrupt:
+            logger.info("Interrupted, stopping the service")
+        return 0
+    
+    ledger = None
+    run_id = None
+    if args.ledger is not None:
+        if not os.path.isdir(input_path):
+            logger.error("--ledger needs an input folder")
+            return 2
+        ledger = JobLedger(args.ledger or os.path.join(output_folder, '.ledger.sqlite'),
+                           lease_seconds=args.lease, max_attempts=args.max_attempts)
+        # Each runner writes its own partition (and workbook) of the shared outputs
+        run_id = f"{default_run_id()}-{re.sub(r'[^A-Za-z0-9.-]', '-', ledger.owner)}"
+    
+    # All fields are streamed into the consolidated outputs by a single writer
+    sinks = create_sinks(sink_names, output_folder, include_tables=args.include_tables, run_id=run_id,
+                         schema=options.get('schema'))
+    writer = ResultWriter(sinks) if sinks else None
+    
+    memory_budget = args.memory_budget * 2 ** 20 if args.memory_budget else None
+    discovery = {'include': args.include, 'exclude': args.exclude, 'recursive': not args.no_recursive}
+    with (writer or contextlib.nullcontext()):
+        if args.watch:
+            try:
+                watch_folder(input_path, output_folder, poll_interval=args.poll_interval,
+                             max_workers=args.workers, executor_type=args.executor, writer=writer,
+                             memory_budget=memory_budget, **discovery, **options)
+            except KeyboardInterrupt:
+                logger.info("Interrupted, stopping watch mode")
+            return 0
+        
+        if ledger is not None:
+            results = process_ledger(ledger, input_path, output_folder, max_workers=args.workers,
+                                     executor_type=args.executor, writer=writer, memory_budget=memory_budget,
+                                     poll_interval=args.poll_interval, **discovery, **options)
+        elif os.path.isfile(input_path):
+            # A single file runs in this process; no pool to start
+            os.makedirs(output_folder, exist_ok=True)
+            if writer is not None:
+                options.setdefault('write_files', False)
+                options['include_table'] = writer.include_tables
+            result = process_single_pdf(input_path, output_folder, **options)
+            if writer is not None:
+                writer.submit(result)
+            results = [result]
+        else:
+            # Process PDFs with parallel processing, one warm worker process per core
+            results = process_pdfs_parallel(input_path, output_folder, max_workers=args.workers,
+                                            executor_type=args.executor, writer=writer,
+                                            memory_budget=memory_budget, **discovery, **options)
     
-    # Generate summary report
-    generate_summary_report(results, output_folder)
+    # Generate summary report; for a shared batch, one runner writes it for all of them
+    if ledger is None or ledger.claim_summary():
+        generate_summary_report(results, output_folder)
+    return 0 if all(r['success'] for r in results) else 1
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())